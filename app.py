@@ -5,33 +5,108 @@ This module provides the application factory pattern for creating Flask app inst
 Routes are organized in separate blueprint modules in the routes package.
 """
 
-from flask import Flask
-from database import init_database, add_sample_data
-from routes import register_blueprints
+import argparse
+import os
+from flask import Flask, g
+import database
+from database import init_database, add_sample_data, get_pool, build_catalog_index
+from instrumentation import begin_startup, install_request_instrumentation, startup_phase
 
+# Skip schema setup and sample data in create_app (run manage.py init-db once instead)
+SKIP_BOOTSTRAP = os.environ.get('LIBRARY_SKIP_BOOTSTRAP', '0').lower() in ('1', 'true', 'yes')
 
-def create_app():
+
+def create_app(catalog_index=None, bootstrap=None):
     """
     Application factory function to create and configure Flask app.
     
+    Startup runs in timed phases (see /metrics/startup): database setup,
+    sample data, catalog index, then importing and registering the routes.
+    
+    Args:
+        catalog_index: Build the in-memory catalog index (default: LIBRARY_CATALOG_INDEX)
+        bootstrap: Create the schema and sample data (default: unless LIBRARY_SKIP_BOOTSTRAP);
+            the production launcher does this once before starting workers (see wsgi.py)
+    
     Returns:
         Flask: Configured Flask application instance
     """
+    begin_startup()
     app = Flask(__name__)
     app.secret_key = "super secret key"
     
-    # Initialize the database
-    init_database()
+    if bootstrap is None:
+        bootstrap = not SKIP_BOOTSTRAP
+    if bootstrap:
+        # Initialize the database
+        with startup_phase('init_database'):
+            init_database()
+        
+        # Add sample data for testing and demonstration
+        with startup_phase('sample_data'):
+            add_sample_data()
+    
+    if database.CATALOG_INDEX if catalog_index is None else catalog_index:
+        with startup_phase('catalog_index'):
+            build_catalog_index()
     
-    # Add sample data for testing and demonstration
-    add_sample_data()
+    # Trace every request (registered first so the trace covers the connection checkout)
+    install_request_instrumentation(app)
     
-    # Register all route blueprints
-    register_blueprints(app)
+    # Hold one pooled read connection per request so every read helper reuses it;
+    # writes check out a write connection only for the statements that need it
+    @app.before_request
+    def checkout_db_connection():
+        pool = get_pool(readonly=True)
+        pool.acquire()
+        g.db_pool = pool
+
+    @app.teardown_appcontext
+    def release_db_connection(exception):
+        pool = g.pop('db_pool', None)
+        if pool is not None:
+            pool.release()
+    
+    # Register all route blueprints; importing them loads the services, so it is done
+    # here rather than when app.py is imported
+    with startup_phase('routes'):
+        from routes import register_blueprints
+        register_blueprints(app)
     
     return app
 
 
+def create_asgi_app(wsgi_app=None):
+    """
+    ASGI application factory for running under an ASGI server (e.g. uvicorn app:create_asgi_app --factory).
+    
+    Search, catalog pages, borrowing, returns, late fee payments and the
+    /api/events stream are served by coroutines (routes/async_routes.py); all
+    other routes are served by the Flask app through asgiref's WsgiToAsgi
+    when asgiref is installed.
+    
+    Args:
+        wsgi_app: Flask app for the remaining routes (default: create_app())
+    
+    Returns:
+        AsyncApiApp: ASGI 3 application
+    """
+    from routes.async_routes import AsyncApiApp
+    
+    if wsgi_app is None:
+        wsgi_app = create_app()
+    try:
+        from asgiref.wsgi import WsgiToAsgi
+    except ImportError:
+        # Without asgiref only the async endpoints are served
+        return AsyncApiApp()
+    return AsyncApiApp(fallback=WsgiToAsgi(wsgi_app))
+
+
 if __name__ == '__main__':
-    app = create_app()
+    parser = argparse.ArgumentParser(description="Run the Flask development server.")
+    parser.add_argument('--skip-bootstrap', action='store_true',
+                        help="Do not create the schema or sample data (run manage.py init-db beforehand)")
+    args = parser.parse_args()
+    app = create_app(bootstrap=False if args.skip_bootstrap else None)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,207 @@
+"""
+Load-test the sync (Flask) and async (ASGI) apps with 1000+ concurrent requests.
+
+In-process mode (default) sends the same mix of searches and late fee
+payments, against a fake gateway with a fixed latency, to the Flask app from
+a bounded pool of server threads (like gunicorn's gthread workers) and to
+the ASGI app from one event loop, all requests in flight at once.
+
+With --url it instead opens --connections keep-alive HTTP/1.1 connections
+to a running server (flask, gunicorn, uvicorn app:create_asgi_app --factory)
+and sends GET --path requests for --seconds.
+
+Usage:
+    python benchmarks/bench_async_load.py --requests 2000 --concurrency 1000 --gateway-latency 0.05
+    python benchmarks/bench_async_load.py --url http://127.0.0.1:8000 --path "/api/search?q=Book" --connections 1000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+def report(label, latencies, errors, seconds):
+    print(f'{label:<22}{len(latencies) / seconds:>10.0f}{percentile(latencies, 50):>10.1f}'
+          f'{percentile(latencies, 99):>10.1f}{errors:>8}')
+
+def workload(count, payment_ratio):
+    """(method, path, JSON body) requests: searches, plus a payment for one overdue loan each."""
+    requests, payments = [], 0
+    for n in range(count):
+        if payments < n * payment_ratio:
+            requests.append(('POST', '/api/late-fees', {'patron_id': f'{400000 + payments}', 'book_id': 1 + payments % 200}))
+            payments += 1
+        else:
+            requests.append(('GET', f'/api/search?q=Book+{n % 200}', None))
+    return requests, payments
+
+def load_library(path, loans):
+    database.DATABASE = path
+    database.init_database()
+    database.insert_books_bulk([(f'Book {n}', f'Author {n % 97}', f'{9780000000000 + n}', 1000, 1000)
+                                for n in range(200)])
+    borrowed = datetime.now() - timedelta(days=30)
+    conn = database.get_db_connection()
+    conn.executemany(
+        'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)',
+        ((f'{400000 + n}', 1 + n % 200, borrowed.isoformat(), (borrowed + timedelta(days=14)).isoformat())
+         for n in range(loans))
+    )
+    conn.commit()
+    conn.close()
+
+def use_fake_gateway(latency, concurrency):
+    from services import gateway_resilience
+    from services.payment_service import FakePaymentGateway
+    gateway_resilience.reset_payment_gateway()
+    gateway_resilience._gateway = gateway_resilience.ResilientPaymentGateway(
+        FakePaymentGateway(latency, max_concurrency=concurrency))
+
+def run_sync(app, requests, threads):
+    """Flask app behind a fixed pool of server threads; excess requests queue for a thread."""
+    def send(request):
+        method, path, body = request
+        began = time.perf_counter()
+        response = app.test_client().open(path, method=method, json=body)
+        return time.perf_counter() - began, response.status_code >= 500
+
+    began = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(send, requests))
+    return [latency for latency, _ in results], sum(error for _, error in results), time.perf_counter() - began
+
+def run_async(app, requests, concurrency):
+    """ASGI app on one event loop with up to concurrency requests in flight."""
+    async def send(request, limit):
+        method, path, body = request
+        path, _, query = path.partition('?')
+        payload = json.dumps(body).encode() if body is not None else b''
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': payload, 'more_body': False}
+
+        async def reply(message):
+            messages.append(message)
+
+        async with limit:
+            began = time.perf_counter()
+            await app({'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(), 'headers': []},
+                      receive, reply)
+            return time.perf_counter() - began, messages[0]['status'] >= 500
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*(send(request, limit) for request in requests))
+
+    began = time.perf_counter()
+    results = asyncio.run(main())
+    return [latency for latency, _ in results], sum(error for _, error in results), time.perf_counter() - began
+
+def run_in_process(args):
+    from app import create_app, create_asgi_app
+    from services.async_service import shutdown_async_service
+
+    # Thread contention makes some statements slow; the table reports latency instead
+    logging.getLogger('library.slow_query').disabled = True
+    requests, payments = workload(args.requests, args.payment_ratio)
+    pool_size = database.POOL_SIZE
+    print(f'{args.requests} requests ({payments} payments), gateway latency {args.gateway_latency * 1000:.0f} ms, '
+          f'{args.concurrency} in flight')
+    print(f'{"mode":<22}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for mode in ('sync', 'async'):
+        with tempfile.TemporaryDirectory() as workdir:
+            load_library(os.path.join(workdir, 'bench_library.db'), payments)
+            use_fake_gateway(args.gateway_latency, args.gateway_concurrency)
+            flask_app = create_app()
+            if mode == 'sync':
+                # Every request holds a read connection for its lifetime, so size the pool to the threads
+                database.POOL_SIZE = args.threads
+                latencies, errors, seconds = run_sync(flask_app, requests, args.threads)
+                report(f'sync ({args.threads} threads)', latencies, errors, seconds)
+            else:
+                latencies, errors, seconds = run_async(create_asgi_app(flask_app), requests, args.concurrency)
+                report('async (1 event loop)', latencies, errors, seconds)
+                shutdown_async_service()
+            database.close_pools()
+            database.POOL_SIZE = pool_size
+
+async def http_client(host, port, path, deadline, latencies, errors):
+    """One keep-alive connection sending GET path until the deadline."""
+    try:
+        reader, writer = await asyncio.open_connection(host, port)
+    except OSError:
+        errors.append(1)
+        return
+    request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n'.encode()
+    try:
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            writer.write(request)
+            headers = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').lower()
+            length = int(headers.split('content-length:', 1)[1].split('\r\n', 1)[0]) if 'content-length:' in headers else 0
+            await reader.readexactly(length)
+            if headers.split(' ', 2)[1].startswith('5'):
+                errors.append(1)
+            latencies.append(time.perf_counter() - began)
+            if 'connection: close' in headers:
+                break
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, IndexError, ValueError):
+        errors.append(1)
+    finally:
+        writer.close()
+
+def run_against_url(args):
+    url = urlsplit(args.url)
+    latencies, errors = [], []
+
+    async def main():
+        deadline = time.perf_counter() + args.seconds
+        await asyncio.gather(*(http_client(url.hostname, url.port or 80, args.path, deadline, latencies, errors)
+                               for _ in range(args.connections)))
+
+    began = time.perf_counter()
+    asyncio.run(main())
+    print(f'{args.connections} connections to {args.url}{args.path} for {args.seconds:.0f}s')
+    print(f'{"mode":<22}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    report('server', latencies, len(errors), time.perf_counter() - began)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1000, help="Requests in flight at once")
+    parser.add_argument('--threads', type=int, default=32, help="Server threads for the sync app")
+    parser.add_argument('--payment-ratio', type=float, default=0.25)
+    parser.add_argument('--gateway-latency', type=float, default=0.05)
+    parser.add_argument('--gateway-concurrency', type=int, default=256, help="Gateway calls allowed in flight")
+    parser.add_argument('--url', help="Load-test a running server instead of the in-process apps")
+    parser.add_argument('--path', default='/api/search?q=Gatsby')
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    if args.url:
+        run_against_url(args)
+    else:
+        run_in_process(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark borrow_records hot queries before and after the index migration.
+
+Builds a throwaway database with a large synthetic borrow history, times the
+patron lookups on the bare table, applies the schema migrations and times them again.
+
+Usage:
+    python benchmarks/bench_borrow_indexes.py --records 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def load_borrow_records(conn, records, patrons, books, chunk=50000):
+    """Insert synthetic books and borrow records in chunked transactions."""
+    conn.executemany(
+        'INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)',
+        ((f'Book {n}', f'Author {n % 997}', f'{9780000000000 + n}', 5, 5) for n in range(books))
+    )
+    conn.commit()
+
+    rng = random.Random(327)
+    start = datetime(2020, 1, 1)
+    inserted = 0
+    while inserted < records:
+        rows = []
+        for _ in range(min(chunk, records - inserted)):
+            borrowed = start + timedelta(minutes=rng.randrange(0, 60 * 24 * 365 * 5))
+            returned = None if rng.random() < 0.05 else (borrowed + timedelta(days=rng.randrange(1, 30))).isoformat()
+            rows.append((
+                f'{100000 + rng.randrange(patrons)}',
+                rng.randrange(1, books + 1),
+                borrowed.isoformat(),
+                (borrowed + timedelta(days=14)).isoformat(),
+                returned,
+            ))
+        conn.executemany(
+            'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.commit()
+        inserted += len(rows)
+
+def count_open_loans(patron_id):
+    """The COUNT(*) that get_patron_borrow_count ran before patron_summary existed."""
+    with database.read_connection() as conn:
+        return conn.execute(
+            'SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL', (patron_id,)
+        ).fetchone()[0]
+
+def time_queries(lookups):
+    """Run each hot query for every (patron, book) pair and return mean milliseconds per call."""
+    timings = {}
+    for name, query in (
+        ('open loans COUNT(*)', lambda p, b: count_open_loans(p)),
+        ('get_patron_borrowed_books', lambda p, b: database.get_patron_borrowed_books(p)),
+        ('get_borrow_record', lambda p, b: database.get_borrow_record(p, b)),
+    ):
+        began = time.perf_counter()
+        for patron_id, book_id in lookups:
+            query(patron_id, book_id)
+        timings[name] = (time.perf_counter() - began) * 1000 / len(lookups)
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--patrons', type=int, default=100000)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+
+        # Start from the pre-migration schema
+        conn = database.get_db_connection()
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'").fetchall():
+            conn.execute(f'DROP INDEX {name}')
+        conn.execute('DROP TABLE payments')
+        conn.execute('DELETE FROM schema_version')
+        conn.commit()
+
+        began = time.perf_counter()
+        load_borrow_records(conn, args.records, args.patrons, args.books)
+        print(f'Loaded {args.records} borrow records in {time.perf_counter() - began:.1f}s')
+
+        rng = random.Random(2660)
+        lookups = [(f'{100000 + rng.randrange(args.patrons)}', rng.randrange(1, args.books + 1)) for _ in range(args.lookups)]
+        before = time_queries(lookups)
+
+        began = time.perf_counter()
+        database.apply_migrations(conn)
+        print(f'Applied migrations in {time.perf_counter() - began:.1f}s (schema version {database.get_schema_version()})')
+        conn.close()
+        after = time_queries(lookups)
+
+        print(f'{"query":<28}{"before (ms)":>14}{"after (ms)":>14}{"speedup":>10}')
+        for name in before:
+            print(f'{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}{before[name] / after[name]:>9.0f}x')
+
+        # The borrow limit check now reads the migrated patron_summary row instead
+        began = time.perf_counter()
+        for patron_id, _ in lookups:
+            database.get_patron_borrow_count(patron_id)
+        summary_ms = (time.perf_counter() - began) * 1000 / len(lookups)
+        print(f'{"get_patron_borrow_count":<28}{before["open loans COUNT(*)"]:>14.3f}{summary_ms:>14.3f}'
+              f'{before["open loans COUNT(*)"] / summary_ms:>9.0f}x  (patron_summary)')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
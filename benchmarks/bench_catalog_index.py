@@ -0,0 +1,76 @@
+"""
+Benchmark catalog reads from SQLite against the in-memory catalog index.
+
+Loads a throwaway catalog, then times book lookups by id and ISBN and
+first-page catalog reads straight from SQLite, from the index as dicts and
+from the index as shared records, and reports the index's memory footprint.
+
+Usage:
+    python benchmarks/bench_catalog_index.py --books 100000 --lookups 50000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=50000)
+    parser.add_argument('--pages', type=int, default=2000, help="First catalog pages of 100 books read per mode")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        database.insert_books_bulk([(f'Book {n}', f'Author {n % 997}', f'{9780000000000 + n}', 5, 5)
+                                    for n in range(args.books)])
+        rng = random.Random(18)
+        ids = [rng.randrange(1, args.books + 1) for _ in range(args.lookups)]
+        isbns = [f'{9780000000000 + book_id - 1}' for book_id in ids]
+
+        tracemalloc.start()
+        began = time.perf_counter()
+        index = database.build_catalog_index()
+        build_seconds = time.perf_counter() - began
+        traced = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        memory = index.memory()
+        print(f'Built index of {memory["books"]:,} books in {build_seconds:.2f}s: '
+              f'{memory["total_bytes"] / 2 ** 20:.1f} MiB estimated ({traced / 2 ** 20:.1f} MiB traced), '
+              f'one dict per row would take {memory["dict_rows_bytes"] / 2 ** 20:.1f} MiB before indexes')
+
+        print(f'{"mode":<18}{"by id/s":>12}{"by isbn/s":>12}{"pages/s":>10}')
+        for label in ('sqlite', 'index (dicts)', 'index (records)'):
+            if label == 'sqlite':
+                database.drop_catalog_index()
+            else:
+                database.build_catalog_index()
+            database.book_cache.clear()
+            with database.read_connection():
+                began = time.perf_counter()
+                for book_id in ids:
+                    database.get_book_by_id(book_id)
+                by_id = len(ids) / (time.perf_counter() - began)
+                began = time.perf_counter()
+                for isbn in isbns:
+                    database.get_book_by_isbn(isbn)
+                by_isbn = len(isbns) / (time.perf_counter() - began)
+                began = time.perf_counter()
+                for _ in range(args.pages):
+                    database.get_books_page(100, records=label == 'index (records)')
+                pages = args.pages / (time.perf_counter() - began)
+            print(f'{label:<18}{by_id:>12,.0f}{by_isbn:>12,.0f}{pages:>10,.0f}')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark event bus fan-out to many idle subscribers.
+
+Starts one thread per subscriber blocked on its bounded buffer (as each
+/api/events stream does), publishes availability events, and reports
+publish cost, delivery latency and the CPU time used while subscribers idle.
+
+Usage:
+    python benchmarks/bench_event_stream.py --subscribers 1000 --events 200
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.event_bus import EventBus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--idle', type=float, default=2.0, help="Seconds to measure idle CPU use")
+    args = parser.parse_args(argv)
+
+    bus = EventBus(max_subscribers=args.subscribers)
+    latencies = []
+    lock = threading.Lock()
+    done = threading.Barrier(args.subscribers + 1)
+
+    def subscriber(subscription):
+        received = 0
+        while received < args.events:
+            for _, _, data in subscription.get(timeout=30):
+                received += 1
+                if received == args.events:
+                    with lock:
+                        latencies.append(time.perf_counter() - data['sent'])
+        subscription.close()
+        done.wait()
+
+    threading.stack_size(256 * 1024)
+    threads = [threading.Thread(target=subscriber, args=(bus.subscribe(),), daemon=True)
+               for _ in range(args.subscribers)]
+    for thread in threads:
+        thread.start()
+
+    cpu = time.process_time()
+    time.sleep(args.idle)
+    idle_cpu = time.process_time() - cpu
+    print(f'{args.subscribers} idle subscribers used {idle_cpu * 1000:.1f} ms CPU in {args.idle:.1f}s')
+
+    began = time.perf_counter()
+    for n in range(args.events):
+        bus.publish('availability', {'book_id': n, 'available_copies': 1, 'total_copies': 2, 'sent': time.perf_counter()})
+    publish_seconds = time.perf_counter() - began
+    done.wait()
+    latencies.sort()
+    stats = bus.stats()
+    print(f'published {args.events} events in {publish_seconds * 1000:.1f} ms '
+          f'({publish_seconds / args.events * 1e6:.0f} us each, {stats["delivered"]:,} deliveries, '
+          f'{stats["overflows"]} overflows)')
+    print(f'last event delivery latency: p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+          f'max {latencies[-1] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
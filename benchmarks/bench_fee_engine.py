@@ -0,0 +1,81 @@
+"""
+Benchmark the batch late-fee engine against per-loan fee calculation.
+
+Loads a throwaway database with open loans (a share of them overdue) and
+compares calculate_late_fee_for_book on a sample of loans (extrapolated)
+with the streaming SQL pass and the SQL-only aggregate.
+
+Usage:
+    python benchmarks/bench_fee_engine.py --loans 10000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def load_open_loans(conn, loans, patrons, books, chunk=100000):
+    conn.executemany(
+        'INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)',
+        ((f'Book {n}', f'Author {n % 997}', f'{9780000000000 + n}', 10, 10) for n in range(books))
+    )
+    rng = random.Random(9)
+    now = datetime.now()
+    inserted = 0
+    while inserted < loans:
+        rows = []
+        for _ in range(min(chunk, loans - inserted)):
+            due = now + timedelta(minutes=rng.randrange(-60 * 24 * 40, 60 * 24 * 14))
+            rows.append((f'{100000 + rng.randrange(patrons)}', rng.randrange(1, books + 1),
+                         (due - timedelta(days=14)).isoformat(), due.isoformat()))
+        conn.executemany(
+            'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)', rows
+        )
+        conn.commit()
+        inserted += len(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=10000000)
+    parser.add_argument('--patrons', type=int, default=500000)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--sample', type=int, default=2000, help="Loans priced one at a time for the baseline")
+    args = parser.parse_args(argv)
+
+    from services.library_service import calculate_late_fee_for_book
+    from services.fee_engine import run_fee_batch
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        conn = database.get_db_connection()
+        began = time.perf_counter()
+        load_open_loans(conn, args.loans, args.patrons, args.books)
+        sample = conn.execute('SELECT patron_id, book_id FROM borrow_records LIMIT ?', (args.sample,)).fetchall()
+        conn.close()
+        print(f'Loaded {args.loans} open loans in {time.perf_counter() - began:.1f}s')
+
+        began = time.perf_counter()
+        for row in sample:
+            calculate_late_fee_for_book(row['patron_id'], row['book_id'])
+        per_loan = (time.perf_counter() - began) / len(sample)
+        print(f'{"per-loan calculate_late_fee_for_book":<40}{1 / per_loan:>14,.0f} loans/s'
+              f'  (~{per_loan * args.loans:,.0f}s for all loans, extrapolated)')
+
+        for label, kwargs in (('batch engine, streamed rows', {'sink': lambda row: None}),
+                              ('batch engine, SQL aggregate', {})):
+            summary = run_fee_batch(overdue_only=False, **kwargs)
+            print(f'{label:<40}{summary["loans_per_second"]:>14,.0f} loans/s'
+                  f'  ({summary["seconds"]:.1f}s, {summary["loans_with_fees"]:,} overdue, ${summary["total_fees"]:,.2f})')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark caller wait times against a degraded gateway with and without the resilience layer.
+
+Runs concurrent charges against a fault-injecting StubGatewayServer (a
+share of requests hang, a share fail) through a plain HttpPaymentGateway
+and through ResilientPaymentGateway, and reports how long callers waited.
+
+Usage:
+    python benchmarks/bench_gateway_resilience.py --calls 200 --slow-rate 0.2 --error-rate 0.3
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.gateway_resilience import CircuitBreaker, ResilientPaymentGateway
+from services.payment_service import HttpPaymentGateway
+from services.payment_stub import StubGatewayServer
+
+
+def run(gateway, calls, concurrency):
+    """Send the charges concurrently and return (per-call seconds, failures)."""
+    def charge(_):
+        started = time.perf_counter()
+        try:
+            ok = gateway.process_payment('123456', 2.5)[0]
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(charge, range(calls)))
+    return sorted(seconds for seconds, _ in results), sum(not ok for _, ok in results)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--slow-rate', type=float, default=0.2)
+    parser.add_argument('--slow-latency', type=float, default=2.0)
+    parser.add_argument('--error-rate', type=float, default=0.3)
+    parser.add_argument('--timeout', type=float, default=0.25, help="Resilient client request timeout per call")
+    args = parser.parse_args(argv)
+
+    print(f'{"client":<14}{"seconds":>9}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}{"failed":>8}{"sent":>7}')
+    for label in ('plain', 'resilient'):
+        with StubGatewayServer(args.latency, error_rate=args.error_rate, slow_rate=args.slow_rate,
+                               slow_latency=args.slow_latency, seed=14) as stub:
+            if label == 'resilient':
+                # Charges that outlive the budget come back as unknown outcomes, counted as failures here
+                gateway = ResilientPaymentGateway(
+                    HttpPaymentGateway(stub.url, max_concurrency=args.concurrency, timeout=args.timeout),
+                    timeout=args.timeout, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5))
+            else:
+                gateway = HttpPaymentGateway(stub.url, max_concurrency=args.concurrency, timeout=30)
+            began = time.perf_counter()
+            waits, failed = run(gateway, args.calls, args.concurrency)
+            elapsed = time.perf_counter() - began
+            gateway.close()
+            print(f'{label:<14}{elapsed:>9.2f}{waits[len(waits) // 2] * 1000:>10.1f}'
+                  f'{waits[int(len(waits) * 0.99)] * 1000:>10.1f}{waits[-1] * 1000:>10.1f}'
+                  f'{failed:>8}{stub.stats["requests"]:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark peak memory and throughput of the streaming history export.
+
+Loads a throwaway database with returned loans and compares building an
+export from materialized get_borrow_record lists with the streaming
+export in each format, at several table sizes.
+
+Usage:
+    python benchmarks/bench_history_export.py --loans 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def load_history(conn, loans, patrons, chunk=100000):
+    start = datetime.now() - timedelta(days=3650)
+    inserted = conn.execute('SELECT COUNT(*) FROM borrow_records').fetchone()[0]
+    while inserted < loans:
+        rows = []
+        for n in range(inserted, min(inserted + chunk, loans)):
+            borrowed = start + timedelta(minutes=n)
+            due = borrowed + timedelta(days=14)
+            rows.append((f'{100000 + n % patrons}', 1 + n % 4, borrowed.isoformat(), due.isoformat(),
+                         (due + timedelta(days=n % 5 - 2)).isoformat()))
+        conn.executemany(
+            'INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.commit()
+        inserted += len(rows)
+
+def measure(export):
+    """Run an export twice, untraced for timing and traced for memory; return (seconds, peak bytes)."""
+    began = time.perf_counter()
+    export()
+    seconds = time.perf_counter() - began
+    tracemalloc.start()
+    export()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--patrons', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    from services.history_export import iter_history_export
+
+    def materialized():
+        # What an export built on get_borrow_record looks like: every patron's list in memory at once
+        conn = database.get_db_connection()
+        patrons = [row[0] for row in conn.execute('SELECT DISTINCT patron_id FROM borrow_records')]
+        conn.close()
+        records = [record for patron_id in patrons for record in database.get_borrow_record(patron_id)]
+        for record in records:
+            json.dumps(record, default=str)
+
+    exports = [('materialized get_borrow_record', materialized)] + [
+        (f'streaming {file_format}', lambda f=file_format: [None for _ in iter_history_export(f)])
+        for file_format in ('csv', 'jsonl', 'columnar')
+    ]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        database.add_sample_data()  # books 1-4
+        print(f'{"export":<34}{"loans":>10}{"seconds":>9}{"rows/s":>12}{"peak MiB":>10}')
+        for loans in sorted(args.loans):
+            conn = database.get_db_connection()
+            load_history(conn, loans, args.patrons)
+            conn.close()
+            for label, export in exports:
+                seconds, peak = measure(export)
+                print(f'{label:<34}{loans:>10}{seconds:>9.2f}{loans / seconds:>12,.0f}{peak / 2 ** 20:>10.1f}')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark the holds queue against retrying failed borrows on one contended title.
+
+--patrons threads arrive --arrival-gap seconds apart, all wanting the same
+book with --copies copies, and keep it for --loan-time seconds before
+returning it. In retry mode a patron repeats borrow_book_by_patron every
+--interval seconds until it succeeds (each failure is a write transaction).
+In holds mode a patron who cannot borrow places a hold and checks its status
+at the same interval (a read), borrowing once a copy is set aside for them.
+
+Reports borrow attempts, write transactions, time until every patron was
+served, wait from arrival to loan, and the share of patron pairs served out
+of arrival order.
+
+Usage:
+    python benchmarks/bench_holds.py --patrons 200 --copies 5 --loan-time 0.05
+"""
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import database
+from bench_async_load import percentile
+
+
+def out_of_order(patrons):
+    """Share of patron pairs where the later arrival was served first."""
+    served = [patron['served'] for patron in sorted(patrons, key=lambda patron: patron['arrived'])]
+    pairs = inversions = 0
+    for i in range(len(served)):
+        for j in range(i + 1, len(served)):
+            pairs += 1
+            inversions += served[j] < served[i]
+    return inversions / pairs if pairs else 0.0
+
+def run(mode, book_id, args):
+    from services.library_service import borrow_book_by_patron, get_hold_status, place_hold, return_book_by_patron
+
+    counts = {'attempts': 0, 'failed': 0, 'writes': 0, 'reads': 0}
+    lock = threading.Lock()
+    patrons = []
+
+    def count(**increments):
+        with lock:
+            for key, value in increments.items():
+                counts[key] += value
+
+    def patron(n):
+        patron_id = f'{700000 + n}'
+        rng = random.Random(n)
+        time.sleep(n * args.arrival_gap)
+        arrived = time.perf_counter()
+        held = False
+        while True:
+            if mode == 'holds' and held:
+                hold = get_hold_status(patron_id, book_id)
+                count(reads=1)
+                if hold is None or hold['status'] != 'ready':
+                    time.sleep(args.interval)
+                    continue
+            success, _ = borrow_book_by_patron(patron_id, book_id)
+            count(attempts=1, writes=1, failed=int(not success))
+            if success:
+                break
+            if mode == 'holds' and not held:
+                held = place_hold(patron_id, book_id)[0]
+                count(writes=1)
+                continue
+            time.sleep(args.interval * rng.uniform(0.5, 1.5))
+        served = time.perf_counter()
+        time.sleep(args.loan_time)
+        return_book_by_patron(patron_id, book_id)
+        count(writes=1)
+        with lock:
+            patrons.append({'arrived': arrived, 'served': served})
+
+    threads = [threading.Thread(target=patron, args=(n,)) for n in range(args.patrons)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - began
+
+    waits = [patron['served'] - patron['arrived'] for patron in patrons]
+    print(f'{mode:<8}{counts["attempts"]:>10}{counts["failed"]:>10}{counts["writes"]:>10}{counts["reads"]:>10}'
+          f'{seconds:>10.2f}{percentile(waits, 50):>10.0f}{percentile(waits, 99):>10.0f}'
+          f'{out_of_order(patrons) * 100:>12.1f}%')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--patrons', type=int, default=200)
+    parser.add_argument('--copies', type=int, default=5)
+    parser.add_argument('--loan-time', type=float, default=0.05, help="Seconds each patron keeps the book")
+    parser.add_argument('--interval', type=float, default=0.01, help="Seconds between retries or hold status checks")
+    parser.add_argument('--arrival-gap', type=float, default=0.002, help="Seconds between patron arrivals")
+    args = parser.parse_args(argv)
+
+    # Every patron thread may hold a pooled connection; contention trips the slow query log
+    database.POOL_SIZE = database.WRITE_POOL_SIZE = args.patrons
+    logging.getLogger('library.slow_query').disabled = True
+
+    print(f'{args.patrons} patrons, {args.copies} copies, {args.loan_time * 1000:.0f} ms loans, '
+          f'{args.interval * 1000:.0f} ms retry/poll interval')
+    print(f'{"mode":<8}{"borrows":>10}{"failed":>10}{"writes":>10}{"reads":>10}{"seconds":>10}'
+          f'{"p50 ms":>10}{"p99 ms":>10}{"out of order":>13}')
+    for mode in ('retry', 'holds'):
+        with tempfile.TemporaryDirectory() as workdir:
+            database.DATABASE = os.path.join(workdir, 'bench_library.db')
+            database.init_database()
+            database.insert_book('Contended Book', 'Popular Author', '9781111111111', args.copies, args.copies)
+            run(mode, database.get_book_by_isbn('9781111111111')['id'], args)
+            database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
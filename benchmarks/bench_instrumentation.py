@@ -0,0 +1,76 @@
+"""
+Benchmark the request overhead of instrumentation and per-request profiling.
+
+Runs the same requests through the Flask test client in child processes
+with LIBRARY_INSTRUMENTATION off and on (instrumentation is applied at
+import time), then with ?profile=sampling and ?profile=cprofile, and
+reports requests per second and mean latency for each mode.
+
+Usage:
+    python benchmarks/bench_instrumentation.py --requests 2000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PATHS = ('/api/books?limit=20', '/api/search?q=Gatsby', '/api/patrons/123456/status')
+MODES = (
+    ('off', {'LIBRARY_INSTRUMENTATION': '0'}, ''),
+    ('instrumented', {'LIBRARY_INSTRUMENTATION': '1'}, ''),
+    ('sampling profile', {'LIBRARY_INSTRUMENTATION': '1', 'LIBRARY_PROFILING': '1'}, 'profile=sampling'),
+    ('cProfile', {'LIBRARY_INSTRUMENTATION': '1', 'LIBRARY_PROFILING': '1'}, 'profile=cprofile'),
+)
+
+
+def run_requests(count: int, query: str) -> dict:
+    """Child process: time count requests cycling through PATHS."""
+    sys.path.append(ROOT)
+    import database
+    from app import create_app
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        client = create_app().test_client()
+        urls = [path + ('&' if '?' in path else '?') + query if query else path for path in PATHS]
+        for url in urls:
+            client.get(url)
+        began = time.perf_counter()
+        for n in range(count):
+            client.get(urls[n % len(urls)])
+        seconds = time.perf_counter() - began
+        database.close_pools()
+    return {'requests': count, 'seconds': seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        print(json.dumps(run_requests(args.requests, args.child)))
+        return
+
+    print(f'{"mode":<18}{"req/s":>10}{"mean ms":>10}{"overhead":>10}')
+    baseline = None
+    for label, env, query in MODES:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--requests', str(args.requests), '--child', query],
+            env=dict(os.environ, **env), capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        mean = result['seconds'] / result['requests']
+        baseline = baseline or mean
+        print(f'{label:<18}{result["requests"] / result["seconds"]:>10.0f}{mean * 1000:>10.3f}'
+              f'{(mean / baseline - 1) * 100:>9.1f}%')
+
+
+if __name__ == '__main__':
+    main()
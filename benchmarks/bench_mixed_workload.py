@@ -0,0 +1,104 @@
+"""
+Benchmark mixed catalog reads and borrow/return writes across worker processes.
+
+Each worker process plays the part of one gunicorn worker: it mostly reads
+the first catalog page (get_books_page) and sometimes borrows and returns a
+book. The run is repeated with the rollback journal and with WAL.
+
+Usage:
+    python benchmarks/bench_mixed_workload.py --workers 4 --seconds 5
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def worker(path, journal_mode, seconds, write_ratio, seed, results):
+    """Run the mixed workload in one process and report latencies."""
+    from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+    database.DATABASE = path
+    database.STORAGE_PROFILE['journal_mode'] = journal_mode
+    rng = random.Random(seed)
+    patron_id = f'{200000 + seed}'
+    reads, writes, errors = [], [], 0
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        began = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                book_id = rng.randrange(1, 201)
+                ok, _ = borrow_book_by_patron(patron_id, book_id)
+                if ok:
+                    return_book_by_patron(patron_id, book_id)
+                writes.append(time.perf_counter() - began)
+            else:
+                database.get_books_page(100)
+                reads.append(time.perf_counter() - began)
+        except database.sqlite3.OperationalError:
+            errors += 1
+    database.close_pools()
+    results.put((reads, writes, errors))
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+def run(journal_mode, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'bench_library.db')
+        database.DATABASE = path
+        database.STORAGE_PROFILE['journal_mode'] = journal_mode
+        database.init_database()
+        conn = database.get_db_connection()
+        conn.executemany(
+            'INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)',
+            ((f'Book {n:05d}', f'Author {n % 97}', f'{9780000000000 + n}', 3, 3) for n in range(args.books))
+        )
+        conn.commit()
+        conn.close()
+
+        results = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=worker, args=(path, journal_mode, args.seconds, args.write_ratio, n, results))
+            for n in range(args.workers)
+        ]
+        for proc in procs:
+            proc.start()
+        collected = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+
+    reads = [r for chunk in collected for r in chunk[0]]
+    writes = [w for chunk in collected for w in chunk[1]]
+    errors = sum(chunk[2] for chunk in collected)
+    print(f'{journal_mode:<8}{len(reads) / args.seconds:>10.0f}{len(writes) / args.seconds:>10.0f}'
+          f'{percentile(reads, 50):>10.2f}{percentile(reads, 99):>10.2f}{percentile(writes, 99):>10.2f}{errors:>8}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    print(f'{args.workers} workers, {args.seconds:.0f}s each, {args.write_ratio:.0%} writes, {args.books} books')
+    print(f'{"journal":<8}{"reads/s":>10}{"writes/s":>10}{"read p50":>10}{"read p99":>10}{"write p99":>10}{"errors":>8}')
+    for journal_mode in ('DELETE', 'WAL'):
+        run(journal_mode, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the overdue notice sweep at millions of loans.
+
+Loads a throwaway database with open loans (a share of them overdue, see
+bench_fee_engine.py) and compares looking patrons up one at a time with
+get_patron_borrowed_books (a sample, extrapolated) against full sweeps: to
+the JSON Lines file sink, and to the SMTP stub with a per-message latency
+for each worker count. Sweeps run without a rate limit.
+
+Usage:
+    python benchmarks/bench_overdue_notices.py --loans 2000000 --workers 1 8 32 --smtp-latency 0.005
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import database
+from bench_fee_engine import load_open_loans
+
+
+def peak_memory_mb() -> str:
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return 'n/a'
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return f'{peak / (1024 * 1024 if sys.platform == "darwin" else 1024):.0f}'
+
+def report(label, summary):
+    print(f'{label:<34}{summary["patrons"]:>10,}{summary["loans"]:>12,}{summary["seconds"]:>10.1f}'
+          f'{summary["patrons_per_second"]:>14,.0f}{peak_memory_mb():>10}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--loans', type=int, default=2000000)
+    parser.add_argument('--patrons', type=int, default=500000)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--smtp-latency', type=float, default=0.005, help="Seconds per message in the SMTP stub")
+    parser.add_argument('--sample', type=int, default=2000, help="Patrons looked up one at a time for the baseline")
+    args = parser.parse_args(argv)
+
+    from services.overdue_notices import FileNoticeSender, StubSmtpSender, run_overdue_notices
+
+    # Bulk loading trips the slow query log; the table reports throughput instead
+    logging.getLogger('library.slow_query').disabled = True
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        conn = database.get_db_connection()
+        began = time.perf_counter()
+        load_open_loans(conn, args.loans, args.patrons, args.books)
+        sample = [row[0] for row in conn.execute('SELECT DISTINCT patron_id FROM borrow_records LIMIT ?', (args.sample,))]
+        patrons = conn.execute('SELECT COUNT(DISTINCT patron_id) FROM borrow_records').fetchone()[0]
+        conn.close()
+        print(f'Loaded {args.loans:,} open loans for {patrons:,} patrons in {time.perf_counter() - began:.1f}s')
+
+        began = time.perf_counter()
+        for patron_id in sample:
+            [book for book in database.get_patron_borrowed_books(patron_id) if book['is_overdue']]
+        per_patron = (time.perf_counter() - began) / len(sample)
+        print(f'per-patron get_patron_borrowed_books: {1 / per_patron:,.0f} patrons/s'
+              f'  (~{per_patron * patrons:,.0f}s for all patrons, extrapolated)')
+
+        print(f'{"sweep":<34}{"patrons":>10}{"loans":>12}{"seconds":>10}{"patrons/s":>14}{"peak MB":>10}')
+        with FileNoticeSender(os.path.join(workdir, 'notices.jsonl')) as sender:
+            report(f'file sink, {args.workers[-1]} workers',
+                   run_overdue_notices(sender, workers=args.workers[-1], rate=0, resume=False))
+        for workers in args.workers:
+            sender = StubSmtpSender(latency=args.smtp_latency)
+            report(f'smtp stub {args.smtp_latency * 1000:g} ms, {workers} workers',
+                   run_overdue_notices(sender, workers=workers, rate=0, resume=False))
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
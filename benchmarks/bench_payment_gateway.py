@@ -0,0 +1,73 @@
+"""
+Benchmark payment gateway clients against a local stub gateway.
+
+Starts StubGatewayServer with a simulated per-request delay and times a
+series of charges sent as cold one-off requests, over a pooled session,
+as concurrent batches and through the asyncio client.
+
+Usage:
+    python benchmarks/bench_payment_gateway.py --charges 500 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.payment_service import AsyncPaymentGateway, HttpPaymentGateway
+from services.payment_stub import StubGatewayServer
+
+
+def cold_charge(url, patron_id, amount):
+    """One request on a fresh connection, as the original per-call client would make."""
+    response = requests.post(f'{url}/charges', json={'customer_id': patron_id, 'amount': amount}, timeout=5)
+    return response.ok
+
+def report(label, charges, seconds, stub):
+    print(f'{label:<32}{seconds:>9.2f}{charges / seconds:>14,.1f}{stub.stats["connections"]:>13}')
+    stub.stats['connections'] = 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--charges', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated gateway delay per request in seconds")
+    parser.add_argument('--sequential', type=int, default=50, help="Charges timed for the one-at-a-time clients")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32])
+    args = parser.parse_args(argv)
+
+    charges = [{'patron_id': '123456', 'amount': 1.0 + n % 10} for n in range(args.charges)]
+    with StubGatewayServer(args.latency) as stub:
+        print(f'{"client":<32}{"seconds":>9}{"charges/s":>14}{"connections":>13}')
+
+        began = time.perf_counter()
+        for charge in charges[:args.sequential]:
+            cold_charge(stub.url, charge['patron_id'], charge['amount'])
+        report('cold requests, sequential', args.sequential, time.perf_counter() - began, stub)
+
+        with HttpPaymentGateway(stub.url) as gateway:
+            began = time.perf_counter()
+            for charge in charges[:args.sequential]:
+                gateway.process_payment(**charge)
+            report('pooled session, sequential', args.sequential, time.perf_counter() - began, stub)
+
+        for concurrency in args.concurrency:
+            with HttpPaymentGateway(stub.url, max_concurrency=concurrency) as gateway:
+                began = time.perf_counter()
+                gateway.process_payments(charges)
+                report(f'batch, concurrency {concurrency}', args.charges, time.perf_counter() - began, stub)
+
+            async def run():
+                async with AsyncPaymentGateway(HttpPaymentGateway(stub.url, max_concurrency=concurrency)) as gateway:
+                    await gateway.process_payments(charges)
+
+            began = time.perf_counter()
+            asyncio.run(run())
+            report(f'asyncio, concurrency {concurrency}', args.charges, time.perf_counter() - began, stub)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark queued late fee payments against synchronous pay_late_fees.
+
+Uses FakePaymentGateway with a simulated remote-call delay. Reports how long
+a request waits (synchronous charge vs enqueue) and how fast worker pools of
+different sizes drain the queue.
+
+Usage:
+    python benchmarks/bench_payment_queue.py --payments 200 --latency 0.5
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--payments', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.5, help="Simulated gateway call in seconds")
+    parser.add_argument('--sync-sample', type=int, default=5, help="Synchronous payments timed for the baseline")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 16, 64])
+    args = parser.parse_args(argv)
+
+    from services.library_service import pay_late_fees, prepare_late_fee_charge
+    from services.payment_queue import PaymentWorkerPool
+    from services.payment_service import FakePaymentGateway
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        database.insert_book('Bench Book', 'Bench Author', '9780000000001', 10, 10)
+        book_id = database.get_book_by_isbn('9780000000001')['id']
+        due = datetime.now() - timedelta(days=5)
+        database.insert_borrow_record('123456', book_id, due - timedelta(days=14), due)
+        charge, _ = prepare_late_fee_charge('123456', book_id)
+
+        gateway = FakePaymentGateway(args.latency)
+        began = time.perf_counter()
+        for _ in range(args.sync_sample):
+            pay_late_fees('123456', book_id, gateway)
+        sync_ms = (time.perf_counter() - began) * 1000 / args.sync_sample
+
+        began = time.perf_counter()
+        for _ in range(args.sync_sample):
+            database.enqueue_payment('charge', charge['amount'], '123456', book_id, charge['description'])
+        enqueue_ms = (time.perf_counter() - began) * 1000 / args.sync_sample
+        print(f'Request latency: synchronous charge {sync_ms:.1f} ms, enqueue {enqueue_ms:.2f} ms')
+        print(f'Synchronous throughput: {1000 / sync_ms:,.1f} payments/s per request worker')
+
+        print(f'{"workers":>8}{"seconds":>10}{"payments/s":>14}')
+        for workers in args.workers:
+            for _ in range(args.payments):
+                database.enqueue_payment('charge', charge['amount'], '123456', book_id, charge['description'])
+            pool = PaymentWorkerPool(FakePaymentGateway(args.latency), workers=workers)
+            began = time.perf_counter()
+            pool.start(drain=True)
+            pool.join()
+            seconds = time.perf_counter() - began
+            print(f'{workers:>8}{seconds:>10.2f}{pool.processed / seconds:>14,.1f}')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark dashboard-style payment status polling with and without the status cache.
+
+Several pollers repeatedly check overlapping sets of transactions against
+FakePaymentGateway with a simulated status-check delay, first calling the
+gateway directly and then through PaymentStatusCache.
+
+Usage:
+    python benchmarks/bench_payment_status.py --pollers 8 --rounds 5 --transactions 50
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.payment_service import FakePaymentGateway
+from services.payment_status import PaymentStatusCache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pollers', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--transactions', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.3, help="Simulated status check delay in seconds")
+    args = parser.parse_args(argv)
+
+    transaction_ids = [f'txn_123456_{n}' for n in range(args.transactions)]
+    print(f'{"client":<22}{"seconds":>9}{"lookups":>10}{"gateway calls":>15}')
+    for label in ('direct', 'status cache'):
+        gateway = FakePaymentGateway(args.latency, max_concurrency=32)
+        cache = PaymentStatusCache(gateway)
+
+        def poll(_):
+            for _ in range(args.rounds):
+                if label == 'direct':
+                    # Same fan-out width as verify_many
+                    with ThreadPoolExecutor(max_workers=gateway.max_concurrency) as executor:
+                        list(executor.map(gateway.verify_payment_status, transaction_ids))
+                else:
+                    cache.verify_many(transaction_ids)
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.pollers) as executor:
+            list(executor.map(poll, range(args.pollers)))
+        lookups = args.pollers * args.rounds * args.transactions
+        print(f'{label:<22}{time.perf_counter() - began:>9.2f}{lookups:>10}{gateway.calls:>15}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark catalog search: LIKE '%term%' scans against the books_fts index.
+
+Builds a throwaway catalog of synthetic titles and authors (the FTS index is
+filled by the insert trigger, as in production) and times both query styles.
+
+Usage:
+    python benchmarks/bench_search.py --books 2000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+WORDS = (
+    'river night garden empire shadow silver winter secret ocean forest glass iron '
+    'northern crown harbor stone letters summer broken bright machine island city '
+    'hidden fire kingdom paper storm quiet golden lost history last journey wild'
+).split()
+SURNAMES = 'smith okafor tanaka garcia novak murphy singh larsen rossi dubois kowalski chen'.split()
+SYLLABLES = [c + v for c in 'bdfgklmnprstvz' for v in 'aeiou']
+
+
+def rare_word(n):
+    """Deterministic made-up word; load_books gives each one to about 20 books."""
+    word = ''
+    for _ in range(4):
+        n, digit = divmod(n, len(SYLLABLES))
+        word += SYLLABLES[digit]
+    return word
+
+
+def load_books(conn, books, chunk=50000):
+    rng = random.Random(6)
+    vocabulary = max(1, books // 20)
+    inserted = 0
+    while inserted < books:
+        rows = []
+        for n in range(inserted, min(books, inserted + chunk)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(1, 4))] + [rare_word(rng.randrange(vocabulary))]
+            title = ' '.join(words).title()
+            author = f'{rng.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")}. {rng.choice(SURNAMES).title()}'
+            rows.append((title, author, f'{9700000000000 + n}', 2, 2))
+        conn.executemany(
+            'INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)', rows
+        )
+        conn.commit()
+        inserted += len(rows)
+
+def like_search(term, field):
+    """The pre-FTS helper: substring scan over every row, returning every match."""
+    with database.read_connection() as conn:
+        books = conn.execute(f'SELECT * FROM books WHERE {field} LIKE ?', (f'%{term}%',)).fetchall()
+    return [dict(book) for book in books]
+
+def timed(fn, repeats):
+    began = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return (time.perf_counter() - began) * 1000 / repeats, len(result)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--books', type=int, default=2000000)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=database.SEARCH_LIMIT)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DATABASE = os.path.join(workdir, 'bench_library.db')
+        database.init_database()
+        conn = database.get_db_connection()
+        began = time.perf_counter()
+        load_books(conn, args.books)
+        conn.close()
+        print(f'Loaded and indexed {args.books} books in {time.perf_counter() - began:.1f}s')
+
+        terms = [
+            ('title', rare_word(7)),          # selective word
+            ('title', rare_word(7)[:5]),      # prefix of a selective word
+            ('title', 'northern harbor'),     # two common words
+            ('title', 'zzzzz'),               # no matches
+            ('author', 'okafor'),             # common surname
+        ]
+        print(f'{"search":<24}{"LIKE (ms)":>12}{"LIKE hits":>10}{"FTS5 (ms)":>12}{"FTS hits":>10}')
+        for field, term in terms:
+            like_ms, like_hits = timed(lambda: like_search(term, field), args.repeats)
+            fts_ms, fts_hits = timed(lambda: database.search_books_fulltext(term, field, args.limit), args.repeats)
+            print(f'{field + ": " + term:<24}{like_ms:>12.2f}{like_hits:>10}{fts_ms:>12.2f}{fts_hits:>10}')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark cold start: import time, create_app phases and time to first request.
+
+Each trial starts a fresh interpreter that imports app, builds the app and
+serves one catalog request, with the bootstrap (fresh database) and with
+--skip-bootstrap semantics (database prepared beforehand). A run under
+-X importtime lists the slowest top-level imports.
+
+With --check the run exits with status 1 when the median time to first
+request exceeds --budget seconds, or when a module that should only load on
+demand (--deferred-modules, default: requests and asyncio) was imported, so it
+can guard startup against regressions.
+
+Usage:
+    python benchmarks/bench_startup.py --trials 5
+    python benchmarks/bench_startup.py --check --budget 1.0
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED_MODULES = ('requests', 'asyncio')
+
+
+def child(path, bootstrap, deferred):
+    """Runs in a fresh interpreter: time imports, create_app and the first request."""
+    began = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import database
+    database.DATABASE = path
+    from app import create_app
+    imported = time.perf_counter()
+    app = create_app(bootstrap=bootstrap)
+    created = time.perf_counter()
+    status = app.test_client().get('/api/books').status_code
+    answered = time.perf_counter()
+
+    from instrumentation import startup_report
+    print(json.dumps({
+        'import': imported - began,
+        'create_app': created - imported,
+        'first_request': answered - began,
+        'status': status,
+        'phases': startup_report()['phases'],
+        'loaded': [module for module in deferred if module in sys.modules],
+    }))
+
+def trial(path, bootstrap, deferred, *flags):
+    command = [sys.executable, *flags, os.path.abspath(__file__), '--child', path,
+               '--deferred-modules', *deferred] + ([] if bootstrap else ['--skip-bootstrap'])
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def import_breakdown(stderr, top=8):
+    """Slowest top-level imports from -X importtime output, as (module, seconds)."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name[1:].startswith(' '):
+            imports.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])[:top]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trials', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help="Exit with status 1 on a startup regression")
+    parser.add_argument('--budget', type=float, default=1.0, help="Median seconds to first request allowed by --check")
+    parser.add_argument('--deferred-modules', nargs='*', default=list(DEFERRED_MODULES),
+                        help="Modules that must not be loaded by startup and a catalog request")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--skip-bootstrap', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.child, not args.skip_bootstrap, args.deferred_modules)
+        return 0
+
+    sys.path.insert(0, ROOT)
+    import database
+
+    failures = []
+    print(f'{"mode":<16}{"import ms":>10}{"create ms":>10}{"first req ms":>14}  phases (ms)')
+    with tempfile.TemporaryDirectory() as workdir:
+        prepared = os.path.join(workdir, 'prepared.db')
+        database.DATABASE = prepared
+        database.init_database()
+        database.add_sample_data()
+        database.close_pools()
+
+        for mode, bootstrap in (('bootstrap', True), ('skip-bootstrap', False)):
+            runs = []
+            for n in range(args.trials):
+                path = os.path.join(workdir, f'fresh_{n}.db') if bootstrap else prepared
+                runs.append(trial(path, bootstrap, args.deferred_modules)[0])
+            phases = {name: statistics.median(run['phases'].get(name, 0.0) for run in runs) for name in runs[0]['phases']}
+            first_request = statistics.median(run['first_request'] for run in runs)
+            print(f'{mode:<16}{statistics.median(run["import"] for run in runs) * 1000:>10.1f}'
+                  f'{statistics.median(run["create_app"] for run in runs) * 1000:>10.1f}{first_request * 1000:>14.1f}  '
+                  + ', '.join(f'{name} {seconds * 1000:.1f}' for name, seconds in phases.items()))
+            loaded = sorted({module for run in runs for module in run['loaded']})
+            if loaded:
+                failures.append(f'{mode}: loaded {", ".join(loaded)} at startup')
+            if first_request > args.budget:
+                failures.append(f'{mode}: first request after {first_request:.3f}s, budget {args.budget:.3f}s')
+            if any(run['status'] != 200 for run in runs):
+                failures.append(f'{mode}: first request failed')
+
+        _, stderr = trial(prepared, False, args.deferred_modules, '-X', 'importtime')
+    print('slowest top-level imports: ' + ', '.join(f'{name} {seconds * 1000:.1f} ms'
+                                                   for name, seconds in import_breakdown(stderr)))
+
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    return 1 if args.check and failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
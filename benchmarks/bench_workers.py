@@ -0,0 +1,91 @@
+"""
+Benchmark requests per second of the production server as workers are added.
+
+Starts gunicorn with gunicorn.conf.py and wsgi:app once per worker count,
+drives it with keep-alive HTTP connections (see bench_async_load.py) and
+reports throughput, latency and the speedup over one worker. Needs gunicorn,
+which does not run on Windows.
+
+Usage:
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --connections 64 --seconds 10
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from bench_async_load import http_client, percentile
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start within {timeout:.0f}s')
+
+def run(workers, args, workdir):
+    port = free_port()
+    env = dict(os.environ, LIBRARY_DATABASE=os.path.join(workdir, 'bench_library.db'), LIBRARY_SAMPLE_DATA='1',
+               LIBRARY_WORKERS=str(workers), LIBRARY_THREADS=str(args.threads),
+               LIBRARY_BIND=f'127.0.0.1:{port}', LIBRARY_ACCESS_LOG='')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        latencies, errors = [], []
+
+        async def load():
+            deadline = time.perf_counter() + args.seconds
+            await asyncio.gather(*(http_client('127.0.0.1', port, args.path, deadline, latencies, errors)
+                                   for _ in range(args.connections)))
+
+        began = time.perf_counter()
+        asyncio.run(load())
+        seconds = time.perf_counter() - began
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return len(latencies) / seconds, percentile(latencies, 50), percentile(latencies, 99), len(errors)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--threads', type=int, default=4, help="Threads per worker")
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--path', default='/api/search?q=Gatsby')
+    args = parser.parse_args(argv)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        parser.error('gunicorn is not installed (pip install gunicorn; it does not run on Windows)')
+
+    print(f'{os.cpu_count()} cores, {args.connections} connections, GET {args.path} for {args.seconds:.0f}s per run')
+    print(f'{"workers":<10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}{"speedup":>10}')
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as workdir:
+            rate, p50, p99, errors = run(workers, args, workdir)
+        baseline = baseline or rate
+        print(f'{workers:<10}{rate:>10.0f}{p50:>10.1f}{p99:>10.1f}{errors:>8}{rate / baseline:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""
+Catalog index module for Library Management System
+Compact in-memory copy of the books table for hot read paths
+"""
+
+import sys
+import threading
+from bisect import bisect_right, insort
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+BOOK_FIELDS = ('id', 'title', 'author', 'isbn', 'total_copies', 'available_copies')
+
+
+class BookRecord:
+    """One book, stored in slots instead of a per-instance dict."""
+
+    __slots__ = BOOK_FIELDS
+
+    def __init__(self, id: int, title: str, author: str, isbn: str, total_copies: int, available_copies: int):
+        self.id = id
+        self.title = title
+        self.author = author
+        self.isbn = isbn
+        self.total_copies = total_copies
+        self.available_copies = available_copies
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in BOOK_FIELDS}
+
+    def __repr__(self):
+        return f'BookRecord(id={self.id!r}, title={self.title!r}, isbn={self.isbn!r})'
+
+
+class CatalogIndex:
+    """
+    Every book of one database, indexed by id, by ISBN and by (title, id).
+
+    Lookups return BookRecord objects shared by all readers, or fresh dicts
+    from the *_dict helpers. Writers keep the index coherent by passing the
+    committed row to upsert(); writes made outside the database helpers (or
+    by another process) are not seen until the index is rebuilt.
+    """
+
+    def __init__(self, database: str):
+        self.database = database
+        self._by_id: Dict[int, BookRecord] = {}
+        self._by_isbn: Dict[str, BookRecord] = {}
+        self._titles: List[Tuple[str, int]] = []
+        self._lock = threading.Lock()
+        self._stats = {'records_allocated': 0, 'dicts_built': 0, 'hits': 0, 'misses': 0, 'updates': 0}
+
+    def load(self, rows: Iterable) -> 'CatalogIndex':
+        """Replace the contents with book rows (sqlite3.Row or tuples in BOOK_FIELDS order)."""
+        records = [BookRecord(*row) for row in rows]
+        by_id = {record.id: record for record in records}
+        by_isbn = {record.isbn: record for record in records}
+        titles = sorted((record.title, record.id) for record in records)
+        with self._lock:
+            self._by_id, self._by_isbn, self._titles = by_id, by_isbn, titles
+            self._stats['records_allocated'] += len(records)
+        return self
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, book_id: int) -> Optional[BookRecord]:
+        record = self._by_id.get(book_id)
+        self._count('hits' if record is not None else 'misses')
+        return record
+
+    def get_by_isbn(self, isbn: str) -> Optional[BookRecord]:
+        record = self._by_isbn.get(isbn)
+        self._count('hits' if record is not None else 'misses')
+        return record
+
+    def get_dict(self, book_id: int) -> Optional[Dict]:
+        return self.as_dict(self.get(book_id))
+
+    def get_dict_by_isbn(self, isbn: str) -> Optional[Dict]:
+        return self.as_dict(self.get_by_isbn(isbn))
+
+    def iter_by_title(self) -> Iterator[BookRecord]:
+        """Every book in (title, id) order."""
+        with self._lock:
+            titles = list(self._titles)
+        by_id = self._by_id
+        return (by_id[book_id] for _, book_id in titles)
+
+    def page(self, limit: int, after: Optional[Tuple[str, int]] = None) -> Tuple[List[BookRecord], Optional[Tuple[str, int]]]:
+        """Same contract as database.get_books_page, returning records."""
+        with self._lock:
+            start = 0 if after is None else bisect_right(self._titles, (after[0], after[1]))
+            keys = self._titles[start:start + limit + 1]
+            records = [self._by_id[book_id] for _, book_id in keys[:limit]]
+        self._count('hits', len(records))
+        next_cursor = keys[limit - 1] if len(keys) > limit else None
+        return records, next_cursor
+
+    def upsert(self, row) -> BookRecord:
+        """Add a committed book row, or update the record already held for its id."""
+        with self._lock:
+            record = self._by_id.get(row[0])
+            if record is None:
+                record = BookRecord(*row)
+                self._by_id[record.id] = record
+                self._by_isbn[record.isbn] = record
+                insort(self._titles, (record.title, record.id))
+                self._stats['records_allocated'] += 1
+            else:
+                # Update in place so the title and ISBN indexes stay valid
+                record.total_copies = row[4]
+                record.available_copies = row[5]
+            self._stats['updates'] += 1
+        return record
+
+    def as_dict(self, record: Optional[BookRecord]) -> Optional[Dict]:
+        """A fresh dict copy of a record (counted in dicts_built)."""
+        if record is None:
+            return None
+        self._count('dicts_built')
+        return record.to_dict()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def memory(self) -> Dict:
+        """
+        Approximate bytes held by the index: the records, their (deduplicated)
+        field values and the three index structures, next to what the same
+        books would take as one dict per row.
+        """
+        with self._lock:
+            records = list(self._by_id.values())
+            index_bytes = sys.getsizeof(self._by_id) + sys.getsizeof(self._by_isbn) + sys.getsizeof(self._titles)
+            index_bytes += sum(sys.getsizeof(key) for key in self._titles)
+        record_bytes = sum(sys.getsizeof(record) for record in records)
+        seen = set()
+        value_bytes = 0
+        for record in records:
+            for field in BOOK_FIELDS:
+                value = getattr(record, field)
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    value_bytes += sys.getsizeof(value)
+        dict_bytes = sys.getsizeof(records[0].to_dict()) * len(records) if records else 0
+        return {
+            'books': len(records),
+            'record_bytes': record_bytes,
+            'value_bytes': value_bytes,
+            'index_bytes': index_bytes,
+            'total_bytes': record_bytes + value_bytes + index_bytes,
+            'dict_rows_bytes': dict_bytes + value_bytes,
+        }
+
+    def stats(self) -> Dict:
+        """Return a snapshot of the counters plus the memory footprint."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['memory'] = self.memory()
+        return stats
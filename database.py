@@ -3,19 +3,492 @@ Database module for Library Management System
 Handles all database operations and connections
 """
 
+import json
+import os
+import queue
+import re
 import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+from cache import LRUCache
+from catalog_index import BOOK_FIELDS, BookRecord, CatalogIndex
+from instrumentation import CONNECTION_FACTORY, instrument_module, timed
 
 # Database configuration
-DATABASE = 'library.db'
+DATABASE = os.environ.get('LIBRARY_DATABASE', 'library.db')
+
+# Connection pool configuration
+POOL_SIZE = int(os.environ.get('LIBRARY_DB_POOL_SIZE', '5'))
+POOL_TIMEOUT = float(os.environ.get('LIBRARY_DB_POOL_TIMEOUT', '5.0'))
+WRITE_POOL_SIZE = int(os.environ.get('LIBRARY_DB_WRITE_POOL_SIZE', '2'))
+
+# Book lookup cache configuration
+BOOK_CACHE_SIZE = int(os.environ.get('LIBRARY_BOOK_CACHE_SIZE', '10000'))
+BOOK_CACHE_TTL = float(os.environ.get('LIBRARY_BOOK_CACHE_TTL', '30'))
+
+# Days a returned copy set aside for the next hold waits for that patron to borrow it
+HOLD_PICKUP_DAYS = float(os.environ.get('LIBRARY_HOLD_PICKUP_DAYS', '3'))
+
+# Catalog change events kept for Last-Event-ID resumes; older ones are deleted every CATALOG_EVENT_TRIM_BATCH appends
+CATALOG_EVENT_HISTORY = int(os.environ.get('LIBRARY_EVENT_HISTORY_SIZE', '1024'))
+CATALOG_EVENT_TRIM_BATCH = int(os.environ.get('LIBRARY_EVENT_TRIM_BATCH', '64'))
+
+# In-memory catalog index, built by create_app when enabled
+CATALOG_INDEX = os.environ.get('LIBRARY_CATALOG_INDEX', '0').lower() in ('1', 'true', 'yes')
+
+# Storage profile applied to every new connection
+STORAGE_PROFILE = {
+    'journal_mode': os.environ.get('LIBRARY_DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('LIBRARY_DB_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('LIBRARY_DB_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(os.environ.get('LIBRARY_DB_CACHE_SIZE', '-16000')),  # negative values are KiB
+    'busy_timeout': int(os.environ.get('LIBRARY_DB_BUSY_TIMEOUT', '5000')),  # milliseconds
+}
+
+def apply_storage_profile(conn: sqlite3.Connection, readonly: bool = False):
+    """Apply STORAGE_PROFILE PRAGMAs to a new connection."""
+    profile = STORAGE_PROFILE
+    for name in ('journal_mode', 'synchronous'):
+        if not str(profile[name]).isalpha():
+            raise ValueError(f"Invalid {name} in storage profile: {profile[name]!r}")
+    conn.execute(f"PRAGMA busy_timeout = {int(profile['busy_timeout'])}")
+    if not readonly:
+        # journal_mode is stored in the database file, so only writers change it
+        conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {profile['synchronous']}")
+    conn.execute(f"PRAGMA mmap_size = {int(profile['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(profile['cache_size'])}")
+    if readonly:
+        conn.execute('PRAGMA query_only = ON')
 
 def get_db_connection():
     """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
+    with timed('sqlite.connect'):
+        conn = sqlite3.connect(DATABASE, factory=CONNECTION_FACTORY)
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    apply_storage_profile(conn)
     return conn
 
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections for one database file.
+
+    Each thread checks out at most one connection at a time. Nested checkouts
+    on the same thread reuse it, so a Flask request that holds a connection
+    for its whole lifetime shares it with every helper it calls. A read-only
+    pool opens its connections with mode=ro so readers never take write locks.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT, readonly: bool = False):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.readonly = readonly
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'checkouts': 0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'in_use': 0,
+        }
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _connect(self) -> sqlite3.Connection:
+        with timed('sqlite.connect'):
+            if self.readonly:
+                uri = Path(self.database).resolve().as_uri() + '?mode=ro'
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=CONNECTION_FACTORY)
+            else:
+                conn = sqlite3.connect(self.database, check_same_thread=False, factory=CONNECTION_FACTORY)
+        conn.row_factory = sqlite3.Row
+        apply_storage_profile(conn, self.readonly)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection for the current thread."""
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            local.depth += 1
+            return local.conn
+
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count('timeouts')
+            raise sqlite3.OperationalError('Database connection pool exhausted.')
+
+        conn = None
+        while conn is None:
+            try:
+                candidate = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(candidate):
+                conn = candidate
+                self._count('reused')
+            else:
+                self._count('health_check_failures')
+                candidate.close()
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+            self._count('created')
+
+        local.conn = conn
+        local.depth = 1
+        self._count('checkouts')
+        self._count('in_use')
+        return conn
+
+    def release(self):
+        """Give back the current thread's connection once its outermost checkout ends."""
+        local = self._local
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            return
+        local.depth -= 1
+        if local.depth > 0:
+            return
+
+        local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+        self._count('in_use', -1)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Context manager that checks out a connection and always releases it."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release()
+
+    def close(self):
+        """Close every idle connection held by the pool."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def metrics(self) -> Dict:
+        """Return a snapshot of the pool counters."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['readonly'] = self.readonly
+        stats['idle'] = self._idle.qsize()
+        return stats
+
+_pools: Dict[Tuple[str, bool], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(readonly: bool = False) -> ConnectionPool:
+    """Get the write (or read-only) connection pool for the configured database, creating it on first use."""
+    key = (DATABASE, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                size = POOL_SIZE if readonly else WRITE_POOL_SIZE
+                pool = ConnectionPool(DATABASE, size=size, readonly=readonly)
+                _pools[key] = pool
+    return pool
+
+def pooled_connection():
+    """Context manager yielding a pooled write connection for the configured database."""
+    return get_pool().connection()
+
+def read_connection():
+    """Context manager yielding a pooled read-only connection for the configured database."""
+    return get_pool(readonly=True).connection()
+
+def get_pool_metrics() -> Dict:
+    """
+    Get read and write pool counters for the configured database.
+
+    Only pools this process has already opened are reported; reading the
+    metrics never creates one.
+    """
+    metrics = {}
+    for name, readonly in (('read', True), ('write', False)):
+        pool = _pools.get((DATABASE, readonly))
+        if pool is not None:
+            metrics[name] = pool.metrics()
+    return metrics
+
+def close_pools():
+    """Close idle connections in every pool and forget the pools."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """
+    Run a unit of work as one write transaction.
+
+    Starts with BEGIN IMMEDIATE so the write lock is taken up front, commits
+    when the block exits normally and rolls back if it raises. A transaction
+    opened while another is active on the same connection joins the outer one.
+    """
+    with pooled_connection() as conn:
+        if conn.in_transaction:
+            yield conn
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+# Schema migrations applied by init_database, oldest first.
+# Each entry is (version, description, statements); append new versions, never edit applied ones.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, 'Index borrow_records hot queries', [
+        # get_patron_borrow_count / get_patron_borrowed_books: open loans per patron, in borrow order
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_open
+           ON borrow_records (patron_id, return_date, borrow_date)''',
+        # get_borrow_record: a patron's history for one book, newest first
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_patron_book
+           ON borrow_records (patron_id, book_id, borrow_date DESC)''',
+        # Open loans of a book, e.g. when closing a loan on return
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_book_open
+           ON borrow_records (book_id) WHERE return_date IS NULL''',
+    ]),
+    (2, 'Index books by title for keyset catalog pages', [
+        # Ordered (title, rowid) walk behind get_books_page
+        '''CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)''',
+    ]),
+    (3, 'Full-text search index on book title and author', [
+        # External-content FTS5 table over books; prefix indexes keep short prefix queries cheap
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+               title, author,
+               content='books', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+           )''',
+        # Keep the index in step with books; availability updates do not touch it
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+               INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+               INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+               INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+               INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+           END''',
+        # Index books that existed before this migration
+        '''INSERT INTO books_fts (books_fts) VALUES ('rebuild')''',
+    ]),
+    (4, 'Index open loans by due date for batch fee runs', [
+        # Overdue sweeps: open loans whose due_date has passed
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_open_due
+           ON borrow_records (due_date) WHERE return_date IS NULL''',
+    ]),
+    (5, 'Materialized per-patron loan summary', [
+        # open_loans and last_activity are kept exact by every loan write;
+        # overdue_loans and outstanding_fees are as of refreshed_at
+        '''CREATE TABLE IF NOT EXISTS patron_summary (
+               patron_id TEXT PRIMARY KEY,
+               open_loans INTEGER NOT NULL DEFAULT 0,
+               overdue_loans INTEGER NOT NULL DEFAULT 0,
+               outstanding_fees REAL NOT NULL DEFAULT 0.0,
+               last_activity TEXT,
+               refreshed_at TEXT
+           )''',
+        '''INSERT OR REPLACE INTO patron_summary (patron_id, open_loans, last_activity)
+           SELECT patron_id,
+                  SUM(return_date IS NULL),
+                  MAX(MAX(borrow_date), COALESCE(MAX(return_date), ''))
+           FROM borrow_records
+           GROUP BY patron_id''',
+    ]),
+    (6, 'Payment job queue', [
+        '''CREATE TABLE IF NOT EXISTS payments (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               kind TEXT NOT NULL,
+               patron_id TEXT,
+               book_id INTEGER,
+               amount REAL NOT NULL,
+               description TEXT,
+               original_transaction_id TEXT,
+               status TEXT NOT NULL DEFAULT 'queued',
+               transaction_id TEXT,
+               message TEXT,
+               attempts INTEGER NOT NULL DEFAULT 0,
+               created_at TEXT NOT NULL,
+               claimed_at TEXT,
+               completed_at TEXT
+           )''',
+        'CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status, id)',
+    ]),
+    (7, 'Payment ledger idempotency keys and refund tracking', [
+        'ALTER TABLE payments ADD COLUMN borrow_id INTEGER',
+        'ALTER TABLE payments ADD COLUMN idempotency_key TEXT',
+        'ALTER TABLE payments ADD COLUMN refunded_amount REAL NOT NULL DEFAULT 0.0',
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_idempotency_key
+           ON payments (idempotency_key) WHERE idempotency_key IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_payments_transaction
+           ON payments (transaction_id) WHERE transaction_id IS NOT NULL''',
+        # Covers the paid-fee lookup in the patron status report
+        '''CREATE INDEX IF NOT EXISTS idx_payments_patron_paid
+           ON payments (patron_id, borrow_id, amount, refunded_amount)
+           WHERE kind = 'charge' AND status = 'succeeded'
+        ''',
+    ]),
+    (8, 'Index borrow_records by borrow date for history exports', [
+        # iter_borrow_history: date range scans in (borrow_date, id) order without a sort
+        'CREATE INDEX IF NOT EXISTS idx_borrow_records_borrow_date ON borrow_records (borrow_date)',
+    ]),
+    (9, 'Resumable overdue notice runs', [
+        # iter_overdue_loans_by_patron: open loans in (patron_id, due_date) order, resumed after a patron
+        '''CREATE INDEX IF NOT EXISTS idx_borrow_records_open_patron_due
+           ON borrow_records (patron_id, due_date) WHERE return_date IS NULL''',
+        # last_patron_id is the checkpoint: every patron up to it has been dealt with
+        '''CREATE TABLE IF NOT EXISTS notice_runs (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               as_of TEXT NOT NULL,
+               status TEXT NOT NULL DEFAULT 'running',
+               last_patron_id TEXT,
+               patrons_notified INTEGER NOT NULL DEFAULT 0,
+               loans_notified INTEGER NOT NULL DEFAULT 0,
+               failures INTEGER NOT NULL DEFAULT 0,
+               started_at TEXT NOT NULL,
+               updated_at TEXT NOT NULL,
+               finished_at TEXT
+           )''',
+        '''CREATE TABLE IF NOT EXISTS notice_failures (
+               run_id INTEGER NOT NULL REFERENCES notice_runs (id),
+               patron_id TEXT NOT NULL,
+               loans INTEGER NOT NULL,
+               error TEXT NOT NULL,
+               PRIMARY KEY (run_id, patron_id)
+           )''',
+    ]),
+    (10, 'Holds queue for unavailable books', [
+        # status: waiting -> ready (a copy is set aside until expires_at) -> fulfilled,
+        # or expired / cancelled
+        '''CREATE TABLE IF NOT EXISTS holds (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               book_id INTEGER NOT NULL REFERENCES books (id),
+               patron_id TEXT NOT NULL,
+               priority INTEGER NOT NULL DEFAULT 0,
+               status TEXT NOT NULL DEFAULT 'waiting',
+               created_at TEXT NOT NULL,
+               ready_at TEXT,
+               expires_at TEXT,
+               closed_at TEXT
+           )''',
+        # Each book's queue in allocation order: highest priority first, then first come first served.
+        # The head is one index seek, and a position counts the entries ahead of it
+        '''CREATE INDEX IF NOT EXISTS idx_holds_queue
+           ON holds (book_id, priority DESC, id) WHERE status = 'waiting'
+        ''',
+        # At most one active hold per patron and book
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_holds_active
+           ON holds (patron_id, book_id) WHERE status IN ('waiting', 'ready')''',
+        # Copies set aside for holds, by book and expiry
+        '''CREATE INDEX IF NOT EXISTS idx_holds_ready
+           ON holds (book_id, expires_at) WHERE status = 'ready'
+        ''',
+    ]),
+    (11, 'Catalog change feed shared by every server process', [
+        # Ids are assigned under the write lock, so they increase in commit order across processes
+        '''CREATE TABLE IF NOT EXISTS catalog_events (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               event_type TEXT NOT NULL,
+               data TEXT NOT NULL,
+               created_at TEXT NOT NULL
+           )''',
+    ]),
+]
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """
+    Apply every migration newer than the recorded schema version.
+
+    Each migration runs in its own transaction together with its
+    schema_version row, so a failed migration leaves nothing half-applied.
+    The version is checked again once the write lock is held, so processes
+    starting together apply each migration once.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    ''')
+    conn.commit()
+    current = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have applied it since the version was read
+            current = conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+            if version <= current:
+                conn.commit()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                'INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)',
+                (version, description, datetime.now().isoformat())
+            )
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied.append(version)
+    return applied
+
+def get_schema_version() -> int:
+    """Get the latest applied schema migration version (0 if none)."""
+    with read_connection() as conn:
+        row = conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+        ).fetchone()
+        if row is None:
+            return 0
+        return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
 def init_database():
     """Initialize the database with required tables."""
     conn = get_db_connection()
@@ -46,6 +519,9 @@ def init_database():
     ''')
     
     conn.commit()
+    
+    # Bring indexes and later schema changes up to date
+    apply_migrations(conn)
     conn.close()
 
 def add_sample_data():
@@ -86,6 +562,9 @@ def add_sample_data():
         # Update available copies for 1984
         conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
         
+        # Count the sample loans in the patron summary
+        rebuild_patron_summary(conn, datetime.now())
+        
         conn.commit()
     
     conn.close()
@@ -94,56 +573,232 @@ def add_sample_data():
 
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
-    conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    conn.close()
+    index = get_catalog_index()
+    if index is not None:
+        return [index.as_dict(record) for record in index.iter_by_title()]
+    with read_connection() as conn:
+        books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
     return [dict(book) for book in books]
 
+def get_books_page(limit: int, after: Optional[Tuple[str, int]] = None,
+                   records: bool = False) -> Tuple[List, Optional[Tuple[str, int]]]:
+    """
+    Get one page of books ordered by (title, id) using keyset pagination.
+
+    Args:
+        limit: Maximum number of books to return
+        after: (title, id) of the last book on the previous page, or None for the first page
+        records: Return the catalog index's shared BookRecord objects instead of
+            dicts when the index is enabled (read-only use such as templates)
+
+    Returns:
+        tuple: (books, cursor for the next page or None if this is the last page)
+    """
+    index = get_catalog_index()
+    if index is not None:
+        books, next_cursor = index.page(limit, after)
+        return (books if records else [index.as_dict(book) for book in books]), next_cursor
+    with read_connection() as conn:
+        if after is None:
+            rows = conn.execute(
+                'SELECT * FROM books ORDER BY title, id LIMIT ?', (limit + 1,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                'SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT ?',
+                (after[0], after[1], limit + 1)
+            ).fetchall()
+    
+    books = [dict(book) for book in rows[:limit]]
+    next_cursor = (books[-1]['title'], books[-1]['id']) if len(rows) > limit else None
+    return books, next_cursor
+
+# Book rows are cached under ('id', database, book_id); ('isbn', database, isbn) maps to the id.
+# Only hits are cached, and every write to a book invalidates its id entry after commit.
+book_cache = LRUCache(BOOK_CACHE_SIZE, BOOK_CACHE_TTL)
+
+def _book_key(book_id: int) -> tuple:
+    return ('id', DATABASE, book_id)
+
+def _isbn_key(isbn: str) -> tuple:
+    return ('isbn', DATABASE, isbn)
+
+def _cache_book(book: Dict, token: int):
+    book_cache.put(_book_key(book['id']), book, token)
+    book_cache.put(_isbn_key(book['isbn']), book['id'], token)
+
+def invalidate_book(book_id: int):
+    """Drop a book from the lookup cache; call after committing any change to it."""
+    book_cache.invalidate(_book_key(book_id))
+    _refresh_catalog_index('id', [book_id])
+
+# Optional in-memory copy of the books table (see catalog_index.py). Writers
+# refresh the affected rows after commit, next to the book cache invalidation.
+_catalog_index: Optional[CatalogIndex] = None
+_catalog_refresh_lock = threading.Lock()
+
+def build_catalog_index() -> CatalogIndex:
+    """Load every book of the configured database into a new catalog index and start using it."""
+    global _catalog_index
+    with read_connection() as conn:
+        cursor = conn.execute(f'SELECT {", ".join(BOOK_FIELDS)} FROM books')
+        _catalog_index = CatalogIndex(DATABASE).load(tuple(row) for row in cursor)
+    return _catalog_index
+
+def drop_catalog_index():
+    """Stop using the catalog index; reads go back to SQLite."""
+    global _catalog_index
+    _catalog_index = None
+
+def get_catalog_index() -> Optional[CatalogIndex]:
+    """The catalog index for the configured database, or None if none is built."""
+    index = _catalog_index
+    return index if index is not None and index.database == DATABASE else None
+
+def get_catalog_index_stats() -> Optional[Dict]:
+    """Counters and memory footprint of the catalog index, or None if none is built."""
+    index = get_catalog_index()
+    return index.stats() if index is not None else None
+
+def _refresh_catalog_index(column: str, values: List) -> List[BookRecord]:
+    """Reload books by id or isbn into the catalog index, if one is in use."""
+    index = get_catalog_index()
+    if index is None or not values:
+        return []
+    refreshed = []
+    # Read and apply under one lock: two writers refreshing the same book
+    # after their commits must not apply their reads in the opposite order
+    with _catalog_refresh_lock, read_connection() as conn:
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            rows = conn.execute(
+                f'SELECT {", ".join(BOOK_FIELDS)} FROM books WHERE {column} IN ({",".join("?" * len(batch))})', batch
+            ).fetchall()
+            refreshed.extend(index.upsert(tuple(row)) for row in rows)
+    return refreshed
+
+def get_book_cache_stats() -> Dict:
+    """Get hit, miss and eviction counters for the book lookup cache."""
+    return book_cache.stats()
+
 def get_book_by_id(book_id: int) -> Optional[Dict]:
     """Get a specific book by ID."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    index = get_catalog_index()
+    if index is not None:
+        book = index.get_dict(book_id)
+        if book is not None or not isinstance(book_id, int):
+            return book
+        # Not indexed: possibly added by another process
+        return index.as_dict(next(iter(_refresh_catalog_index('id', [book_id])), None))
+    
+    cacheable = isinstance(book_id, int)
+    if cacheable:
+        cached = book_cache.get(_book_key(book_id))
+        if cached is not None:
+            return dict(cached)
+    
+    token = book_cache.token()
+    with read_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if not book:
+        return None
+    book = dict(book)
+    if cacheable:
+        _cache_book(book, token)
+    return dict(book)
 
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
     """Get a specific book by ISBN."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    index = get_catalog_index()
+    if index is not None:
+        book = index.get_dict_by_isbn(isbn)
+        if book is not None:
+            return book
+        return index.as_dict(next(iter(_refresh_catalog_index('isbn', [isbn])), None))
+    
+    book_id = book_cache.get(_isbn_key(isbn))
+    if book_id is not None:
+        cached = book_cache.get(_book_key(book_id))
+        if cached is not None and cached['isbn'] == isbn:
+            return dict(cached)
+    
+    token = book_cache.token()
+    with read_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
+    if not book:
+        return None
+    book = dict(book)
+    _cache_book(book, token)
+    return dict(book)
 
 # Newly added function
 def get_book_by_author(author: str) -> Optional[Dict]:
     """Get a specific book by author."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE author LIKE LOWER(?)', (f"%{author}%",)).fetchall()
-    conn.close()
-    return [dict(r) for r in book]
+    return search_books_fulltext(author, 'author')
 
 # Newly added function
 def get_book_by_title(title: str) -> Optional[Dict]:
     """Get a specific book by title."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE title LIKE LOWER(?)', (f"%{title}%",)).fetchall()
-    conn.close()
-    return [dict(r) for r in book]
+    return search_books_fulltext(title, 'title')
+
+SEARCH_LIMIT = 100
+
+def build_fulltext_query(term: str, field: str) -> Optional[str]:
+    """
+    Turn free text into an FTS5 query matching every word as a prefix within one column.
+
+    Returns:
+        str: MATCH expression, or None if the term has no searchable words
+    """
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    return f'{field} : (' + ' AND '.join(f'"{word}"*' for word in words) + ')'
+
+def search_books_fulltext(term: str, field: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+    """
+    Search book titles or authors through the books_fts index, best matches first.
+
+    Args:
+        term: Free-text search; each word matches as a case-insensitive prefix
+        field: 'title' or 'author'
+        limit: Maximum number of results
+
+    Returns:
+        list: Matching books ranked by bm25
+    """
+    if field not in ('title', 'author'):
+        raise ValueError(f"Unsupported search field: {field!r}")
+    query = build_fulltext_query(term, field)
+    if query is None:
+        return []
+
+    with read_connection() as conn:
+        books = conn.execute('''
+            SELECT b.*
+            FROM books_fts
+            JOIN books b ON b.id = books_fts.rowid
+            WHERE books_fts MATCH ?
+            ORDER BY bm25(books_fts), b.title
+            LIMIT ?
+        ''', (query, limit)).fetchall()
+    return [dict(book) for book in books]
 
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
-    conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.return_date IS NULL
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
+    with read_connection() as conn:
+        records = conn.execute('''
+            SELECT br.*, b.title, b.author 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? AND br.return_date IS NULL
+            ORDER BY br.borrow_date
+        ''', (patron_id,)).fetchall()
     
     borrowed_books = []
     for record in records:
         borrowed_books.append({
+            'borrow_id': record['id'],
             'book_id': record['book_id'],
             'title': record['title'],
             'author': record['author'],
@@ -156,20 +811,20 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
 
 # Newly added function
 def get_borrow_record(patron_id: str, book_id: Optional[int] = None) -> List[Dict]:
-    """Get borrowed book record for a patron and book."""
-    conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.book_id = ?
-        ORDER BY br.borrow_date DESC
-    ''', (patron_id, book_id)).fetchall()
-    conn.close()
+    """Get borrowed book records for a patron and book, or for all of the patron's books."""
+    with read_connection() as conn:
+        records = conn.execute('''
+            SELECT br.*, b.title, b.author 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? AND (? IS NULL OR br.book_id = ?)
+            ORDER BY br.borrow_date DESC
+        ''', (patron_id, book_id, book_id)).fetchall()
     
     book_record = []
     for record in records:
         book_record.append({
+            'borrow_id': record['id'],
             'patron_id': record['patron_id'],
             'book_id': record['book_id'],
             'title': record['title'],
@@ -180,72 +835,1107 @@ def get_borrow_record(patron_id: str, book_id: Optional[int] = None) -> List[Dic
     
     return book_record
 
+# Late fee for one loan, computed in SQL for batch runs. Mirrors calculate_late_fee_for_book:
+# days overdue rounded up (to the millisecond), $0.50/day for 7 days, then $1.00/day, capped at $15.00.
+# The inner query must expose id, patron_id, book_id, due_date and end_date.
+LOAN_FEE_SQL = '''
+    SELECT id AS borrow_id, patron_id, book_id, due_date, days_overdue,
+           CASE
+               WHEN days_overdue <= 0 THEN 0.0
+               WHEN days_overdue <= 7 THEN days_overdue * 0.5
+               ELSE MIN(3.5 + (days_overdue - 7) * 1.0, 15.0)
+           END AS fee_amount
+    FROM (
+        SELECT id, patron_id, book_id, due_date,
+               CASE WHEN late_ms > 0 THEN (late_ms + 86399999) / 86400000 ELSE 0 END AS days_overdue
+        FROM (
+            SELECT id, patron_id, book_id, due_date,
+                   CAST(ROUND((julianday(end_date) - julianday(due_date)) * 86400000) AS INTEGER) AS late_ms
+            FROM ({loans})
+        )
+    )
+'''
+
+def _open_loans_sql(overdue_only: bool, after_id: bool = False) -> str:
+    """Inner query for LOAN_FEE_SQL over open loans; parameters are (as_of[, as_of][, after_id])."""
+    conditions = ['return_date IS NULL']
+    if overdue_only:
+        conditions.append('due_date < ?')
+    if after_id:
+        conditions.append('id > ?')
+    return (
+        'SELECT id, patron_id, book_id, due_date, ? AS end_date FROM borrow_records '
+        f'WHERE {" AND ".join(conditions)}'
+    )
+
+def iter_loan_fees(as_of: datetime, overdue_only: bool = True, after_id: Optional[int] = None,
+                   limit: Optional[int] = None, batch_size: int = 1000) -> Iterator[Dict]:
+    """
+    Stream late fees for open loans, computed in SQL, in borrow record id order.
+    
+    Args:
+        as_of: Time to measure lateness against
+        overdue_only: Only loans already past their due date
+        after_id: Resume after this borrow record id
+        limit: Stop after this many loans
+        batch_size: Rows fetched from SQLite per round trip
+        
+    Yields:
+        dict: borrow_id, patron_id, book_id, due_date, days_overdue, fee_amount
+    """
+    params: list = [as_of.isoformat()]
+    if overdue_only:
+        params.append(as_of.isoformat())
+    if after_id is not None:
+        params.append(after_id)
+    sql = LOAN_FEE_SQL.format(loans=_open_loans_sql(overdue_only, after_id is not None)) + ' ORDER BY borrow_id'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    
+    with read_connection() as conn:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+BORROW_HISTORY_COLUMNS = (
+    'borrow_id', 'patron_id', 'book_id', 'borrow_date', 'due_date', 'return_date', 'days_overdue', 'fee_amount'
+)
+
+def iter_borrow_history(as_of: datetime, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        patron_id: Optional[str] = None, overdue_only: bool = False,
+                        batch_size: int = 1000) -> Iterator[tuple]:
+    """
+    Stream borrow records with their late fees, oldest borrow first.
+    
+    Rows are yielded as plain tuples of the stored column values (dates stay
+    ISO strings), fetched batch_size at a time, so memory use does not grow
+    with the number of records.
+    
+    Args:
+        as_of: Time to measure lateness of open loans against
+        start: Only loans borrowed at or after this time
+        end: Only loans borrowed before this time
+        patron_id: Only this patron's loans
+        overdue_only: Only loans returned late or still open past their due date
+        batch_size: Rows fetched from SQLite per round trip
+        
+    Yields:
+        tuple: values in BORROW_HISTORY_COLUMNS order
+    """
+    conditions = []
+    if start is not None:
+        conditions.append('borrow_date >= :start')
+    if end is not None:
+        conditions.append('borrow_date < :end')
+    if patron_id is not None:
+        conditions.append('patron_id = :patron_id')
+    if overdue_only:
+        conditions.append('COALESCE(return_date, :as_of) > due_date')
+    loans = f'''
+        SELECT id, patron_id, book_id, due_date, COALESCE(return_date, :as_of) AS end_date
+        FROM borrow_records
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+    '''
+    params = {
+        'as_of': as_of.isoformat(),
+        'start': start.isoformat() if start else None,
+        'end': end.isoformat() if end else None,
+        'patron_id': patron_id,
+    }
+    
+    with read_connection() as conn:
+        cursor = conn.execute(f'''
+            SELECT br.id, br.patron_id, br.book_id, br.borrow_date, br.due_date, br.return_date,
+                   f.days_overdue, f.fee_amount
+            FROM borrow_records br
+            JOIN ({LOAN_FEE_SQL.format(loans=loans)}) f ON f.borrow_id = br.id
+            ORDER BY br.borrow_date, br.id
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield tuple(row)
+
+def iter_overdue_loans_by_patron(as_of: datetime, after_patron_id: Optional[str] = None,
+                                 batch_size: int = 1000) -> Iterator[Tuple[str, List[Dict]]]:
+    """
+    Stream open overdue loans with their late fees, grouped by patron in patron id order.
+    
+    One cursor walks idx_borrow_records_open_patron_due, fetching batch_size
+    rows per round trip, so only the current patron's loans are held in memory.
+    
+    Args:
+        as_of: Loans due before this time are overdue; fees are measured against it
+        after_patron_id: Resume after this patron
+        batch_size: Rows fetched from SQLite per round trip
+        
+    Yields:
+        tuple: (patron_id, loans) where each loan has borrow_id, book_id, title,
+            due_date, days_overdue and fee_amount, oldest due date first
+    """
+    loans = '''
+        SELECT id, patron_id, book_id, due_date, :as_of AS end_date
+        FROM borrow_records INDEXED BY idx_borrow_records_open_patron_due
+        WHERE return_date IS NULL AND patron_id > :after AND due_date < :as_of
+    '''
+    params = {'as_of': as_of.isoformat(), 'after': after_patron_id or ''}
+    
+    with read_connection() as conn:
+        cursor = conn.execute(f'''
+            SELECT f.borrow_id, f.patron_id, f.book_id, b.title, f.due_date, f.days_overdue, f.fee_amount
+            FROM ({LOAN_FEE_SQL.format(loans=loans)}) f
+            LEFT JOIN books b ON b.id = f.book_id
+            ORDER BY f.patron_id, f.due_date, f.borrow_id
+        ''', params)
+        patron_id, patron_loans = None, []
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                if row['patron_id'] != patron_id:
+                    if patron_loans:
+                        yield patron_id, patron_loans
+                    patron_id, patron_loans = row['patron_id'], []
+                loan = dict(row)
+                del loan['patron_id']
+                patron_loans.append(loan)
+        if patron_loans:
+            yield patron_id, patron_loans
+
+def summarize_loan_fees(as_of: datetime, overdue_only: bool = True) -> Dict:
+    """Aggregate late fees over open loans in one query: loan count, patron count and fee total."""
+    params = [as_of.isoformat(), as_of.isoformat()] if overdue_only else [as_of.isoformat()]
+    sql = LOAN_FEE_SQL.format(loans=_open_loans_sql(overdue_only))
+    with read_connection() as conn:
+        row = conn.execute(f'''
+            SELECT COUNT(*) AS loans,
+                   COUNT(DISTINCT patron_id) AS patrons,
+                   SUM(CASE WHEN fee_amount > 0 THEN 1 ELSE 0 END) AS loans_with_fees,
+                   COALESCE(SUM(fee_amount), 0.0) AS total_fees
+            FROM ({sql})
+        ''', params).fetchone()
+    summary = dict(row)
+    summary['loans_with_fees'] = summary['loans_with_fees'] or 0
+    summary['total_fees'] = round(summary['total_fees'], 2)
+    return summary
+
+# Late fee still owed on a LOAN_FEE_SQL row f: its fee less the net amount paid for that loan
+# (charges less refunds), looked up on the covering idx_payments_patron_paid index
+UNPAID_FEE_SQL = '''
+    MAX(f.fee_amount - COALESCE((
+        SELECT SUM(amount - refunded_amount) FROM payments
+        WHERE patron_id = f.patron_id AND borrow_id = f.borrow_id AND kind = 'charge' AND status = 'succeeded'
+    ), 0.0), 0.0)
+'''
+
+def _refresh_patron_summary(conn: sqlite3.Connection, patron_id: str, activity: datetime):
+    """
+    Recompute one patron's summary row from their open loans.
+    
+    Call inside the transaction that changed the patron's loans, so the
+    summary commits (or rolls back) together with the loan write.
+    """
+    loans = 'SELECT id, patron_id, book_id, due_date, ? AS end_date FROM borrow_records WHERE patron_id = ? AND return_date IS NULL'
+    conn.execute(f'''
+        INSERT INTO patron_summary (patron_id, open_loans, overdue_loans, outstanding_fees, last_activity, refreshed_at)
+        SELECT ?, COUNT(*), COALESCE(SUM(f.days_overdue > 0), 0),
+               COALESCE(SUM({UNPAID_FEE_SQL}), 0.0), ?, ?
+        FROM ({LOAN_FEE_SQL.format(loans=loans)}) f
+        WHERE 1
+        ON CONFLICT (patron_id) DO UPDATE SET
+            open_loans = excluded.open_loans,
+            overdue_loans = excluded.overdue_loans,
+            outstanding_fees = excluded.outstanding_fees,
+            last_activity = excluded.last_activity,
+            refreshed_at = excluded.refreshed_at
+    ''', (patron_id, activity.isoformat(), activity.isoformat(), activity.isoformat(), patron_id))
+
+def rebuild_patron_summary(conn: sqlite3.Connection, as_of: datetime) -> int:
+    """
+    Recompute every patron_summary row from borrow_records on the given connection.
+    The caller commits.
+    
+    Returns:
+        int: Number of patron rows written
+    """
+    loans = 'SELECT id, patron_id, book_id, due_date, ? AS end_date FROM borrow_records WHERE return_date IS NULL'
+    conn.execute('DELETE FROM patron_summary')
+    return conn.execute(f'''
+        INSERT INTO patron_summary (patron_id, open_loans, overdue_loans, outstanding_fees, last_activity, refreshed_at)
+        SELECT activity.patron_id,
+               COALESCE(fees.open_loans, 0),
+               COALESCE(fees.overdue_loans, 0),
+               COALESCE(fees.outstanding_fees, 0.0),
+               activity.last_activity,
+               ?
+        FROM (
+            SELECT patron_id, MAX(MAX(borrow_date), COALESCE(MAX(return_date), '')) AS last_activity
+            FROM borrow_records
+            GROUP BY patron_id
+        ) activity
+        LEFT JOIN (
+            SELECT patron_id,
+                   COUNT(*) AS open_loans,
+                   SUM(days_overdue > 0) AS overdue_loans,
+                   SUM({UNPAID_FEE_SQL}) AS outstanding_fees
+            FROM ({LOAN_FEE_SQL.format(loans=loans)}) f
+            GROUP BY patron_id
+        ) fees ON fees.patron_id = activity.patron_id
+    ''', (as_of.isoformat(), as_of.isoformat())).rowcount
+
+def check_patron_summary() -> Dict:
+    """
+    Compare stored open-loan counts with borrow_records without changing anything.
+    
+    Returns:
+        dict: patrons (rows checked) and drifted (patrons whose open_loans is wrong or missing)
+    """
+    with read_connection() as conn:
+        row = conn.execute('''
+            WITH actual AS (
+                SELECT patron_id, SUM(return_date IS NULL) AS open_loans
+                FROM borrow_records
+                GROUP BY patron_id
+            )
+            SELECT
+                (SELECT COUNT(*) FROM actual) AS patrons,
+                (SELECT COUNT(*) FROM actual
+                 LEFT JOIN patron_summary s ON s.patron_id = actual.patron_id
+                 WHERE s.patron_id IS NULL OR s.open_loans != actual.open_loans)
+                +
+                (SELECT COUNT(*) FROM patron_summary s
+                 WHERE s.open_loans != 0 AND s.patron_id NOT IN (SELECT patron_id FROM actual)) AS drifted
+        ''').fetchone()
+    return dict(row)
+
+def reconcile_patron_summary(as_of: Optional[datetime] = None) -> Dict:
+    """
+    Report drift in patron_summary, then rebuild it (refreshing overdue counts and fees) in one transaction.
+    
+    Returns:
+        dict: patrons, drifted (before the rebuild), rebuilt and as_of
+    """
+    as_of = as_of or datetime.now()
+    report = check_patron_summary()
+    with transaction() as conn:
+        report['rebuilt'] = rebuild_patron_summary(conn, as_of)
+    report['as_of'] = as_of.isoformat()
+    return report
+
+def get_patron_summary(patron_id: str) -> Optional[Dict]:
+    """
+    Get a patron's materialized loan summary, or None if they have never borrowed.
+
+    outstanding_fees is the late fee on open loans less what has been paid for them, as of refreshed_at.
+    """
+    with read_connection() as conn:
+        row = conn.execute('SELECT * FROM patron_summary WHERE patron_id = ?', (patron_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_patron_report_rows(patron_id: str, as_of: datetime, history_limit: int, history_offset: int = 0) -> Dict:
+    """
+    Fetch everything the patron status report needs in one query.
+
+    Returns the patron-wide history_total and last_activity, computed
+    before paging, and under 'loans' every open loan plus one page of the
+    full borrowing history (newest first), each with its late fee as of
+    as_of and the net amount already paid for it. The totals come back
+    even when the page and the open loans are both empty.
+    """
+    loans = '''
+        SELECT id, patron_id, book_id, due_date, COALESCE(return_date, :as_of) AS end_date
+        FROM patron_loans
+        WHERE return_date IS NULL OR position BETWEEN :first AND :last
+    '''
+    with read_connection() as conn:
+        rows = conn.execute(f'''
+            WITH patron_loans AS (
+                SELECT id, patron_id, book_id, borrow_date, due_date, return_date,
+                       ROW_NUMBER() OVER (ORDER BY borrow_date DESC, id DESC) AS position
+                FROM borrow_records
+                WHERE patron_id = :patron_id
+            ),
+            totals AS (
+                SELECT COUNT(*) AS history_total,
+                       MAX(MAX(borrow_date, COALESCE(return_date, ''))) AS last_activity
+                FROM patron_loans
+            ),
+            paid AS (
+                SELECT borrow_id, SUM(amount - refunded_amount) AS paid FROM payments
+                WHERE patron_id = :patron_id AND kind = 'charge' AND status = 'succeeded' AND borrow_id IS NOT NULL
+                GROUP BY borrow_id
+            ),
+            report_loans AS (
+                SELECT l.id AS borrow_id, l.patron_id, l.book_id, b.title, b.author,
+                       l.borrow_date, l.due_date, l.return_date, l.position,
+                       f.days_overdue, f.fee_amount, COALESCE(paid.paid, 0.0) AS paid
+                FROM ({LOAN_FEE_SQL.format(loans=loans)}) f
+                JOIN patron_loans l ON l.id = f.borrow_id
+                JOIN books b ON b.id = l.book_id
+                LEFT JOIN paid ON paid.borrow_id = l.id
+            )
+            SELECT t.history_total, t.last_activity, r.*
+            FROM totals t
+            LEFT JOIN report_loans r ON 1
+            ORDER BY r.position
+        ''', {
+            'patron_id': patron_id,
+            'as_of': as_of.isoformat(),
+            'first': history_offset + 1,
+            'last': history_offset + history_limit,
+        }).fetchall()
+    return {
+        'history_total': rows[0]['history_total'],
+        'last_activity': rows[0]['last_activity'],
+        'loans': [dict(row) for row in rows if row['borrow_id'] is not None],
+    }
+
 def get_patron_borrow_count(patron_id: str) -> int:
     """Get the number of books currently borrowed by a patron."""
-    conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
-    conn.close()
-    return count
+    with read_connection() as conn:
+        row = conn.execute(
+            'SELECT open_loans FROM patron_summary WHERE patron_id = ?', (patron_id,)
+        ).fetchone()
+    return row['open_loans'] if row else 0
 
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+    with pooled_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, author, isbn, total_copies, available_copies))
+            conn.commit()
+            book_cache.invalidate(_isbn_key(isbn))
+            _refresh_catalog_index('isbn', [isbn])
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
+
+def get_existing_isbns(isbns: List[str]) -> set:
+    """Get which of the given ISBNs are already in the catalog."""
+    existing = set()
+    with read_connection() as conn:
+        # Stay under SQLite's default 999 bound-parameter limit
+        for start in range(0, len(isbns), 500):
+            batch = isbns[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            rows = conn.execute(f'SELECT isbn FROM books WHERE isbn IN ({placeholders})', batch).fetchall()
+            existing.update(row['isbn'] for row in rows)
+    return existing
+
+def insert_books_bulk(books: List[Tuple[str, str, str, int, int]]) -> List[str]:
+    """
+    Insert many books with executemany in one transaction.
+    
+    Args:
+        books: (title, author, isbn, total_copies, available_copies) tuples
+        
+    Returns:
+        list: ISBNs skipped because the catalog already had them (e.g. added concurrently)
+    """
+    with transaction() as conn:
+        # The write lock is held from BEGIN IMMEDIATE, so no other writer can add these ISBNs in between
+        existing = set()
+        isbns = [book[2] for book in books]
+        for start in range(0, len(isbns), 500):
+            batch = isbns[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            existing.update(row['isbn'] for row in
+                            conn.execute(f'SELECT isbn FROM books WHERE isbn IN ({placeholders})', batch))
+        conn.executemany('''
+            INSERT OR IGNORE INTO books (title, author, isbn, total_copies, available_copies)
             VALUES (?, ?, ?, ?, ?)
-        ''', (title, author, isbn, total_copies, available_copies))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+        ''', [book for book in books if book[2] not in existing])
+    book_cache.invalidate(*[_isbn_key(isbn) for isbn in isbns])
+    _refresh_catalog_index('isbn', isbns)
+    return [isbn for isbn in isbns if isbn in existing]
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with pooled_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            _refresh_patron_summary(conn, patron_id, borrow_date)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with pooled_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE books SET available_copies = available_copies + ? WHERE id = ?
+            ''', (change, book_id))
+            conn.commit()
+            invalidate_book(book_id)
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
+    with pooled_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE borrow_records 
+                SET return_date = ? 
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ''', (return_date.isoformat(), patron_id, book_id))
+            _refresh_patron_summary(conn, patron_id, return_date)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
+
+def borrow_book_atomic(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime, max_borrowed: int) -> str:
+    """
+    Borrow one copy of a book in a single transaction.
+
+    Availability and the patron's open-loan count (from patron_summary) are
+    read under the write lock taken by BEGIN IMMEDIATE, and the copy is taken
+    with a conditional UPDATE, so concurrent borrows cannot oversell. A copy
+    set aside for the patron's hold is taken in place of a shelf copy.
+
+    Returns:
+        str: 'borrowed', 'not_found', 'unavailable', 'limit_reached' or 'error'
+    """
+    changed = False
     try:
+        with transaction() as conn:
+            book = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+            if book is None:
+                return 'not_found'
+            ready = _ready_hold(conn, patron_id, book_id, borrow_date)
+            if ready is None and book['available_copies'] <= 0:
+                # Copies held past their pickup window go to the next hold or back on the shelf
+                changed = _release_expired_holds(conn, borrow_date, book_id) > 0
+                if not changed:
+                    return 'unavailable'
+                ready = _ready_hold(conn, patron_id, book_id, borrow_date)
+                book = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+                if ready is None and book['available_copies'] <= 0:
+                    return 'unavailable'
+
+            summary = conn.execute(
+                'SELECT open_loans FROM patron_summary WHERE patron_id = ?', (patron_id,)
+            ).fetchone()
+            if summary is not None and summary['open_loans'] >= max_borrowed:
+                return 'limit_reached'
+
+            if ready is None:
+                taken = conn.execute('''
+                    UPDATE books SET available_copies = available_copies - 1
+                    WHERE id = ? AND available_copies > 0
+                ''', (book_id,)).rowcount
+                if not taken:
+                    return 'unavailable'
+            # The loan fulfils the patron's hold, whether or not a copy was set aside for it
+            conn.execute('''
+                UPDATE holds SET status = 'fulfilled', closed_at = ?
+                WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')
+            ''', (borrow_date.isoformat(), patron_id, book_id))
+
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            _refresh_patron_summary(conn, patron_id, borrow_date)
+            _append_availability_event(conn, book_id)
+            changed = True
+    except sqlite3.Error:
+        return 'error'
+    finally:
+        # Passing on expired holds can shelve a copy even when the borrow itself fails
+        if changed:
+            invalidate_book(book_id)
+    return 'borrowed'
+
+def return_book_atomic(patron_id: str, book_id: int, return_date: datetime) -> bool:
+    """
+    Close the patron's oldest open loan of a book and restore the copy in a single transaction.
+
+    The copy goes to the first hold in the book's queue if there is one
+    (see allocate_copy), otherwise back on the shelf.
+
+    Returns:
+        bool: False if the patron has no open loan for the book or the write failed
+    """
+    try:
+        with transaction() as conn:
+            closed = conn.execute('''
+                UPDATE borrow_records SET return_date = ?
+                WHERE id = (
+                    SELECT id FROM borrow_records
+                    WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+                    ORDER BY borrow_date
+                    LIMIT 1
+                )
+            ''', (return_date.isoformat(), patron_id, book_id)).rowcount
+            if not closed:
+                return False
+
+            _allocate_copy(conn, book_id, return_date)
+            _refresh_patron_summary(conn, patron_id, return_date)
+            _append_availability_event(conn, book_id)
+    except sqlite3.Error:
+        return False
+
+    invalidate_book(book_id)
+    return True
+
+
+HOLD_STATUSES = ('waiting', 'ready', 'fulfilled', 'expired', 'cancelled')
+
+def _ready_hold(conn: sqlite3.Connection, patron_id: str, book_id: int, now: datetime) -> Optional[sqlite3.Row]:
+    """The patron's hold on a book with a copy set aside and still within its pickup window."""
+    return conn.execute('''
+        SELECT id FROM holds
+        WHERE patron_id = ? AND book_id = ? AND status = 'ready' AND expires_at > ?
+    ''', (patron_id, book_id, now.isoformat())).fetchone()
+
+def _allocate_copy(conn: sqlite3.Connection, book_id: int, now: datetime) -> Optional[str]:
+    """
+    Give a freed copy of a book to the head of its hold queue, or put it back on the shelf.
+
+    The head is the first entry of idx_holds_queue, so allocation is one
+    index seek however long the queue is.
+
+    Returns:
+        str: The patron whose hold is now ready, or None if the copy was shelved
+    """
+    hold = conn.execute('''
+        SELECT id, patron_id FROM holds
+        WHERE book_id = ? AND status = 'waiting'
+        ORDER BY priority DESC, id
+        LIMIT 1
+    ''', (book_id,)).fetchone()
+    if hold is None:
         conn.execute('''
-            UPDATE borrow_records 
-            SET return_date = ? 
-            WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
+            UPDATE books SET available_copies = available_copies + 1
+            WHERE id = ? AND available_copies < total_copies
+        ''', (book_id,))
+        return None
+    conn.execute(
+        "UPDATE holds SET status = 'ready', ready_at = ?, expires_at = ? WHERE id = ?",
+        (now.isoformat(), (now + timedelta(days=HOLD_PICKUP_DAYS)).isoformat(), hold['id'])
+    )
+    return hold['patron_id']
+
+def _release_expired_holds(conn: sqlite3.Connection, now: datetime, book_id: Optional[int] = None) -> int:
+    """Expire ready holds past their pickup window (of one book, or all) and pass each copy on."""
+    params: list = [now.isoformat()]
+    sql = "SELECT id, book_id FROM holds WHERE status = 'ready' AND expires_at <= ?"
+    if book_id is not None:
+        sql += ' AND book_id = ?'
+        params.append(book_id)
+    expired = conn.execute(sql + ' ORDER BY expires_at, id', params).fetchall()
+    for hold in expired:
+        conn.execute("UPDATE holds SET status = 'expired', closed_at = ? WHERE id = ?", (now.isoformat(), hold['id']))
+        _allocate_copy(conn, hold['book_id'], now)
+    return len(expired)
+
+def _hold_position_sql(alias: str) -> str:
+    """
+    1-based queue position of a waiting hold: 1 + the waiting holds ahead of it.
+
+    Two range counts on idx_holds_queue (higher priority; same priority and
+    earlier), so only the entries ahead are visited.
+    """
+    return f'''
+        CASE WHEN {alias}.status = 'waiting' THEN 1 + (
+            SELECT COUNT(*) FROM holds INDEXED BY idx_holds_queue
+            WHERE book_id = {alias}.book_id AND status = 'waiting' AND priority > {alias}.priority
+        ) + (
+            SELECT COUNT(*) FROM holds INDEXED BY idx_holds_queue
+            WHERE book_id = {alias}.book_id AND status = 'waiting' AND priority = {alias}.priority AND id < {alias}.id
+        ) END
+    '''
+
+def place_hold_atomic(patron_id: str, book_id: int, now: datetime, priority: int = 0) -> Tuple[str, Optional[Dict]]:
+    """
+    Join a book's hold queue in a single transaction.
+
+    Holds are only taken for books with no copy on the shelf, once copies
+    held past their pickup window have been passed on.
+
+    Returns:
+        tuple: (outcome, hold) where outcome is 'placed', 'exists' (the patron's
+            active hold is returned), 'available', 'borrowed' (the patron has
+            the book out), 'not_found' or 'error'
+    """
+    released = 0
+    try:
+        with transaction() as conn:
+            book = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+            if book is None:
+                return 'not_found', None
+            released = _release_expired_holds(conn, now, book_id)
+            if released:
+                book = conn.execute('SELECT available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+
+            active = conn.execute(
+                "SELECT id FROM holds WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')",
+                (patron_id, book_id)
+            ).fetchone()
+            if active is not None:
+                return 'exists', _get_hold(conn, active['id'])
+            if book['available_copies'] > 0:
+                return 'available', None
+            if conn.execute(
+                'SELECT 1 FROM borrow_records WHERE patron_id = ? AND book_id = ? AND return_date IS NULL',
+                (patron_id, book_id)
+            ).fetchone():
+                return 'borrowed', None
+
+            hold_id = conn.execute(
+                'INSERT INTO holds (book_id, patron_id, priority, created_at) VALUES (?, ?, ?, ?)',
+                (book_id, patron_id, priority, now.isoformat())
+            ).lastrowid
+            return 'placed', _get_hold(conn, hold_id)
+    except sqlite3.Error:
+        return 'error', None
+    finally:
+        if released:
+            invalidate_book(book_id)
+
+def _get_hold(conn: sqlite3.Connection, hold_id: int) -> Dict:
+    row = conn.execute(f'''
+        SELECT h.id AS hold_id, h.book_id, h.patron_id, h.priority, h.status, h.created_at, h.ready_at,
+               h.expires_at, {_hold_position_sql('h')} AS position
+        FROM holds h WHERE h.id = ?
+    ''', (hold_id,)).fetchone()
+    return dict(row)
+
+def get_active_hold(patron_id: str, book_id: int) -> Optional[Dict]:
+    """A patron's waiting or ready hold on a book, with its queue position while waiting."""
+    with read_connection() as conn:
+        row = conn.execute(
+            "SELECT id FROM holds WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')",
+            (patron_id, book_id)
+        ).fetchone()
+        return _get_hold(conn, row['id']) if row else None
+
+def get_hold_queue_length(book_id: int) -> int:
+    """Waiting holds on a book."""
+    with read_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM holds INDEXED BY idx_holds_queue WHERE book_id = ? AND status = 'waiting'",
+            (book_id,)
+        ).fetchone()[0]
+
+def cancel_hold_atomic(patron_id: str, book_id: int, now: datetime) -> bool:
+    """
+    Cancel a patron's active hold; a copy set aside for it goes to the next hold.
+
+    Returns:
+        bool: False if the patron has no active hold on the book or the write failed
+    """
+    try:
+        with transaction() as conn:
+            hold = conn.execute(
+                "SELECT id, status FROM holds WHERE patron_id = ? AND book_id = ? AND status IN ('waiting', 'ready')",
+                (patron_id, book_id)
+            ).fetchone()
+            if hold is None:
+                return False
+            conn.execute("UPDATE holds SET status = 'cancelled', closed_at = ? WHERE id = ?", (now.isoformat(), hold['id']))
+            if hold['status'] == 'ready':
+                _allocate_copy(conn, book_id, now)
+            _append_availability_event(conn, book_id)
+    except sqlite3.Error:
         return False
+
+    invalidate_book(book_id)
+    return True
+
+def expire_holds(now: datetime) -> List[int]:
+    """
+    Expire every ready hold past its pickup window, passing each copy to the
+    next hold on the book or back on the shelf.
+
+    Returns:
+        list: The book id of each expired hold
+    """
+    with transaction() as conn:
+        book_ids = [row['book_id'] for row in conn.execute(
+            "SELECT book_id FROM holds WHERE status = 'ready' AND expires_at <= ?", (now.isoformat(),)
+        ).fetchall()]
+        _release_expired_holds(conn, now)
+        for book_id in sorted(set(book_ids)):
+            _append_availability_event(conn, book_id)
+    for book_id in set(book_ids):
+        invalidate_book(book_id)
+    return book_ids
+
+
+# 'unknown': the attempt may have reached the gateway but its outcome was never recorded (its worker
+# or request died, or the gateway call timed out). Never retried automatically; see record_reconciled_payment
+PAYMENT_STATUSES = ('queued', 'processing', 'succeeded', 'failed', 'unknown')
+PAYMENT_OUTCOME_UNKNOWN = "Outcome unknown: the attempt may have reached the gateway. Reconcile it before trying again."
+
+def enqueue_payment(kind: str, amount: float, patron_id: Optional[str] = None, book_id: Optional[int] = None,
+                    description: str = '', original_transaction_id: Optional[str] = None) -> int:
+    """
+    Queue a gateway charge or refund for the payment workers.
+
+    Returns:
+        int: The payment job id
+    """
+    with transaction() as conn:
+        return conn.execute('''
+            INSERT INTO payments (kind, patron_id, book_id, amount, description, original_transaction_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, patron_id, book_id, amount, description, original_transaction_id,
+              datetime.now().isoformat())).lastrowid
+
+def reserve_payment(idempotency_key: str, kind: str, amount: float, patron_id: Optional[str] = None,
+                    book_id: Optional[int] = None, borrow_id: Optional[int] = None, description: str = '',
+                    status: str = 'queued', lease: float = 60.0) -> Tuple[Dict, bool]:
+    """
+    Create or reuse the ledger row for an idempotency key.
+
+    A key whose payment succeeded, is queued or processing, or has an
+    unknown outcome is returned untouched; a processing row past its lease
+    is marked unknown first, since its charge may have gone through.
+    Otherwise (new key or failed attempt) the row is reset to the given
+    status for a fresh attempt.
+
+    Args:
+        status: 'queued' for the worker queue, 'processing' when the caller
+            charges the gateway itself
+
+    Returns:
+        tuple: (ledger row, True if the caller should go ahead with this attempt)
+    """
+    now = datetime.now()
+    claimed_at = now.isoformat() if status == 'processing' else None
+    with transaction() as conn:
+        row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+        if row is not None:
+            if row['status'] == 'processing' and row['claimed_at'] < (now - timedelta(seconds=lease)).isoformat():
+                conn.execute("UPDATE payments SET status = 'unknown', message = ? WHERE id = ?",
+                             (PAYMENT_OUTCOME_UNKNOWN, row['id']))
+                row = conn.execute('SELECT * FROM payments WHERE id = ?', (row['id'],)).fetchone()
+            if row['status'] != 'failed':
+                return dict(row), False
+            conn.execute('''
+                UPDATE payments SET status = ?, amount = ?, description = ?, claimed_at = ?,
+                    attempts = attempts + ?, transaction_id = NULL, message = NULL, completed_at = NULL
+                WHERE id = ?
+            ''', (status, amount, description, claimed_at, int(status == 'processing'), row['id']))
+            payment_id = row['id']
+        else:
+            payment_id = conn.execute('''
+                INSERT INTO payments (kind, patron_id, book_id, borrow_id, amount, description, idempotency_key,
+                                      status, attempts, created_at, claimed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (kind, patron_id, book_id, borrow_id, amount, description, idempotency_key,
+                  status, int(status == 'processing'), now.isoformat(), claimed_at)).lastrowid
+        row = conn.execute('SELECT * FROM payments WHERE id = ?', (payment_id,)).fetchone()
+    return dict(row), True
+
+def claim_payment_jobs(limit: int = 1, lease: float = 60.0) -> List[Dict]:
+    """
+    Mark the oldest queued payment jobs as processing and return them.
+
+    Only queued jobs are claimed, never rows a pay_late_fees call reserved
+    for itself. Rows left processing for longer than the lease (by a worker
+    or request that died, perhaps after the gateway took the charge) are
+    marked unknown rather than sent again. The claim runs under BEGIN
+    IMMEDIATE, so concurrent workers never receive the same job.
+    """
+    now = datetime.now()
+    stale_before = (now - timedelta(seconds=lease)).isoformat()
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE payments SET status = 'unknown', message = ?
+            WHERE status = 'processing' AND claimed_at < ?
+        ''', (PAYMENT_OUTCOME_UNKNOWN, stale_before))
+        rows = conn.execute('''
+            SELECT id FROM payments WHERE status = 'queued' ORDER BY id LIMIT ?
+        ''', (limit,)).fetchall()
+        if not rows:
+            return []
+        ids = [row['id'] for row in rows]
+        placeholders = ', '.join('?' * len(ids))
+        conn.execute(f'''
+            UPDATE payments SET status = 'processing', claimed_at = ?, attempts = attempts + 1
+            WHERE id IN ({placeholders})
+        ''', [now.isoformat()] + ids)
+        jobs = conn.execute(f'SELECT * FROM payments WHERE id IN ({placeholders}) ORDER BY id', ids).fetchall()
+    return [dict(job) for job in jobs]
+
+def release_payment_job(job_id: int):
+    """Return a claimed job to the queue without counting the attempt."""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE payments SET status = 'queued', claimed_at = NULL, attempts = MAX(attempts - 1, 0)
+            WHERE id = ? AND status = 'processing'
+        ''', (job_id,))
+
+def complete_payment_job(job_id: int, succeeded: bool, transaction_id: Optional[str], message: str) -> bool:
+    """Record the gateway outcome of a claimed payment job."""
+    with pooled_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE payments SET status = ?, transaction_id = ?, message = ?, completed_at = ?
+                WHERE id = ?
+            ''', ('succeeded' if succeeded else 'failed', transaction_id, message,
+                  datetime.now().isoformat(), job_id))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
+
+def mark_payment_unknown(job_id: int, message: str = PAYMENT_OUTCOME_UNKNOWN) -> bool:
+    """Record that a processing payment may have reached the gateway without an answer coming back."""
+    with transaction() as conn:
+        return conn.execute('''
+            UPDATE payments SET status = 'unknown', message = ? WHERE id = ? AND status = 'processing'
+        ''', (message, job_id)).rowcount == 1
+
+def get_unknown_payments() -> List[Dict]:
+    """Get the payments whose outcome is unknown, oldest first."""
+    with read_connection() as conn:
+        rows = conn.execute("SELECT * FROM payments WHERE status = 'unknown' ORDER BY id").fetchall()
+    return [dict(row) for row in rows]
+
+def record_reconciled_payment(job_id: int, succeeded: bool, transaction_id: Optional[str], message: str) -> bool:
+    """Record the reconciled outcome of a payment whose outcome was unknown; False if it was not unknown."""
+    with transaction() as conn:
+        return conn.execute('''
+            UPDATE payments SET status = ?, transaction_id = ?, message = ?, completed_at = ?
+            WHERE id = ? AND status = 'unknown'
+        ''', ('succeeded' if succeeded else 'failed', transaction_id, message,
+              datetime.now().isoformat(), job_id)).rowcount == 1
+
+def get_payment(job_id: int) -> Optional[Dict]:
+    """Get a payment job by id."""
+    with read_connection() as conn:
+        row = conn.execute('SELECT * FROM payments WHERE id = ?', (job_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_payment_by_transaction(transaction_id: str) -> Optional[Dict]:
+    """Get the successful charge recorded with a gateway transaction id."""
+    with read_connection() as conn:
+        row = conn.execute('''
+            SELECT * FROM payments WHERE transaction_id = ? AND kind = 'charge' AND status = 'succeeded'
+        ''', (transaction_id,)).fetchone()
+    return dict(row) if row else None
+
+def reserve_refund(transaction_id: str, amount: float) -> Optional[bool]:
+    """
+    Count a refund against the original charge before it is sent to the gateway.
+
+    Returns:
+        bool: True if reserved, False if it would refund more than was charged,
+            or None if the transaction is not in the ledger
+    """
+    with transaction() as conn:
+        row = conn.execute('''
+            SELECT id, amount, refunded_amount FROM payments
+            WHERE transaction_id = ? AND kind = 'charge' AND status = 'succeeded'
+        ''', (transaction_id,)).fetchone()
+        if row is None:
+            return None
+        if round(row['refunded_amount'] + amount, 2) > round(row['amount'], 2):
+            return False
+        conn.execute('UPDATE payments SET refunded_amount = refunded_amount + ? WHERE id = ?', (amount, row['id']))
+    return True
+
+def release_refund(transaction_id: str, amount: float):
+    """Undo reserve_refund after the gateway rejected the refund."""
+    with transaction() as conn:
+        conn.execute('''
+            UPDATE payments SET refunded_amount = MAX(refunded_amount - ?, 0.0)
+            WHERE transaction_id = ? AND kind = 'charge' AND status = 'succeeded'
+        ''', (amount, transaction_id))
+
+def get_paid_late_fees(patron_id: str) -> Dict[int, float]:
+    """Net late fees paid (charges less refunds) per borrow record for a patron."""
+    with read_connection() as conn:
+        rows = conn.execute('''
+            SELECT borrow_id, SUM(amount - refunded_amount) AS paid FROM payments
+            WHERE patron_id = ? AND kind = 'charge' AND status = 'succeeded' AND borrow_id IS NOT NULL
+            GROUP BY borrow_id
+        ''', (patron_id,)).fetchall()
+    return {row['borrow_id']: row['paid'] for row in rows}
+
+def get_loan_charges(patron_id: str, borrow_id: int) -> Tuple[float, int]:
+    """Net amount paid (charges less refunds) and number of succeeded charges for one loan's late fees."""
+    with read_connection() as conn:
+        row = conn.execute('''
+            SELECT COALESCE(SUM(amount - refunded_amount), 0.0), COUNT(*) FROM payments
+            WHERE patron_id = ? AND borrow_id = ? AND kind = 'charge' AND status = 'succeeded'
+        ''', (patron_id, borrow_id)).fetchone()
+    return row[0], row[1]
+
+def get_payment_queue_counts() -> Dict:
+    """Count payment jobs in each status."""
+    with read_connection() as conn:
+        rows = conn.execute('SELECT status, COUNT(*) AS jobs FROM payments GROUP BY status').fetchall()
+    counts = dict.fromkeys(PAYMENT_STATUSES, 0)
+    counts.update((row['status'], row['jobs']) for row in rows)
+    return counts
+
+
+def start_notice_run(as_of: datetime, resume: bool = True, lease: float = 60.0) -> Tuple[Optional[Dict], bool]:
+    """
+    Start an overdue notice run, or take over the unfinished one.
+    
+    An unfinished run whose last checkpoint is older than the lease is
+    assumed crashed: with resume it is continued from its checkpoint (keeping
+    its as_of), otherwise it is marked abandoned and a new run starts.
+    
+    Returns:
+        tuple: (run row, True if resumed), or (None, False) while another run
+            is still checkpointing within its lease
+    """
+    now = datetime.now()
+    with transaction() as conn:
+        row = conn.execute("SELECT * FROM notice_runs WHERE status = 'running' ORDER BY id DESC LIMIT 1").fetchone()
+        if row is not None:
+            if row['updated_at'] > (now - timedelta(seconds=lease)).isoformat():
+                return None, False
+            if resume:
+                conn.execute('UPDATE notice_runs SET updated_at = ? WHERE id = ?', (now.isoformat(), row['id']))
+                return dict(row, updated_at=now.isoformat()), True
+            conn.execute("UPDATE notice_runs SET status = 'abandoned', finished_at = ? WHERE id = ?",
+                         (now.isoformat(), row['id']))
+        run_id = conn.execute(
+            'INSERT INTO notice_runs (as_of, started_at, updated_at) VALUES (?, ?, ?)',
+            (as_of.isoformat(), now.isoformat(), now.isoformat())
+        ).lastrowid
+        row = conn.execute('SELECT * FROM notice_runs WHERE id = ?', (run_id,)).fetchone()
+    return dict(row), False
+
+def checkpoint_notice_run(run_id: int, last_patron_id: Optional[str], patrons: int, loans: int,
+                          failures: List[Tuple[str, int, str]]):
+    """
+    Record a run's progress in one transaction.
+    
+    Args:
+        last_patron_id: Every patron up to this one has been dealt with (None keeps the current checkpoint)
+        patrons: Patrons notified since the previous checkpoint
+        loans: Loans covered by those notices
+        failures: (patron_id, loans, error) for notices given up on since the previous checkpoint
+    """
+    with transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO notice_failures (run_id, patron_id, loans, error) VALUES (?, ?, ?, ?)',
+            [(run_id, patron_id, count, error) for patron_id, count, error in failures]
+        )
+        conn.execute('''
+            UPDATE notice_runs SET last_patron_id = COALESCE(?, last_patron_id),
+                patrons_notified = patrons_notified + ?, loans_notified = loans_notified + ?,
+                failures = failures + ?, updated_at = ?
+            WHERE id = ?
+        ''', (last_patron_id, patrons, loans, len(failures), datetime.now().isoformat(), run_id))
+
+def finish_notice_run(run_id: int):
+    """Mark a notice run as completed."""
+    now = datetime.now().isoformat()
+    with transaction() as conn:
+        conn.execute("UPDATE notice_runs SET status = 'completed', updated_at = ?, finished_at = ? WHERE id = ?",
+                     (now, now, run_id))
+
+def get_notice_run(run_id: int) -> Optional[Dict]:
+    """Get a notice run's status, checkpoint and totals."""
+    with read_connection() as conn:
+        row = conn.execute('SELECT * FROM notice_runs WHERE id = ?', (run_id,)).fetchone()
+    return dict(row) if row else None
+
+def get_notice_failures(run_id: int) -> List[Dict]:
+    """Patrons whose notice could not be delivered in a run, in patron order."""
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT patron_id, loans, error FROM notice_failures WHERE run_id = ? ORDER BY patron_id', (run_id,)
+        ).fetchall()
+    return [dict(row) for row in rows]
+
+def _append_catalog_event(conn: sqlite3.Connection, event_type: str, data: Dict,
+                          keep: int = CATALOG_EVENT_HISTORY) -> Tuple[int, str, Dict]:
+    """
+    Append an event to the shared catalog change feed in the caller's write transaction.
+
+    At least the latest keep events are retained; older ones are deleted
+    once every CATALOG_EVENT_TRIM_BATCH appends rather than on each one.
+    """
+    event_id = conn.execute(
+        'INSERT INTO catalog_events (event_type, data, created_at) VALUES (?, ?, ?)',
+        (event_type, json.dumps(data), datetime.now().isoformat())
+    ).lastrowid
+    if event_id % CATALOG_EVENT_TRIM_BATCH == 0:
+        conn.execute('DELETE FROM catalog_events WHERE id <= ?', (event_id - keep,))
+    return event_id, event_type, data
+
+def _append_availability_event(conn: sqlite3.Connection, book_id: int):
+    """Append a book's available and total copies as written by the caller's transaction."""
+    row = conn.execute('SELECT available_copies, total_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+    if row is not None:
+        _append_catalog_event(conn, 'availability', {
+            'book_id': book_id, 'available_copies': row['available_copies'], 'total_copies': row['total_copies']
+        })
+
+def append_catalog_event(event_type: str, data: Union[Dict, Callable[[], Optional[Dict]]],
+                         keep: int = CATALOG_EVENT_HISTORY) -> Optional[Tuple[int, str, Dict]]:
+    """
+    Append an event to the shared catalog change feed in its own transaction.
+
+    Borrows, returns and hold changes append their availability events in
+    the transaction that makes the change instead (see
+    _append_availability_event). data may be a callable; it is called while
+    the write lock is held, so events that read current state are appended
+    in the order those reads were made, whichever process makes them.
+
+    Returns:
+        tuple: (id, event_type, data), or None if the callable returned None
+    """
+    with transaction() as conn:
+        if callable(data):
+            data = data()
+            if data is None:
+                return None
+        return _append_catalog_event(conn, event_type, data, keep)
+
+def get_catalog_events(after_id: int, through_id: Optional[int] = None, limit: int = 1000) -> List[Tuple[int, str, Dict]]:
+    """Catalog change events after after_id (up to through_id), oldest first."""
+    with read_connection() as conn:
+        rows = conn.execute(
+            'SELECT id, event_type, data FROM catalog_events WHERE id > ? AND id <= ? ORDER BY id LIMIT ?',
+            (after_id, through_id if through_id is not None else sys.maxsize, limit)
+        ).fetchall()
+    return [(row['id'], row['event_type'], json.loads(row['data'])) for row in rows]
+
+def get_catalog_event_range() -> Tuple[int, int]:
+    """Oldest and latest retained catalog change event ids, (0, 0) before the first event."""
+    with read_connection() as conn:
+        row = conn.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM catalog_events').fetchone()
+    return row[0], row[1]
+
+
+# Time every public helper; connection plumbing is covered by the SQL and connect timings
+instrument_module(sys.modules[__name__], exclude=(
+    'apply_storage_profile', 'get_db_connection', 'get_pool', 'pooled_connection', 'read_connection',
+    'transaction', 'get_pool_metrics', 'close_pools', 'get_book_cache_stats', 'get_catalog_index',
+))
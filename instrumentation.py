@@ -0,0 +1,537 @@
+"""
+Instrumentation module for Library Management System
+Timing spans, SQL query metrics, slow-query logging, Prometheus text export and per-request profiling
+"""
+
+import cProfile
+import functools
+import inspect
+import io
+import logging
+import os
+import pstats
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+INSTRUMENTATION = os.environ.get('LIBRARY_INSTRUMENTATION', '1').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_SECONDS = float(os.environ.get('LIBRARY_SLOW_QUERY_MS', '100')) / 1000
+PROFILING = os.environ.get('LIBRARY_PROFILING', '0').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('LIBRARY_PROFILE_SAMPLE_INTERVAL', '0.001'))
+TRACE_HISTORY_SIZE = int(os.environ.get('LIBRARY_TRACE_HISTORY_SIZE', '50'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+slow_query_log = logging.getLogger('library.slow_query')
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed bucket bounds in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * len(self.buckets)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._count += 1
+            self._sum += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets, self._counts):
+                running += count
+                cumulative[str(bound)] = running
+            cumulative['+Inf'] = self._count
+            return {'buckets': cumulative, 'count': self._count, 'sum': round(self._sum, 6)}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms keyed by metric name and label set, rendered in
+    the Prometheus text exposition format. Collectors add gauges computed
+    at scrape time (pool sizes, queue depths and so on).
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, LatencyHistogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Iterable[Tuple[Dict, float]]]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Sequence[float]] = None):
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Labels = ()):
+        histogram = self._histograms.get(name, {}).get(labels)
+        if histogram is None:
+            with self._lock:
+                series = self._histograms.setdefault(name, {})
+                histogram = series.get(labels)
+                if histogram is None:
+                    histogram = series[labels] = LatencyHistogram(self._buckets.get(name, LATENCY_BUCKETS))
+        histogram.observe(value)
+
+    def counter_value(self, name: str, labels: Labels = ()) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(labels, 0)
+
+    def histogram(self, name: str, labels: Labels = ()) -> Optional[Dict]:
+        histogram = self._histograms.get(name, {}).get(labels)
+        return histogram.snapshot() if histogram is not None else None
+
+    def register_collector(self, collector: Callable):
+        """Add a callable returning (name, type, help, [(labels dict, value)]) tuples at scrape time."""
+        self._collectors.append(collector)
+
+    def clear(self):
+        """Drop every recorded series (collectors are kept)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """All metrics in Prometheus text format."""
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            _header(lines, name, 'counter', self._help.get(name))
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for name in sorted(histograms):
+            _header(lines, name, 'histogram', self._help.get(name))
+            for labels, histogram in sorted(histograms[name].items()):
+                snapshot = histogram.snapshot()
+                for bound, count in snapshot['buckets'].items():
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(snapshot["sum"])}')
+                lines.append(f'{name}_count{_labels(labels)} {snapshot["count"]}')
+        for collector in self._collectors:
+            for name, metric_type, help_text, samples in collector():
+                _header(lines, name, metric_type, help_text)
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _header(lines: List[str], name: str, metric_type: str, help_text: Optional[str]):
+    if help_text:
+        lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+registry.describe('library_function_seconds', 'Time spent in instrumented database and service functions.', FAST_BUCKETS)
+registry.describe('library_sql_queries_total', 'SQL statements executed, by leading keyword.')
+registry.describe('library_sql_query_seconds', 'SQL statement execution time, by leading keyword.', FAST_BUCKETS)
+registry.describe('library_sql_slow_queries_total', 'SQL statements slower than LIBRARY_SLOW_QUERY_MS.')
+registry.describe('library_gateway_call_seconds', 'Payment gateway call attempts, by operation.')
+registry.describe('library_http_requests_total', 'HTTP requests served, by endpoint, method and status.')
+registry.describe('library_http_request_seconds', 'HTTP request handling time (excluding streamed bodies).')
+registry.describe('library_http_request_sql_queries', 'SQL statements executed per HTTP request.', COUNT_BUCKETS)
+
+
+class Trace:
+    """Spans and SQL totals recorded while one request (or job) runs on a thread."""
+
+    __slots__ = ('name', 'started', 'spans', 'sql_queries', 'sql_seconds', 'depth')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, int, float, float]] = []  # (name, depth, start offset, seconds)
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.depth = 0
+
+    def summary(self) -> Dict:
+        """Total time per top-level span name, plus SQL totals."""
+        totals: Dict[str, float] = {}
+        for name, depth, _, seconds in self.spans:
+            if depth == 0:
+                totals[name] = totals.get(name, 0.0) + seconds
+        return {'spans': totals, 'sql_queries': self.sql_queries, 'sql_seconds': self.sql_seconds}
+
+    def to_dict(self, seconds: Optional[float] = None) -> Dict:
+        return {
+            'name': self.name,
+            'seconds': round(seconds if seconds is not None else time.perf_counter() - self.started, 6),
+            'sql_queries': self.sql_queries,
+            'sql_seconds': round(self.sql_seconds, 6),
+            'spans': [
+                {'name': name, 'depth': depth, 'start': round(offset, 6), 'seconds': round(span, 6)}
+                for name, depth, offset, span in self.spans
+            ],
+        }
+
+
+_local = threading.local()
+recent_traces: Deque[Dict] = deque(maxlen=TRACE_HISTORY_SIZE)
+
+def current_trace() -> Optional[Trace]:
+    return getattr(_local, 'trace', None)
+
+def start_trace(name: str) -> Trace:
+    """Start collecting spans for the current thread."""
+    trace = _local.trace = Trace(name)
+    return trace
+
+def finish_trace() -> Optional[Trace]:
+    """Stop collecting spans for the current thread and return what was collected."""
+    trace = getattr(_local, 'trace', None)
+    _local.trace = None
+    return trace
+
+
+class timed:
+    """
+    Time a block or function.
+
+    As a context manager (`with timed('name'):`) or decorator (`@timed('name')`),
+    the duration is recorded in the library_function_seconds histogram and,
+    when a trace is active on the thread, as a span of that trace.
+    Generator functions are timed until they are exhausted or closed, but
+    only the code they run between yields is nested under their span.
+    """
+
+    __slots__ = ('name', 'metric', '_started', '_trace')
+
+    def __init__(self, name: str, metric: str = 'library_function_seconds'):
+        self.name = name
+        self.metric = metric
+
+    def __enter__(self):
+        self._trace = current_trace()
+        if self._trace is not None:
+            self._trace.depth += 1
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._started
+        registry.observe(self.metric, seconds, (('function', self.name),))
+        trace = self._trace
+        if trace is not None:
+            trace.depth -= 1
+            trace.spans.append((self.name, trace.depth, self._started - trace.started, seconds))
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        name, metric = self.name, self.metric
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                trace = current_trace()
+                depth = trace.depth if trace is not None else 0
+                started = time.perf_counter()
+                generator = func(*args, **kwargs)
+
+                def resume(method, *value):
+                    # Raise the depth only while the generator runs; the consumer's spans
+                    # between yields are siblings of this one, not children
+                    if trace is not None:
+                        trace.depth += 1
+                    try:
+                        return method(*value)
+                    finally:
+                        if trace is not None:
+                            trace.depth -= 1
+
+                try:
+                    item = resume(generator.send, None)
+                    while True:
+                        try:
+                            sent = yield item
+                        except GeneratorExit:
+                            resume(generator.close)
+                            raise
+                        except BaseException as e:
+                            item = resume(generator.throw, e)
+                        else:
+                            item = resume(generator.send, sent)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    seconds = time.perf_counter() - started
+                    registry.observe(metric, seconds, (('function', name),))
+                    if trace is not None:
+                        trace.spans.append((name, depth, started - trace.started, seconds))
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with timed(name, metric):
+                    return func(*args, **kwargs)
+        wrapper.__instrumented__ = True
+        return wrapper
+
+
+def instrument_module(module, exclude: Iterable[str] = ()) -> List[str]:
+    """
+    Wrap every public function defined in a module with timed('<module>.<function>').
+
+    Call at the bottom of the module so names imported from it elsewhere
+    are the timed versions. Does nothing when LIBRARY_INSTRUMENTATION is off.
+
+    Returns:
+        list: Names of the functions that were wrapped
+    """
+    if not INSTRUMENTATION:
+        return []
+    prefix = module.__name__.rsplit('.', 1)[-1]
+    excluded = set(exclude)
+    wrapped = []
+    for name, obj in list(vars(module).items()):
+        if (name.startswith('_') or name in excluded or not inspect.isfunction(obj)
+                or obj.__module__ != module.__name__ or getattr(obj, '__instrumented__', False)):
+            continue
+        setattr(module, name, timed(f'{prefix}.{name}')(obj))
+        wrapped.append(name)
+    return wrapped
+
+
+# Startup of the most recent create_app: phase durations in run order, then time to first request
+startup: Dict = {'started': None, 'phases': {}, 'time_to_first_request': None}
+
+def begin_startup():
+    """Start timing a new application startup."""
+    startup.update(started=time.perf_counter(), phases={}, time_to_first_request=None)
+
+@contextmanager
+def startup_phase(name: str):
+    """Time one startup phase (database setup, route imports, ...)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup['phases'][name] = time.perf_counter() - started
+
+def startup_report() -> Dict:
+    """Startup phases and time to first request, in seconds."""
+    return {
+        'phases': {name: round(seconds, 6) for name, seconds in startup['phases'].items()},
+        'total': round(sum(startup['phases'].values()), 6),
+        'time_to_first_request': (round(startup['time_to_first_request'], 6)
+                                  if startup['time_to_first_request'] is not None else None),
+    }
+
+def _startup_gauges():
+    yield ('library_startup_phase_seconds', 'gauge', 'Duration of each create_app startup phase.', [
+        ({'phase': name}, round(seconds, 6)) for name, seconds in startup['phases'].items()
+    ])
+    if startup['time_to_first_request'] is not None:
+        yield ('library_time_to_first_request_seconds', 'gauge', 'From create_app to the first response.',
+               [({}, round(startup['time_to_first_request'], 6))])
+
+registry.register_collector(_startup_gauges)
+
+
+_WHITESPACE = re.compile(r'\s+')
+
+def record_query(sql: str, seconds: float):
+    """Count and time one SQL statement, logging it if it was slow."""
+    operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+    labels = (('operation', operation),)
+    registry.inc('library_sql_queries_total', labels)
+    registry.observe('library_sql_query_seconds', seconds, labels)
+    trace = current_trace()
+    if trace is not None:
+        trace.sql_queries += 1
+        trace.sql_seconds += seconds
+    if seconds >= SLOW_QUERY_SECONDS:
+        registry.inc('library_sql_slow_queries_total', labels)
+        slow_query_log.warning('Slow query (%.1f ms): %s', seconds * 1000, _WHITESPACE.sub(' ', sql).strip()[:1000])
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that records the execution time of every statement."""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            record_query(sql_script, time.perf_counter() - started)
+
+# Connection class for database.py to pass as sqlite3.connect(factory=...)
+CONNECTION_FACTORY = InstrumentedConnection if INSTRUMENTATION else sqlite3.Connection
+
+
+class SamplingProfiler:
+    """
+    Sample one thread's stack every interval seconds from a helper thread.
+
+    Cheaper than cProfile for long requests since the profiled code runs
+    unhooked; report() returns collapsed stacks ('a;b;c count' lines) that
+    flame graph tools read directly.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self) -> str:
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+
+
+def _profile_report(profiler: cProfile.Profile, limit: int = 40) -> str:
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def install_request_instrumentation(app):
+    """
+    Trace every request of a Flask app.
+
+    Records request count, latency and SQL statements per request, adds a
+    Server-Timing header and keeps the latest traces in recent_traces. With
+    LIBRARY_PROFILING on, ?profile=cprofile or ?profile=sampling replaces the
+    response with a profile of the request.
+    """
+    from flask import Response, before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def start_request_trace():
+        trace = start_trace(f'{request.method} {request.endpoint}')
+        mode = request.args.get('profile') if PROFILING else None
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is already active on this thread
+                profiler = None
+            g.profiler = profiler
+        elif mode == 'sampling':
+            g.profiler = SamplingProfiler().start()
+        g.trace = trace
+
+    @app.after_request
+    def finish_request_trace(response):
+        trace = finish_trace()
+        if trace is None:
+            return response
+        seconds = time.perf_counter() - trace.started
+        endpoint = request.endpoint or 'unmatched'
+        registry.inc('library_http_requests_total',
+                     (('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code))))
+        registry.observe('library_http_request_seconds', seconds, (('endpoint', endpoint), ('method', request.method)))
+        registry.observe('library_http_request_sql_queries', trace.sql_queries, (('endpoint', endpoint),))
+        recent_traces.append(trace.to_dict(seconds))
+        if startup['time_to_first_request'] is None and startup['started'] is not None:
+            startup['time_to_first_request'] = time.perf_counter() - startup['started']
+
+        summary = trace.summary()
+        timings = [f'app;dur={seconds * 1000:.2f}', f'db;desc="{trace.sql_queries} queries";dur={trace.sql_seconds * 1000:.2f}']
+        timings += [f'{re.sub(r"[^A-Za-z0-9_.-]", "_", name)};dur={span * 1000:.2f}'
+                    for name, span in sorted(summary['spans'].items(), key=lambda item: -item[1])[:5]]
+        response.headers['Server-Timing'] = ', '.join(timings)
+
+        profiler = g.pop('profiler', None)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            return Response(_profile_report(profiler), mimetype='text/plain', headers={'X-Profile': 'cprofile'})
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+            return Response(profiler.report(), mimetype='text/plain', headers={'X-Profile': 'sampling'})
+        return response
+
+    @app.teardown_request
+    def drop_request_trace(exception):
+        # after_request does not run when a view raises
+        finish_trace()
+        profiler = g.pop('profiler', None)
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+        elif isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+
+    def render_started(sender, template, context, **extra):
+        if not hasattr(_local, 'renders'):
+            _local.renders = []
+        _local.renders.append(timed(f'render.{template.name}').__enter__())
+
+    def render_finished(sender, template, context, **extra):
+        renders = getattr(_local, 'renders', None)
+        if renders:
+            renders.pop().__exit__(None, None, None)
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
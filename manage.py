@@ -0,0 +1,273 @@
+"""
+Command-line management tasks for the Library Management System.
+
+Usage:
+    python manage.py import-books catalog.csv
+    python manage.py import-books catalog.jsonl --chunk-size 5000
+    python manage.py compute-fees --output overdue_fees.csv
+    python manage.py reconcile-patron-summary --check
+    python manage.py process-payments --workers 8
+    python manage.py reconcile-payments --resolve 42 --charged --transaction-id txn_123456_1700000000
+    python manage.py export-history --format jsonl --patron 123456 --output history.jsonl
+    python manage.py send-overdue-notices --sink file --output notices.jsonl --workers 8 --rate 100
+    python manage.py expire-holds
+    python manage.py init-db --sample-data
+    python manage.py serve --workers 4
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import database
+
+
+def import_books_command(args) -> int:
+    """Stream a CSV or JSONL file into the catalog and print the import report."""
+    from services.catalog_import import import_books_from_stream
+
+    file_format = args.format or ('csv' if args.path.lower().endswith('.csv') else 'jsonl')
+    with open(args.path, encoding='utf-8', newline='') as stream:
+        try:
+            report = import_books_from_stream(stream, file_format, args.chunk_size)
+        except ValueError as e:
+            print(f"Import failed: {e}", file=sys.stderr)
+            return 1
+
+    print(json.dumps(report, indent=2))
+    return 0 if report['rejected'] == 0 else 2
+
+def compute_fees_command(args) -> int:
+    """Compute late fees for every open loan; write per-loan rows if asked, then print the summary."""
+    from services.fee_engine import run_fee_batch, write_fee_report
+
+    try:
+        as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+    except ValueError as e:
+        print(f"Compute fees failed: {e}", file=sys.stderr)
+        return 2
+    overdue_only = not args.all_open
+    if args.output == '-':
+        summary = write_fee_report(sys.stdout, as_of, overdue_only)
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8', newline='') as stream:
+            summary = write_fee_report(stream, as_of, overdue_only)
+    else:
+        summary = run_fee_batch(as_of, overdue_only)
+
+    print(json.dumps(summary, indent=2), file=sys.stderr if args.output == '-' else sys.stdout)
+    return 0
+
+def reconcile_patron_summary_command(args) -> int:
+    """Report patron_summary drift and, unless --check is given, rebuild the table."""
+    if args.check:
+        report = database.check_patron_summary()
+        print(json.dumps(report, indent=2))
+        return 0 if report['drifted'] == 0 else 2
+
+    try:
+        as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+    except ValueError as e:
+        print(f"Reconcile failed: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps(database.reconcile_patron_summary(as_of), indent=2))
+    return 0
+
+def process_payments_command(args) -> int:
+    """Run payment workers until the queue is empty (or forever with --serve)."""
+    from services.payment_queue import PaymentWorkerPool
+
+    workers = PaymentWorkerPool(workers=args.workers)
+    workers.start(drain=not args.serve)
+    try:
+        workers.join()
+    except KeyboardInterrupt:
+        workers.stop()
+    print(json.dumps({'processed': workers.processed, 'queue': database.get_payment_queue_counts()}, indent=2))
+    return 0
+
+def reconcile_payments_command(args) -> int:
+    """List payments whose outcome is unknown, or record what happened to one of them."""
+    if args.resolve is None:
+        unknown = database.get_unknown_payments()
+        print(json.dumps({'unknown': unknown}, indent=2))
+        return 0 if not unknown else 2
+
+    from services.payment_queue import resolve_unknown_payment
+
+    if args.charged == args.not_charged:
+        print("Reconcile failed: give exactly one of --charged and --not-charged.", file=sys.stderr)
+        return 1
+    success, message = resolve_unknown_payment(args.resolve, args.charged, args.transaction_id)
+    if not success:
+        print(f"Reconcile failed: {message}", file=sys.stderr)
+        return 1
+    print(json.dumps({'job_id': args.resolve, 'message': message}, indent=2))
+    return 0
+
+def export_history_command(args) -> int:
+    """Stream borrowing history to a file or stdout, then print the export summary."""
+    from services.history_export import write_history_export
+
+    try:
+        filters = {
+            'start': datetime.fromisoformat(args.start) if args.start else None,
+            'end': datetime.fromisoformat(args.end) if args.end else None,
+            'as_of': datetime.fromisoformat(args.as_of) if args.as_of else None,
+        }
+    except ValueError as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    filters.update(patron_id=args.patron, overdue_only=args.overdue_only, chunk_size=args.chunk_size)
+
+    try:
+        if args.output == '-':
+            summary = write_history_export(sys.stdout, args.format, **filters)
+        else:
+            with open(args.output, 'w', encoding='utf-8', newline='') as stream:
+                summary = write_history_export(stream, args.format, **filters)
+    except ValueError as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(summary, indent=2), file=sys.stderr if args.output == '-' else sys.stdout)
+    return 0
+
+def send_overdue_notices_command(args) -> int:
+    """Notify every patron with overdue loans (resuming an interrupted run), then print the run summary."""
+    from services.overdue_notices import get_notice_sender, run_overdue_notices
+
+    try:
+        as_of = datetime.fromisoformat(args.as_of) if args.as_of else None
+    except ValueError as e:
+        print(f"Overdue notices failed: {e}", file=sys.stderr)
+        return 1
+
+    with get_notice_sender(args.sink, args.output) as sender:
+        summary = run_overdue_notices(sender, as_of, workers=args.workers, rate=args.rate, resume=not args.restart)
+    if 'error' in summary:
+        print(f"Overdue notices failed: {summary['error']}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(summary, indent=2))
+    return 0 if summary['failures'] == 0 else 2
+
+def expire_holds_command(args) -> int:
+    """Expire holds whose copy was not borrowed in time, passing the copies on."""
+    from services.library_service import expire_unclaimed_holds
+
+    print(json.dumps({'expired': expire_unclaimed_holds()}, indent=2))
+    return 0
+
+def init_db_command(args) -> int:
+    """Create or migrate the schema (done by main) and optionally load the sample books."""
+    if args.sample_data:
+        database.add_sample_data()
+    print(json.dumps({'database': database.DATABASE, 'schema_version': database.get_schema_version()}, indent=2))
+    return 0
+
+def serve_command(args) -> int:
+    """Run the production server: gunicorn with gunicorn.conf.py and wsgi:app."""
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        print("gunicorn is not installed (it does not run on Windows); use 'python app.py' for development.",
+              file=sys.stderr)
+        return 1
+
+    # Workers find the database through the environment
+    os.environ['LIBRARY_DATABASE'] = os.path.abspath(database.DATABASE)
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    argv = ['gunicorn', '--config', config, '--chdir', os.path.dirname(config)]
+    if args.workers:
+        argv += ['--workers', str(args.workers)]
+    if args.bind:
+        argv += ['--bind', args.bind]
+    sys.argv = argv + ['wsgi:app']
+    run()
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Library Management System management tasks.")
+    parser.add_argument('--database', help="SQLite database file (default: library.db)")
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    import_books = commands.add_parser('import-books', help="Bulk import books from a CSV or JSONL file.")
+    import_books.add_argument('path', help="File with title, author, isbn and total_copies per row")
+    import_books.add_argument('--format', choices=('csv', 'jsonl'), help="Input format (default: from the file extension)")
+    import_books.add_argument('--chunk-size', type=int, default=1000, help="Rows per transaction")
+    import_books.set_defaults(handler=import_books_command)
+
+    compute_fees = commands.add_parser('compute-fees', help="Compute late fees for all open loans (nightly overdue run).")
+    compute_fees.add_argument('--output', help="Write one CSV row per loan to this file ('-' for stdout)")
+    compute_fees.add_argument('--all-open', action='store_true', help="Include open loans that are not yet overdue")
+    compute_fees.add_argument('--as-of', help="ISO timestamp to measure lateness against (default: now)")
+    compute_fees.set_defaults(handler=compute_fees_command)
+
+    reconcile = commands.add_parser('reconcile-patron-summary', help="Check and rebuild the patron_summary table from borrow_records.")
+    reconcile.add_argument('--check', action='store_true', help="Only report drift; exit with status 2 if any is found")
+    reconcile.add_argument('--as-of', help="ISO timestamp to compute overdue counts and fees against (default: now)")
+    reconcile.set_defaults(handler=reconcile_patron_summary_command)
+
+    payments = commands.add_parser('process-payments', help="Send queued late fee payments and refunds to the gateway.")
+    payments.add_argument('--workers', type=int, default=4, help="Worker threads")
+    payments.add_argument('--serve', action='store_true', help="Keep polling for new jobs instead of exiting when the queue is empty")
+    payments.set_defaults(handler=process_payments_command)
+
+    reconcile_payments = commands.add_parser('reconcile-payments', help="List payments with an unknown outcome (exit 2 if any) or resolve one.")
+    reconcile_payments.add_argument('--resolve', type=int, metavar='JOB_ID', help="Payment job to record the outcome of")
+    reconcile_payments.add_argument('--charged', action='store_true', help="The gateway applied the charge or refund")
+    reconcile_payments.add_argument('--not-charged', action='store_true', help="The gateway did not apply it")
+    reconcile_payments.add_argument('--transaction-id', help="Gateway transaction id of an applied charge (checked with the gateway)")
+    reconcile_payments.set_defaults(handler=reconcile_payments_command)
+
+    export_history = commands.add_parser('export-history', help="Export borrowing history as CSV, JSONL or columnar row groups.")
+    export_history.add_argument('--output', default='-', help="File to write ('-' for stdout, the default)")
+    export_history.add_argument('--format', choices=('csv', 'jsonl', 'columnar'), default='csv', help="Output format")
+    export_history.add_argument('--patron', help="Only this patron's loans")
+    export_history.add_argument('--start', help="Only loans borrowed at or after this ISO date")
+    export_history.add_argument('--end', help="Only loans borrowed before this ISO date")
+    export_history.add_argument('--overdue-only', action='store_true', help="Only loans returned late or open past their due date")
+    export_history.add_argument('--as-of', help="ISO timestamp to measure lateness of open loans against (default: now)")
+    export_history.add_argument('--chunk-size', type=int, default=1000, help="Rows read and written per chunk")
+    export_history.set_defaults(handler=export_history_command)
+
+    notices = commands.add_parser('send-overdue-notices', help="Send one overdue notice per patron (scheduled overdue sweep).")
+    notices.add_argument('--sink', choices=('file', 'smtp-stub'), help="Where notices go (default: LIBRARY_NOTICE_SINK or file)")
+    notices.add_argument('--output', help="JSON Lines file for the file sink (default: LIBRARY_NOTICE_FILE or overdue_notices.jsonl)")
+    notices.add_argument('--workers', type=int, default=8, help="Threads sending notices")
+    notices.add_argument('--rate', type=float, default=100.0, help="Most notices per second (0 for no limit)")
+    notices.add_argument('--as-of', help="ISO timestamp loans must be due before (default: now)")
+    notices.add_argument('--restart', action='store_true', help="Abandon an interrupted run instead of resuming it")
+    notices.set_defaults(handler=send_overdue_notices_command)
+
+    expire = commands.add_parser('expire-holds', help="Expire unclaimed holds and pass their copies to the next patron in the queue.")
+    expire.set_defaults(handler=expire_holds_command)
+
+    init_db = commands.add_parser('init-db', help="Create or migrate the database schema once, before starting servers.")
+    init_db.add_argument('--sample-data', action='store_true', help="Also add the sample books and loans")
+    init_db.set_defaults(handler=init_db_command)
+
+    serve = commands.add_parser('serve', help="Run the pre-fork production server (gunicorn; not on Windows).")
+    serve.add_argument('--workers', type=int, help="Worker processes (default: LIBRARY_WORKERS or 2 per core + 1)")
+    serve.add_argument('--bind', help="Address to listen on (default: LIBRARY_BIND or 0.0.0.0:5000)")
+    serve.set_defaults(handler=serve_command)
+
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.database:
+        database.DATABASE = os.path.abspath(args.database)
+    database.init_database()
+    try:
+        return args.handler(args)
+    finally:
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
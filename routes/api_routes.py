@@ -2,8 +2,22 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import io
+from datetime import datetime
+from flask import Blueprint, Response, jsonify, request
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog, get_catalog_page, get_patron_status_report,
+    borrow_book_by_patron, return_book_by_patron, pay_late_fees, place_hold, cancel_hold, get_hold_status,
+    CATALOG_MAX_PAGE_SIZE
+)
+from services.catalog_import import import_books_from_stream
+from services.fee_engine import get_fee_summary, get_loan_fees_page
+from services.history_export import iter_history_export, EXPORT_CHUNK_SIZE, EXPORT_EXTENSIONS, EXPORT_MEDIA_TYPES
+from services.payment_queue import get_payment_job, submit_late_fee_payment, submit_refund
+from services.gateway_resilience import get_payment_gateway
+from services.event_bus import event_bus, EVENT_HEARTBEAT, EVENT_STREAM_HEADERS
+from services.payment_status import payment_status_cache, verify_payment_status, verify_many, VERIFY_MANY_LIMIT
+from database import get_pool_metrics, get_book_cache_stats, get_catalog_index_stats, SEARCH_LIMIT
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -16,6 +30,327 @@ def get_late_fee(patron_id, book_id):
     result = calculate_late_fee_for_book(patron_id, book_id)
     return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
 
+@api_bp.route('/books')
+def list_books_api():
+    """
+    List catalog books a page at a time.
+    API interface for R2: Book Catalog Display
+    """
+    limit = request.args.get('limit', type=int)
+    if 'limit' in request.args and limit is None:
+        return jsonify({'error': 'Limit must be an integer.'}), 400
+    
+    page = get_catalog_page(limit=limit, cursor=request.args.get('cursor'))
+    if 'error' in page:
+        return jsonify(page), 400
+    
+    return jsonify({
+        'results': page['books'],
+        'count': len(page['books']),
+        'limit': page['limit'],
+        'next_cursor': page['next_cursor']
+    })
+
+@api_bp.route('/books/bulk', methods=['POST'])
+def bulk_import_books_api():
+    """
+    Bulk import books from a CSV or JSON Lines request body.
+    Bulk interface for R1: Book Catalog Management
+    """
+    content_type = request.mimetype
+    if content_type == 'text/csv':
+        file_format = 'csv'
+    elif content_type in ('application/x-ndjson', 'application/jsonl', 'application/x-jsonlines'):
+        file_format = 'jsonl'
+    else:
+        return jsonify({'error': 'Content-Type must be text/csv or application/x-ndjson.'}), 415
+    
+    # Parse the body as it arrives instead of buffering it
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    try:
+        report = import_books_from_stream(stream, file_format, request.args.get('chunk_size', 1000, type=int))
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(report), 200 if report['rejected'] == 0 else 207
+
+@api_bp.route('/fees/summary')
+def fee_summary_api():
+    """
+    Total late fees across all open loans.
+    Library-wide form of R5: Late Fee Calculation
+    """
+    overdue_only = request.args.get('scope', 'overdue') != 'open'
+    return jsonify(get_fee_summary(overdue_only))
+
+@api_bp.route('/fees/loans')
+def loan_fees_api():
+    """
+    Per-loan late fees for open loans, a page at a time in borrow record order.
+    Library-wide form of R5: Late Fee Calculation
+    """
+    limit = request.args.get('limit', type=int)
+    after_id = request.args.get('after', type=int)
+    overdue_only = request.args.get('scope', 'overdue') != 'open'
+    
+    page = get_loan_fees_page(limit, after_id, overdue_only)
+    if 'error' in page:
+        return jsonify(page), 400
+    
+    page['count'] = len(page['results'])
+    return jsonify(page)
+
+@api_bp.route('/patrons/<patron_id>/status')
+def patron_status_api(patron_id):
+    """
+    Patron status report with one page of borrowing history.
+    API interface for R7: Patron Status Report
+
+    Tagged with an ETag, so a client revalidating with If-None-Match gets
+    304 Not Modified while the report is unchanged.
+    """
+    history_limit = request.args.get('history_limit', type=int)
+    history_offset = request.args.get('history_offset', type=int)
+    if ('history_limit' in request.args and history_limit is None) or \
+            ('history_offset' in request.args and history_offset is None):
+        return jsonify({'error': 'History limit and offset must be integers.'}), 400
+
+    report = get_patron_status_report(patron_id, history_limit, history_offset or 0)
+    if not report:
+        return jsonify({'error': 'Invalid patron ID. Must be exactly 6 digits.'}), 400
+    if 'error' in report:
+        return jsonify(report), 400
+
+    for loan in report['currently_borrowed']:
+        for field in ('borrow_date', 'due_date'):
+            loan[field] = loan[field].isoformat()
+    for record in report['borrowing_history']:
+        for field in ('borrow_date', 'due_date', 'return_date'):
+            record[field] = record[field].isoformat() if record[field] else None
+
+    response = jsonify(report)
+    response.add_etag()
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@api_bp.route('/history/export')
+def history_export_api():
+    """
+    Stream borrowing history as CSV, JSON Lines or columnar row groups.
+    Filters: patron_id, start and end (ISO dates, on borrow date) and overdue_only.
+    """
+    file_format = request.args.get('format', 'csv')
+    try:
+        start, end = (
+            datetime.fromisoformat(request.args[name]) if request.args.get(name) else None
+            for name in ('start', 'end')
+        )
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates.'}), 400
+    chunk_size = request.args.get('chunk_size', EXPORT_CHUNK_SIZE, type=int)
+    overdue_only = request.args.get('overdue_only', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        chunks = iter_history_export(file_format, start, end, request.args.get('patron_id') or None,
+                                     overdue_only, chunk_size=chunk_size)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return Response(chunks, mimetype=EXPORT_MEDIA_TYPES[file_format], headers={
+        'Content-Disposition': f'attachment; filename=borrow_history.{EXPORT_EXTENSIONS[file_format]}',
+    })
+
+@api_bp.route('/events')
+def event_stream_api():
+    """
+    Server-Sent Events stream of catalog changes.
+
+    Sends 'availability' events ({book_id, available_copies, total_copies})
+    after borrows and returns and 'book_added' events for new books, from
+    every server process. A client that reconnects with Last-Event-ID
+    resumes where it left off; one that fell too far behind gets a 'reset'
+    event and should reload the catalog.
+
+    Each open stream holds a server thread; under gunicorn's threaded
+    workers, serve /api/events from the ASGI app (create_asgi_app) instead.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an integer.'}), 400
+
+    subscription = event_bus.subscribe(last_event_id)
+    if subscription is None:
+        return jsonify({'error': 'Too many event stream subscribers.'}), 503, {'Retry-After': '30'}
+
+    def stream():
+        with subscription:
+            yield 'retry: 3000\n\n'
+            while not subscription.closed:
+                # The keep-alive comment stops proxies timing out and detects disconnected clients
+                yield subscription.take_sse(timeout=EVENT_HEARTBEAT) or ': keep-alive\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream', headers=EVENT_STREAM_HEADERS)
+    # Also unsubscribes if the client goes away before the stream starts
+    response.call_on_close(subscription.close)
+    return response
+
+@api_bp.route('/events/stats')
+def event_stats_api():
+    """
+    Report event bus subscribers and publish, delivery and overflow counters.
+    """
+    return jsonify(event_bus.stats())
+
+@api_bp.route('/loans', methods=['POST'])
+def borrow_book_api():
+    """
+    Borrow a book for a patron.
+    JSON interface for R3: Book Borrowing
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('book_id'), int):
+        return jsonify({'error': 'book_id must be an integer.'}), 400
+    
+    success, message = borrow_book_by_patron(str(data.get('patron_id', '')), data['book_id'])
+    return jsonify({'success': success, 'message': message}), 200 if success else 400
+
+@api_bp.route('/returns', methods=['POST'])
+def return_book_api():
+    """
+    Return a patron's borrowed book.
+    JSON interface for R4: Book Return Processing
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('book_id'), int):
+        return jsonify({'error': 'book_id must be an integer.'}), 400
+    
+    success, message = return_book_by_patron(str(data.get('patron_id', '')), data['book_id'])
+    return jsonify({'success': success, 'message': message}), 200 if success else 400
+
+@api_bp.route('/holds', methods=['POST'])
+def place_hold_api():
+    """
+    Join the hold queue for a book with no copies available.
+    Returns the hold with its queue position.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('book_id'), int):
+        return jsonify({'error': 'book_id must be an integer.'}), 400
+    
+    success, message, hold = place_hold(str(data.get('patron_id', '')), data['book_id'])
+    return jsonify({'success': success, 'message': message, 'hold': hold}), 200 if success else 400
+
+@api_bp.route('/holds/<patron_id>/<int:book_id>', methods=['GET', 'DELETE'])
+def hold_api(patron_id, book_id):
+    """
+    Get a patron's hold on a book (status, queue position, pickup deadline), or cancel it.
+    """
+    if request.method == 'DELETE':
+        success, message = cancel_hold(patron_id, book_id)
+        return jsonify({'success': success, 'message': message}), 200 if success else 404
+    
+    hold = get_hold_status(patron_id, book_id)
+    if hold is None:
+        return jsonify({'error': 'No active hold on this book.'}), 404
+    return jsonify(hold)
+
+@api_bp.route('/late-fees', methods=['POST'])
+def pay_late_fees_api():
+    """
+    Charge a book's late fee and wait for the gateway's answer.
+    Use POST /api/payments to queue the charge instead.
+    """
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('book_id'), int):
+        return jsonify({'error': 'book_id must be an integer.'}), 400
+    
+    success, message, transaction_id = pay_late_fees(str(data.get('patron_id', '')), data['book_id'])
+    return jsonify({'success': success, 'message': message, 'transaction_id': transaction_id}), 200 if success else 400
+
+@api_bp.route('/payments', methods=['POST'])
+def submit_payment_api():
+    """
+    Queue payment of a book's late fee and return the job id straight away.
+    Poll /api/payments/<job_id> for the outcome and transaction id.
+    """
+    data = request.get_json(silent=True) or {}
+    book_id = data.get('book_id')
+    if not isinstance(book_id, int):
+        return jsonify({'error': 'book_id must be an integer.'}), 400
+    
+    success, message, job_id = submit_late_fee_payment(str(data.get('patron_id', '')), book_id)
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    return jsonify({'job_id': job_id, 'status': 'queued', 'message': message}), 202
+
+@api_bp.route('/payments/refunds', methods=['POST'])
+def submit_refund_api():
+    """
+    Queue a late fee refund and return the job id straight away.
+    """
+    data = request.get_json(silent=True) or {}
+    amount = data.get('amount')
+    if not isinstance(amount, (int, float)) or isinstance(amount, bool):
+        return jsonify({'error': 'amount must be a number.'}), 400
+    
+    success, message, job_id = submit_refund(str(data.get('transaction_id', '')), float(amount))
+    if not success:
+        return jsonify({'error': message}), 400
+    
+    return jsonify({'job_id': job_id, 'status': 'queued', 'message': message}), 202
+
+@api_bp.route('/payments/gateway')
+def payment_gateway_metrics():
+    """
+    Report payment gateway circuit breaker state, call counters and latency histograms.
+    """
+    return jsonify(get_payment_gateway().metrics())
+
+@api_bp.route('/payments/status/<transaction_id>')
+def payment_status_lookup_api(transaction_id):
+    """
+    Gateway status of one transaction, served from the status cache when possible.
+    """
+    try:
+        status = verify_payment_status(transaction_id)
+    except Exception as e:
+        return jsonify({'error': f'Payment status unavailable: {e}'}), 503
+    return jsonify(status), 404 if status.get('status') == 'not_found' else 200
+
+@api_bp.route('/payments/status', methods=['POST'])
+def payment_status_batch_api():
+    """
+    Gateway status of several transactions in one request.
+    """
+    data = request.get_json(silent=True) or {}
+    transaction_ids = data.get('transaction_ids')
+    if not isinstance(transaction_ids, list) or not all(isinstance(t, str) for t in transaction_ids):
+        return jsonify({'error': 'transaction_ids must be a list of strings.'}), 400
+    if not 0 < len(transaction_ids) <= VERIFY_MANY_LIMIT:
+        return jsonify({'error': f'Between 1 and {VERIFY_MANY_LIMIT} transaction ids are allowed.'}), 400
+    
+    return jsonify({'results': verify_many(transaction_ids)})
+
+@api_bp.route('/payments/status-cache')
+def payment_status_cache_metrics():
+    """
+    Report payment status cache and request coalescing counters.
+    """
+    return jsonify(payment_status_cache.stats())
+
+@api_bp.route('/payments/<int:job_id>')
+def payment_status_api(job_id):
+    """
+    Status of a queued payment or refund job.
+    """
+    job = get_payment_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Payment job not found.'}), 404
+    return jsonify(job)
+
 @api_bp.route('/search')
 def search_books_api():
     """
@@ -24,12 +359,16 @@ def search_books_api():
     """
     search_term = request.args.get('q', '').strip()
     search_type = request.args.get('type', 'title')
+    limit = request.args.get('limit', SEARCH_LIMIT, type=int)
     
     if not search_term:
         return jsonify({'error': 'Search term is required'}), 400
     
+    if limit <= 0 or limit > CATALOG_MAX_PAGE_SIZE:
+        return jsonify({'error': f'Limit must be between 1 and {CATALOG_MAX_PAGE_SIZE}.'}), 400
+    
     # Use business logic function
-    books = search_books_in_catalog(search_term, search_type)
+    books = search_books_in_catalog(search_term, search_type, limit)
     
     return jsonify({
         'search_term': search_term,
@@ -37,3 +376,27 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+@api_bp.route('/db/pool')
+def db_pool_metrics():
+    """
+    Report connection pool counters for the configured database.
+    """
+    return jsonify(get_pool_metrics())
+
+@api_bp.route('/db/cache')
+def book_cache_metrics():
+    """
+    Report book lookup cache counters.
+    """
+    return jsonify(get_book_cache_stats())
+
+@api_bp.route('/db/catalog-index')
+def catalog_index_metrics():
+    """
+    Report catalog index counters and memory footprint.
+    """
+    stats = get_catalog_index_stats()
+    if stats is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(stats, enabled=True))
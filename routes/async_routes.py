@@ -0,0 +1,218 @@
+"""
+Async Routes - ASGI endpoints for the hot JSON API paths
+Serves search, catalog pages, borrowing, returns, late fee payments and the catalog event
+stream with coroutines; every other request is handed to the Flask app when asgiref is installed
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+from instrumentation import registry
+from services import async_service
+from services.event_bus import event_bus, EVENT_HEARTBEAT, EVENT_POLL_INTERVAL, EVENT_STREAM_HEADERS
+from services.library_service import CATALOG_MAX_PAGE_SIZE
+from database import SEARCH_LIMIT
+
+MAX_BODY_BYTES = 1024 * 1024
+
+# (status, JSON body)
+Reply = Tuple[int, Dict]
+
+
+class AsyncApiApp:
+    """
+    ASGI 3 application with async handlers for the high-traffic API endpoints.
+
+    The JSON contracts match the Flask routes of the same paths. A request
+    waiting on SQLite or the payment gateway holds a coroutine rather than a
+    server thread, so one worker can keep thousands of connections open.
+    """
+
+    def __init__(self, fallback: Optional[Callable] = None):
+        self.fallback = fallback
+        self.routes: Dict[Tuple[str, str], Callable[[Dict, Callable], Awaitable[Reply]]] = {
+            ('GET', '/api/search'): self.search,
+            ('GET', '/api/books'): self.books,
+            ('POST', '/api/loans'): self.borrow,
+            ('POST', '/api/returns'): self.return_book,
+            ('POST', '/api/late-fees'): self.pay_late_fees,
+        }
+        # Handlers that send their own (streaming) response
+        self.streams: Dict[Tuple[str, str], Callable[[Dict, Callable, Callable], Awaitable[None]]] = {
+            ('GET', '/api/events'): self.events,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        stream = self.streams.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if stream is not None:
+            registry.inc('library_http_requests_total',
+                         (('endpoint', f'async.{stream.__name__}'), ('method', scope['method']), ('status', '200')))
+            await stream(scope, receive, send)
+            return
+        handler = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if handler is None:
+            if self.fallback is not None:
+                await self.fallback(scope, receive, send)
+            elif scope['type'] == 'http':
+                await _send_json(send, 404, {'error': 'Not found.'})
+            return
+
+        started = time.perf_counter()
+        try:
+            status, body = await handler(scope, receive)
+        except Exception as e:
+            status, body = 500, {'error': f'Internal error: {e}'}
+        endpoint = f'async.{handler.__name__}'
+        registry.inc('library_http_requests_total',
+                     (('endpoint', endpoint), ('method', scope['method']), ('status', str(status))))
+        registry.observe('library_http_request_seconds', time.perf_counter() - started,
+                         (('endpoint', endpoint), ('method', scope['method'])))
+        await _send_json(send, status, body)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                async_service.shutdown_async_service()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def search(self, scope, receive) -> Reply:
+        args = _query(scope)
+        search_term = args.get('q', '').strip()
+        search_type = args.get('type', 'title')
+        try:
+            limit = int(args.get('limit', SEARCH_LIMIT))
+        except ValueError:
+            limit = SEARCH_LIMIT
+
+        if not search_term:
+            return 400, {'error': 'Search term is required'}
+        if limit <= 0 or limit > CATALOG_MAX_PAGE_SIZE:
+            return 400, {'error': f'Limit must be between 1 and {CATALOG_MAX_PAGE_SIZE}.'}
+
+        books = await async_service.search_books_in_catalog(search_term, search_type, limit)
+        return 200, {'search_term': search_term, 'search_type': search_type, 'results': books, 'count': len(books)}
+
+    async def books(self, scope, receive) -> Reply:
+        args = _query(scope)
+        limit = None
+        if 'limit' in args:
+            try:
+                limit = int(args['limit'])
+            except ValueError:
+                return 400, {'error': 'Limit must be an integer.'}
+
+        page = await async_service.get_catalog_page(limit=limit, cursor=args.get('cursor'))
+        if 'error' in page:
+            return 400, page
+        return 200, {'results': page['books'], 'count': len(page['books']), 'limit': page['limit'],
+                     'next_cursor': page['next_cursor']}
+
+    async def borrow(self, scope, receive) -> Reply:
+        data = await _json_body(receive)
+        if not isinstance(data.get('book_id'), int):
+            return 400, {'error': 'book_id must be an integer.'}
+        success, message = await async_service.borrow_book_by_patron(str(data.get('patron_id', '')), data['book_id'])
+        return 200 if success else 400, {'success': success, 'message': message}
+
+    async def return_book(self, scope, receive) -> Reply:
+        data = await _json_body(receive)
+        if not isinstance(data.get('book_id'), int):
+            return 400, {'error': 'book_id must be an integer.'}
+        success, message = await async_service.return_book_by_patron(str(data.get('patron_id', '')), data['book_id'])
+        return 200 if success else 400, {'success': success, 'message': message}
+
+    async def pay_late_fees(self, scope, receive) -> Reply:
+        data = await _json_body(receive)
+        if not isinstance(data.get('book_id'), int):
+            return 400, {'error': 'book_id must be an integer.'}
+        success, message, transaction_id = await async_service.pay_late_fees(str(data.get('patron_id', '')), data['book_id'])
+        return 200 if success else 400, {'success': success, 'message': message, 'transaction_id': transaction_id}
+
+    async def events(self, scope, receive, send):
+        """
+        Server-Sent Events stream of catalog changes, like the Flask /api/events.
+
+        The open stream costs a coroutine polling its subscription buffer
+        every EVENT_POLL_INTERVAL seconds rather than a server thread.
+        """
+        headers = dict(scope.get('headers', []))
+        last_event_id = headers.get(b'last-event-id', b'').decode('latin-1') or _query(scope).get('last_event_id')
+        try:
+            last_event_id = int(last_event_id) if last_event_id else None
+        except ValueError:
+            await _send_json(send, 400, {'error': 'Last-Event-ID must be an integer.'})
+            return
+
+        subscription = event_bus.subscribe(last_event_id)
+        if subscription is None:
+            await _send_json(send, 503, {'error': 'Too many event stream subscribers.'}, {'Retry-After': '30'})
+            return
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            with subscription:
+                await send({
+                    'type': 'http.response.start',
+                    'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream; charset=utf-8')]
+                               + [(name.lower().encode(), value.encode()) for name, value in EVENT_STREAM_HEADERS.items()],
+                })
+                await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+                idle = 0.0
+                while not disconnected.done():
+                    chunk = subscription.take_sse(0)
+                    if not chunk and idle >= EVENT_HEARTBEAT:
+                        chunk = ': keep-alive\n\n'
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+                        idle = 0.0
+                    await asyncio.wait({disconnected}, timeout=EVENT_POLL_INTERVAL)
+                    idle += EVENT_POLL_INTERVAL
+        finally:
+            disconnected.cancel()
+
+
+def _query(scope) -> Dict[str, str]:
+    """First value of each query string parameter."""
+    return {key: values[0] for key, values in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+async def _json_body(receive) -> Dict:
+    """Read the request body and parse it as a JSON object ({} if it is not one)."""
+    body, more = b'', True
+    while more:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return {}
+        body += message.get('body', b'')
+        more = message.get('more_body', False)
+        if len(body) > MAX_BODY_BYTES:
+            return {}
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+async def _wait_for_disconnect(receive):
+    """Read (and drop) request messages until the client disconnects."""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+async def _send_json(send, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+    payload = json.dumps(body).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode())]
+                   + [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
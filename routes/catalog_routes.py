@@ -3,8 +3,7 @@ Catalog Routes - Book catalog related endpoints
 """
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from services.library_service import add_book_to_catalog, get_catalog_page
 
 catalog_bp = Blueprint('catalog', __name__)
 
@@ -16,11 +15,17 @@ def index():
 @catalog_bp.route('/catalog')
 def catalog():
     """
-    Display all books in the catalog.
+    Display the catalog one page at a time.
     Implements R2: Book Catalog Display
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    cursor = request.args.get('cursor', '').strip() or None
+    page = get_catalog_page(cursor=cursor, records=True)
+    if 'error' in page:
+        flash(page['error'], 'error')
+        cursor = None
+        page = get_catalog_page(records=True)
+    
+    return render_template('catalog.html', books=page['books'], next_cursor=page['next_cursor'], cursor=cursor)
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,66 @@
+"""
+Metrics Routes - Prometheus scrape endpoint and recent request traces
+"""
+
+from flask import Blueprint, Response, jsonify, request
+from instrumentation import recent_traces, registry, startup_report
+from services.event_bus import event_bus
+from services.payment_status import payment_status_cache
+from database import get_pool_metrics, get_book_cache_stats
+
+metrics_bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def collect_runtime_gauges():
+    """Pool, cache and event stream gauges read at scrape time."""
+    pools = get_pool_metrics()
+    yield ('library_db_pool_connections', 'gauge', 'Pooled SQLite connections by pool and state.', [
+        ({'pool': name, 'state': state}, pool[state])
+        for name, pool in pools.items() for state in ('in_use', 'idle', 'size')
+    ])
+    yield ('library_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a connection.', [
+        ({'pool': name}, pool['timeouts']) for name, pool in pools.items()
+    ])
+    caches = {'book': get_book_cache_stats(), 'payment_status': payment_status_cache.stats()['cache']}
+    yield ('library_cache_entries', 'gauge', 'Entries held by each in-process cache.', [
+        ({'cache': name}, stats['size']) for name, stats in caches.items()
+    ])
+    yield ('library_cache_lookups_total', 'counter', 'Cache lookups by cache and result.', [
+        ({'cache': name, 'result': result}, stats[result])
+        for name, stats in caches.items() for result in ('hits', 'misses')
+    ])
+    events = event_bus.stats()
+    yield ('library_event_subscribers', 'gauge', 'Connected event stream clients.', [({}, events['subscribers'])])
+    yield ('library_events_published_total', 'counter', 'Events published to the event bus.', [({}, events['published'])])
+
+registry.register_collector(collect_runtime_gauges)
+
+
+@metrics_bp.route('/metrics')
+def prometheus_metrics():
+    """
+    Expose request, function, SQL and runtime metrics in Prometheus text format.
+    """
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@metrics_bp.route('/metrics/traces')
+def recent_request_traces():
+    """
+    Span breakdown of the most recent requests, slowest first with ?sort=slowest.
+    """
+    traces = list(recent_traces)
+    if request.args.get('sort') == 'slowest':
+        traces.sort(key=lambda trace: -trace['seconds'])
+    else:
+        traces.reverse()
+    limit = request.args.get('limit', len(traces), type=int)
+    return jsonify({'traces': traces[:max(limit, 0)]})
+
+@metrics_bp.route('/metrics/startup')
+def startup_timings():
+    """
+    Duration of each create_app startup phase and the time to the first response.
+    """
+    return jsonify(startup_report())
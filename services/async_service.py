@@ -0,0 +1,107 @@
+"""
+Async Service Module - asyncio versions of the hot library operations
+Blocking SQLite work runs on a dedicated DB executor and gateway calls are awaited, so no coroutine blocks the event loop
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from database import POOL_SIZE, WRITE_POOL_SIZE, SEARCH_LIMIT
+from services import library_service
+from services.gateway_resilience import get_payment_gateway
+from services.payment_service import AsyncPaymentGateway, PaymentOutcomeUnknown
+
+# One executor thread per pooled connection: more threads would only wait on the pools
+DB_EXECUTOR_WORKERS = int(os.environ.get('LIBRARY_DB_EXECUTOR_WORKERS', str(POOL_SIZE + WRITE_POOL_SIZE)))
+
+_db_executor: Optional[ThreadPoolExecutor] = None
+_async_gateway: Optional[AsyncPaymentGateway] = None
+_lock = threading.Lock()
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Return the process-wide executor that runs blocking database work for coroutines."""
+    global _db_executor
+    with _lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix='db-executor')
+        return _db_executor
+
+def get_async_payment_gateway() -> AsyncPaymentGateway:
+    """Return an asyncio wrapper around the shared resilient payment gateway."""
+    global _async_gateway
+    gateway = get_payment_gateway()
+    with _lock:
+        if _async_gateway is None or _async_gateway.gateway is not gateway:
+            stale, _async_gateway = _async_gateway, AsyncPaymentGateway(gateway)
+            if stale is not None:
+                # The shared gateway was reset; its owner closes it
+                stale.close(close_gateway=False)
+        return _async_gateway
+
+def shutdown_async_service():
+    """Stop the DB executor and the async gateway threads (the shared gateway itself stays open)."""
+    global _db_executor, _async_gateway
+    with _lock:
+        executor, _db_executor = _db_executor, None
+        gateway, _async_gateway = _async_gateway, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if gateway is not None:
+        gateway.close(close_gateway=False)
+
+async def run_db(func: Callable, *args, **kwargs):
+    """Run a blocking database or service function on the DB executor and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+async def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
+    """Async library_service.borrow_book_by_patron."""
+    return await run_db(library_service.borrow_book_by_patron, patron_id, book_id)
+
+async def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
+    """Async library_service.return_book_by_patron."""
+    return await run_db(library_service.return_book_by_patron, patron_id, book_id)
+
+async def search_books_in_catalog(search_term: str, search_type: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
+    """Async library_service.search_books_in_catalog."""
+    return await run_db(library_service.search_books_in_catalog, search_term, search_type, limit)
+
+async def get_catalog_page(limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict:
+    """Async library_service.get_catalog_page."""
+    return await run_db(library_service.get_catalog_page, limit, cursor)
+
+async def pay_late_fees(patron_id: str, book_id: int,
+                        payment_gateway: Optional[AsyncPaymentGateway] = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Async library_service.pay_late_fees.
+
+    The ledger reservation and completion run on the DB executor; the
+    gateway call is awaited in between, so a slow gateway holds neither an
+    executor thread nor a database connection.
+
+    Returns:
+        tuple: (success: bool, message: str, transaction_id: Optional[str])
+    """
+    charge, result = await run_db(library_service.begin_late_fee_payment, patron_id, book_id)
+    if result is not None:
+        return result
+
+    if payment_gateway is None:
+        payment_gateway = get_async_payment_gateway()
+
+    try:
+        success, transaction_id, message = await payment_gateway.process_payment(
+            patron_id=patron_id,
+            amount=charge['amount'],
+            description=charge['description']
+        )
+        result = library_service.late_fee_charge_result(success, transaction_id, message)
+    except PaymentOutcomeUnknown as e:
+        return await run_db(library_service.late_fee_charge_unknown, charge['payment_id'], e)
+    except Exception as e:
+        result = False, f"Payment processing error: {str(e)}", None
+
+    return await run_db(library_service.finish_late_fee_payment, charge['payment_id'], result)
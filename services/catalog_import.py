@@ -0,0 +1,146 @@
+"""
+Catalog Import Module - Bulk loading of books from CSV or JSONL
+Parses input lazily and inserts in chunked transactions with executemany
+"""
+
+import csv
+import json
+import sqlite3
+import sys
+import time
+from itertools import islice
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+from instrumentation import instrument_module
+from database import get_existing_isbns, insert_books_bulk
+from services.library_service import validate_book_fields
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+IMPORT_FIELDS = ('title', 'author', 'isbn', 'total_copies')
+
+
+def iter_csv_rows(stream: IO[str]) -> Iterator[Tuple[int, Dict]]:
+    """
+    Yield (line number, row) pairs from a CSV file with a header row.
+
+    The header must include title, author, isbn and total_copies.
+    """
+    reader = csv.DictReader(stream)
+    missing = [field for field in IMPORT_FIELDS if field not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+    for row in reader:
+        yield reader.line_num, row
+
+def iter_jsonl_rows(stream: IO[str]) -> Iterator[Tuple[int, Dict]]:
+    """Yield (line number, row) pairs from a JSON Lines file, skipping blank lines."""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else {'_error': "Line is not a JSON object."}
+
+def iter_rows(stream: IO[str], file_format: str) -> Iterator[Tuple[int, Dict]]:
+    """Yield rows from a CSV or JSONL stream."""
+    if file_format == 'csv':
+        return iter_csv_rows(stream)
+    if file_format == 'jsonl':
+        return iter_jsonl_rows(stream)
+    raise ValueError(f"Unsupported import format: {file_format!r}")
+
+def _clean_row(row: Dict) -> Tuple[Optional[Tuple[str, str, str, int]], Optional[str]]:
+    """Normalise one parsed row and apply the add_book_to_catalog validation rules."""
+    if '_error' in row:
+        return None, row['_error']
+    title = str(row.get('title') or '')
+    author = str(row.get('author') or '')
+    isbn = str(row.get('isbn') or '').strip()
+    copies = row.get('total_copies')
+    if isinstance(copies, int) and not isinstance(copies, bool):
+        total_copies = copies
+    else:
+        try:
+            total_copies = int(str(copies).strip())
+        except ValueError:
+            total_copies = None
+    error = validate_book_fields(title, author, isbn, total_copies)
+    if error:
+        return None, error
+    return (title.strip(), author.strip(), isbn, total_copies), None
+
+def import_books(rows: Iterable[Tuple[int, Dict]], chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """
+    Validate and insert books from an iterable of (line number, row) pairs.
+
+    Rows are consumed chunk by chunk. Each chunk is validated, checked for
+    ISBNs already in the catalog with one query, and inserted in one transaction.
+
+    Args:
+        rows: (line number, row dict) pairs, e.g. from iter_rows
+        chunk_size: Rows per transaction
+
+    Returns:
+        dict: Counts of rows read, inserted and rejected, per-row errors and throughput
+    """
+    report = {'rows': 0, 'inserted': 0, 'rejected': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+    rows = iter(rows)
+
+    def reject(line_number, isbn, message):
+        report['rejected'] += 1
+        if len(report['errors']) < MAX_REPORTED_ERRORS:
+            report['errors'].append({'line': line_number, 'isbn': isbn, 'error': message})
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        report['rows'] += len(chunk)
+
+        valid: List[Tuple[int, Tuple[str, str, str, int]]] = []
+        for line_number, row in chunk:
+            book, error = _clean_row(row)
+            if error:
+                reject(line_number, str(row.get('isbn') or ''), error)
+            else:
+                valid.append((line_number, book))
+
+        existing = get_existing_isbns([book[2] for _, book in valid])
+        seen = set()
+        batch = []
+        batch_lines = []
+        for line_number, (title, author, isbn, total_copies) in valid:
+            if isbn in existing or isbn in seen:
+                reject(line_number, isbn, "A book with this ISBN already exists.")
+                continue
+            seen.add(isbn)
+            batch.append((title, author, isbn, total_copies, total_copies))
+            batch_lines.append(line_number)
+
+        if batch:
+            try:
+                skipped = set(insert_books_bulk(batch))
+            except sqlite3.Error:
+                for line_number, book in zip(batch_lines, batch):
+                    reject(line_number, book[2], "Database error occurred while adding the book.")
+                continue
+            report['inserted'] += len(batch) - len(skipped)
+            # Another writer added these ISBNs after the duplicate check
+            for line_number, book in zip(batch_lines, batch):
+                if book[2] in skipped:
+                    reject(line_number, book[2], "A book with this ISBN already exists.")
+
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    if report['seconds']:
+        report['rows_per_second'] = round(report['rows'] / report['seconds'], 1)
+    return report
+
+def import_books_from_stream(stream: IO[str], file_format: str, chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict:
+    """Import books from an open CSV or JSONL text stream."""
+    return import_books(iter_rows(stream, file_format), chunk_size)
+
+
+instrument_module(sys.modules[__name__], exclude=('iter_csv_rows', 'iter_jsonl_rows', 'iter_rows'))
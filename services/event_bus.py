@@ -0,0 +1,324 @@
+"""
+Event Bus Module - Publish/subscribe for catalog change events
+Feeds the Server-Sent Events stream at /api/events with availability deltas
+"""
+
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, Union
+from database import CATALOG_EVENT_HISTORY, append_catalog_event, get_catalog_event_range, get_catalog_events
+
+EVENT_BUFFER_SIZE = int(os.environ.get('LIBRARY_EVENT_BUFFER_SIZE', '256'))
+EVENT_HISTORY_SIZE = CATALOG_EVENT_HISTORY
+EVENT_MAX_SUBSCRIBERS = int(os.environ.get('LIBRARY_EVENT_MAX_SUBSCRIBERS', '1000'))
+# Seconds between keep-alive comments on an idle event stream
+EVENT_HEARTBEAT = float(os.environ.get('LIBRARY_EVENT_HEARTBEAT', '15'))
+# Seconds between reads of the shared change feed while a process has subscribers
+EVENT_POLL_INTERVAL = float(os.environ.get('LIBRARY_EVENT_POLL_INTERVAL', '0.5'))
+
+# Response headers for an event stream: never cached, never buffered by a proxy
+EVENT_STREAM_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+# (id, type, data)
+Event = Tuple[int, str, Dict]
+
+
+class Subscription:
+    """
+    One subscriber's bounded buffer of pending events.
+
+    A subscriber that falls more than maxsize events behind loses the
+    backlog and is marked overflowed, so a slow client costs at most
+    maxsize events of memory and never slows down publishers.
+    """
+
+    def __init__(self, bus: 'EventBus', maxsize: int):
+        self._bus = bus
+        self._events: Deque[Event] = deque()
+        self._maxsize = maxsize
+        self._ready = threading.Condition(threading.Lock())
+        self.overflowed = False
+        self.closed = False
+
+    def _push(self, event: Event) -> bool:
+        with self._ready:
+            if len(self._events) >= self._maxsize:
+                self._events.clear()
+                self.overflowed = True
+                self._ready.notify()
+                return False
+            self._events.append(event)
+            if len(self._events) == 1:
+                # A reader only waits on an empty buffer
+                self._ready.notify()
+            return True
+
+    def get(self, timeout: Optional[float] = None) -> List[Event]:
+        """
+        Wait up to timeout seconds for events and take all that are pending.
+
+        Returns:
+            list: Pending events, oldest first; empty on timeout, overflow or close
+        """
+        with self._ready:
+            if not self._events and not self.overflowed and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+        return events
+
+    def take_sse(self, timeout: Optional[float] = None) -> str:
+        """
+        Wait like get() and format what was pending as Server-Sent Events.
+
+        A subscriber that overflowed gets a 'reset' event (carrying the
+        latest event id) ahead of anything newer.
+
+        Returns:
+            str: The SSE chunk; empty if nothing was pending
+        """
+        events = self.get(timeout)
+        chunk = ''
+        if self.reset_overflow():
+            chunk = f'event: reset\ndata: {self._bus.stats()["last_event_id"]}\n\n'
+        return chunk + ''.join(f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+                               for event_id, event_type, data in events)
+
+    def reset_overflow(self) -> bool:
+        """Clear and return the overflow flag, once the client has been told to reload."""
+        with self._ready:
+            overflowed, self.overflowed = self.overflowed, False
+        return overflowed
+
+    def close(self):
+        """Unsubscribe and wake any waiting reader."""
+        self._bus._unsubscribe(self)
+        with self._ready:
+            self.closed = True
+            self._ready.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventBus:
+    """
+    Fan out published events to every subscriber's bounded buffer.
+
+    Events are numbered in publish order and the latest history_size are
+    kept, so a reconnecting client can resume after its Last-Event-ID.
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, history_size: int = EVENT_HISTORY_SIZE,
+                 max_subscribers: int = EVENT_MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.history_size = history_size
+        self.max_subscribers = max_subscribers
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        self._subscribers: List[Subscription] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'overflows': 0, 'rejected': 0}
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Optional[Subscription]:
+        """
+        Start buffering events for a new subscriber.
+
+        Args:
+            last_event_id: Replay retained events published after this id
+
+        Returns:
+            Subscription, or None when max_subscribers are already connected
+        """
+        subscription = Subscription(self, self.buffer_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self._stats['rejected'] += 1
+                return None
+            if not self._subscribers:
+                self._start()
+            if last_event_id is not None:
+                self._replay(subscription, last_event_id)
+            self._subscribers.append(subscription)
+        return subscription
+
+    def _start(self):
+        """Called under the lock when the first subscriber arrives."""
+
+    def _replay(self, subscription: Subscription, last_event_id: int):
+        """Push retained events after last_event_id, or flag the subscription if some are gone."""
+        oldest = self._history[0][0] if self._history else None
+        latest = self._history[-1][0] if self._history else 0
+        if last_event_id > latest or (oldest is not None and oldest > last_event_id + 1):
+            # Missed events are no longer retained (or came from before a restart)
+            subscription.overflowed = True
+            return
+        for event in self._history:
+            if event[0] > last_event_id:
+                subscription._push(event)
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event_type: str, data: Union[Dict, Callable[[], Optional[Dict]]]) -> Optional[int]:
+        """
+        Number an event and push it to every subscriber.
+
+        data may be a callable; it is called under the publish lock, so
+        events that read current state (e.g. a book's available copies after
+        a commit) are published in the order those reads were made. A
+        callable returning None publishes nothing.
+
+        Returns:
+            int: The event id, or None if nothing was published
+        """
+        with self._lock:
+            if callable(data):
+                data = data()
+                if data is None:
+                    return None
+            event = (next(self._ids), event_type, data)
+            self._history.append(event)
+            self._stats['published'] += 1
+            self._deliver(event)
+        return event[0]
+
+    def _deliver(self, event: Event):
+        # Pushing under the lock keeps every buffer in event id order
+        delivered = sum(subscription._push(event) for subscription in self._subscribers)
+        self._stats['delivered'] += delivered
+        self._stats['overflows'] += len(self._subscribers) - delivered
+
+    def _latest_event_id(self) -> int:
+        with self._lock:
+            return self._history[-1][0] if self._history else 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['subscribers'] = len(self._subscribers)
+        stats['last_event_id'] = self._latest_event_id()
+        stats['buffer_size'] = self.buffer_size
+        stats['max_subscribers'] = self.max_subscribers
+        return stats
+
+
+class SharedEventBus(EventBus):
+    """
+    Event bus fed from the catalog_events table instead of process memory.
+
+    Events are appended to the table, whose ids are shared by every server
+    process, so a pre-fork worker's subscribers see changes made in the
+    other workers and Last-Event-ID means the same thing in all of them.
+    Availability events are written by the database transaction that
+    changes the copies; publish() appends any other event. While a process
+    has subscribers, one thread polls the table every poll_interval seconds
+    and fans new events out to their buffers; events committed in this
+    process are delivered straight away (see notify).
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE, history_size: int = EVENT_HISTORY_SIZE,
+                 max_subscribers: int = EVENT_MAX_SUBSCRIBERS, poll_interval: float = EVENT_POLL_INTERVAL):
+        super().__init__(buffer_size, history_size, max_subscribers)
+        self.poll_interval = poll_interval
+        # Id of the last feed event delivered to this process's subscribers
+        self._last_seen = 0
+        # Latest id this process has published or seen, so stats() never reads the database
+        self._latest_known = 0
+        self._poller: Optional[threading.Thread] = None
+
+    def publish(self, event_type: str, data: Union[Dict, Callable[[], Optional[Dict]]]) -> Optional[int]:
+        """
+        Append an event to the shared feed and deliver it to this process's subscribers.
+
+        A callable data is called under the database write lock, which
+        orders events across processes the way EventBus orders them within one.
+
+        Returns:
+            int: The event id, or None if nothing was published
+        """
+        event = append_catalog_event(event_type, data, self.history_size)
+        if event is None:
+            return None
+        with self._lock:
+            self._stats['published'] += 1
+            self._latest_known = max(self._latest_known, event[0])
+            subscribed = bool(self._subscribers)
+        if subscribed:
+            self.poll()
+        return event[0]
+
+    def notify(self, count: int = 1):
+        """Deliver events this process has just committed to the feed without waiting for the poller."""
+        with self._lock:
+            self._stats['published'] += count
+            subscribed = bool(self._subscribers)
+        if subscribed:
+            self.poll()
+
+    def poll(self):
+        """Deliver events appended to the feed since the last poll, in id order."""
+        with self._lock:
+            after = self._last_seen
+        events = get_catalog_events(after)
+        with self._lock:
+            self._deliver_new(events)
+
+    def _deliver_new(self, events: List[Event]):
+        for event in events:
+            # A concurrent poll may have delivered some of them already
+            if event[0] > self._last_seen:
+                self._last_seen = event[0]
+                self._deliver(event)
+
+    def _start(self):
+        # Subscribers only get events appended from now on (or replayed)
+        self._last_seen = get_catalog_event_range()[1]
+        if self._poller is None or not self._poller.is_alive():
+            self._poller = threading.Thread(target=self._poll_while_subscribed, name='event-feed-poller', daemon=True)
+            self._poller.start()
+
+    def _poll_while_subscribed(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._poller = None
+                    return
+            try:
+                self.poll()
+            except sqlite3.Error:
+                # The database may be briefly locked or unavailable; try again next interval
+                pass
+            time.sleep(self.poll_interval)
+
+    def _replay(self, subscription: Subscription, last_event_id: int):
+        oldest, latest = get_catalog_event_range()
+        if last_event_id > latest or oldest > last_event_id + 1:
+            # Missed events are no longer retained (or the id is from another database)
+            subscription.overflowed = True
+            return
+        while last_event_id > self._last_seen:
+            # The client saw events another process published before this one polled them
+            events = get_catalog_events(self._last_seen)
+            if not events:
+                break
+            self._deliver_new(events)
+        for event in get_catalog_events(last_event_id, self._last_seen, self.buffer_size + 1):
+            subscription._push(event)
+
+    def _latest_event_id(self) -> int:
+        with self._lock:
+            return max(self._latest_known, self._last_seen)
+
+
+event_bus = SharedEventBus()
@@ -0,0 +1,241 @@
+"""
+Gateway Resilience Module - Timeouts, retries and a circuit breaker around payment gateway calls
+Keeps a slow or failing gateway from tying up request handlers and payment workers
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, Tuple
+from instrumentation import LatencyHistogram, registry
+from services.payment_service import FakePaymentGateway, HttpPaymentGateway, PaymentGateway, PaymentOutcomeUnknown
+
+GATEWAY_TIMEOUT = float(os.environ.get('LIBRARY_GATEWAY_TIMEOUT', '5'))
+GATEWAY_RETRIES = int(os.environ.get('LIBRARY_GATEWAY_RETRIES', '2'))
+GATEWAY_BACKOFF = float(os.environ.get('LIBRARY_GATEWAY_BACKOFF', '0.1'))
+BREAKER_THRESHOLD = int(os.environ.get('LIBRARY_GATEWAY_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET = float(os.environ.get('LIBRARY_GATEWAY_BREAKER_RESET', '30'))
+
+
+class GatewayUnavailable(Exception):
+    """The circuit breaker is open or every gateway slot stayed busy, so the call was not attempted."""
+
+
+class GatewayTimeout(Exception):
+    """A status check got no answer within the call's time budget."""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls
+    until reset_timeout has passed. Then one trial call is let through
+    (half-open): success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_THRESHOLD, reset_timeout: float = BREAKER_RESET,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._stats = {'opened': 0, 'rejected': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == 'open' and self._clock() - self._opened_at >= self.reset_timeout:
+                return 'half_open'
+            return self._state
+
+    def allow(self) -> bool:
+        """Return True if a call may go ahead now."""
+        with self._lock:
+            if self._state == 'closed':
+                return True
+            if self._state == 'open' and self._clock() - self._opened_at >= self.reset_timeout:
+                self._state = 'half_open'
+            if self._state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    self._stats['opened'] += 1
+                self._state = 'open'
+                self._opened_at = self._clock()
+            self._trial_running = False
+
+    def snapshot(self) -> Dict:
+        state = self.state
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update(state=state, consecutive_failures=self._failures,
+                            failure_threshold=self.failure_threshold, reset_timeout=self.reset_timeout)
+        return snapshot
+
+
+class ResilientPaymentGateway(PaymentGateway):
+    """
+    PaymentGateway wrapper that bounds how long callers wait on the gateway.
+
+    - Every call has a time budget and runs on a bounded thread pool, so a
+      hung gateway cannot hold more than max_concurrency threads. A call
+      holds its slot until it really finishes; one that cannot get a slot
+      within its budget is not sent and raises GatewayUnavailable.
+    - Status checks are read-only: a timeout raises GatewayTimeout, and they
+      are retried with jittered exponential backoff within the budget.
+    - Charges and refunds are not retried here. Walking away from one does
+      not stop it reaching the gateway, so a timeout raises
+      PaymentOutcomeUnknown and the payments ledger holds it for
+      reconciliation instead of sending it again.
+    - Errors and timeouts count towards a circuit breaker. While it is open,
+      calls raise GatewayUnavailable immediately.
+    """
+
+    RETRYABLE = ('verify_payment_status',)
+
+    def __init__(self, gateway: PaymentGateway, timeout: float = GATEWAY_TIMEOUT, retries: int = GATEWAY_RETRIES,
+                 backoff: float = GATEWAY_BACKOFF, breaker: Optional[CircuitBreaker] = None):
+        super().__init__(gateway.api_key, gateway.max_concurrency)
+        self.gateway = gateway
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = {name: LatencyHistogram() for name in ('process_payment', 'refund_payment', 'verify_payment_status')}
+        self._executor = ThreadPoolExecutor(max_workers=gateway.max_concurrency, thread_name_prefix='gateway-call')
+        self._slots = threading.BoundedSemaphore(gateway.max_concurrency)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'failures': 0, 'timeouts': 0, 'retries': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _observe(self, name: str, seconds: float):
+        self.latency[name].observe(seconds)
+        registry.observe('library_gateway_call_seconds', seconds, (('operation', name),))
+
+    def _attempt(self, name: str, deadline: float, args: tuple, kwargs: Dict):
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            raise GatewayUnavailable(
+                f"Payment gateway unavailable: {self.gateway.max_concurrency} calls already waiting on it")
+        try:
+            future = self._executor.submit(getattr(self.gateway, name), *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is freed when the call finishes, not when the caller stops waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            if name in self.RETRYABLE:
+                future.cancel()
+                raise GatewayTimeout(f"Payment gateway did not respond within {self.timeout:g}s") from None
+            # The charge or refund may still be applied; it must be reconciled, not sent again
+            raise PaymentOutcomeUnknown(f"Payment gateway did not answer within {self.timeout:g}s") from None
+
+    def _call(self, name: str, *args, **kwargs):
+        deadline = time.monotonic() + self.timeout
+        attempts = 1 + (self.retries if name in self.RETRYABLE else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise GatewayUnavailable("Payment gateway unavailable: circuit breaker is open")
+            self._count('calls')
+            started = time.monotonic()
+            try:
+                result = self._attempt(name, deadline, args, kwargs)
+            except (GatewayTimeout, PaymentOutcomeUnknown) as e:
+                self._count('timeouts')
+                error = e
+            except Exception as e:
+                error = e
+            else:
+                self._observe(name, time.monotonic() - started)
+                self.breaker.record_success()
+                return result
+
+            self._observe(name, time.monotonic() - started)
+            self._count('failures')
+            self.breaker.record_failure()
+            # Full jitter: sleep a random share of the exponential step, within the budget
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            if attempt + 1 == attempts or time.monotonic() + delay >= deadline:
+                raise error
+            self._count('retries')
+            time.sleep(delay)
+
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return self._call('process_payment', patron_id=patron_id, amount=amount, description=description)
+
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return self._call('refund_payment', transaction_id, amount)
+
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        return self._call('verify_payment_status', transaction_id)
+
+    def metrics(self) -> Dict:
+        """Breaker state, call counters and per-operation latency histograms."""
+        with self._lock:
+            metrics = dict(self._stats)
+        metrics['timeout'] = self.timeout
+        metrics['breaker'] = self.breaker.snapshot()
+        metrics['latency'] = {name: histogram.snapshot() for name, histogram in self.latency.items()}
+        return metrics
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        if hasattr(self.gateway, 'close'):
+            self.gateway.close()
+
+
+def create_payment_gateway() -> PaymentGateway:
+    """
+    Gateway client selected by the environment. LIBRARY_PAYMENT_GATEWAY_URL selects
+    the HTTP client with a pooled session; LIBRARY_PAYMENT_GATEWAY=fake the in-process fake.
+    """
+    if os.environ.get('LIBRARY_PAYMENT_GATEWAY_URL'):
+        return HttpPaymentGateway(os.environ['LIBRARY_PAYMENT_GATEWAY_URL'],
+                                  max_concurrency=int(os.environ.get('LIBRARY_PAYMENT_WORKERS', '4')),
+                                  timeout=GATEWAY_TIMEOUT)
+    if os.environ.get('LIBRARY_PAYMENT_GATEWAY') == 'fake':
+        return FakePaymentGateway(float(os.environ.get('LIBRARY_FAKE_GATEWAY_LATENCY', '0')))
+    return PaymentGateway()
+
+
+_gateway: Optional[ResilientPaymentGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_payment_gateway() -> ResilientPaymentGateway:
+    """Return the process-wide gateway, so every caller shares one breaker and one set of metrics."""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = ResilientPaymentGateway(create_payment_gateway())
+        return _gateway
+
+def reset_payment_gateway():
+    """Drop the process-wide gateway (e.g. after changing the environment)."""
+    global _gateway
+    with _gateway_lock:
+        gateway, _gateway = _gateway, None
+    if gateway is not None:
+        gateway.close()
@@ -0,0 +1,133 @@
+"""
+History Export Module - Streaming borrowing-history exports
+Rows are read from SQLite and encoded a chunk at a time, so an export never holds the table in memory
+"""
+
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Dict, IO, Iterator, Optional
+from instrumentation import instrument_module
+from database import BORROW_HISTORY_COLUMNS, iter_borrow_history
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'columnar')
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MEDIA_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'columnar': 'application/x-ndjson',
+}
+EXPORT_EXTENSIONS = {'csv': 'csv', 'jsonl': 'jsonl', 'columnar': 'columns.jsonl'}
+
+
+def validate_export_filters(file_format: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                            patron_id: Optional[str] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Optional[str]:
+    """Check export options, returning an error message or None if they are valid."""
+    if file_format not in EXPORT_FORMATS:
+        return f"Format must be one of: {', '.join(EXPORT_FORMATS)}."
+    if patron_id is not None and (not patron_id.isdigit() or len(patron_id) != 6):
+        return "Invalid patron ID. Must be exactly 6 digits."
+    if start is not None and end is not None and start >= end:
+        return "Start date must be before end date."
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        return "Chunk size must be a positive integer."
+    return None
+
+def _chunks(rows: Iterator[tuple], chunk_size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _encode_csv(chunks: Iterator[list]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BORROW_HISTORY_COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: no rows matched
+        yield buffer.getvalue()
+
+def _encode_jsonl(chunks: Iterator[list]) -> Iterator[str]:
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(BORROW_HISTORY_COLUMNS, row))) + '\n' for row in chunk)
+
+def _encode_columnar(chunks: Iterator[list]) -> Iterator[str]:
+    # One JSON object per row group, each column's values stored together
+    for chunk in chunks:
+        columns = dict(zip(BORROW_HISTORY_COLUMNS, (list(values) for values in zip(*chunk))))
+        yield json.dumps({'rows': len(chunk), 'columns': columns}) + '\n'
+
+ENCODERS = {'csv': _encode_csv, 'jsonl': _encode_jsonl, 'columnar': _encode_columnar}
+
+def _history_chunks(file_format, start, end, patron_id, overdue_only, as_of, chunk_size) -> Iterator[list]:
+    error = validate_export_filters(file_format, start, end, patron_id, chunk_size)
+    if error:
+        raise ValueError(error)
+    rows = iter_borrow_history(as_of or datetime.now(), start, end, patron_id, overdue_only, batch_size=chunk_size)
+    return _chunks(rows, chunk_size)
+
+def iter_history_export(file_format: str = 'csv', start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        patron_id: Optional[str] = None, overdue_only: bool = False,
+                        as_of: Optional[datetime] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """
+    Export borrowing history as text chunks, oldest borrow first.
+
+    Each chunk encodes up to chunk_size borrow records: CSV rows (after a
+    header), JSON Lines, or in 'columnar' form one JSON row group per chunk
+    holding a list of values per column. Options are checked before the
+    first chunk is produced, so invalid filters raise ValueError right away.
+
+    Args:
+        file_format: 'csv', 'jsonl' or 'columnar'
+        start: Only loans borrowed at or after this time
+        end: Only loans borrowed before this time
+        patron_id: Only this patron's loans
+        overdue_only: Only loans returned late or still open past their due date
+        as_of: Time to measure lateness of open loans against (default: now)
+        chunk_size: Records per chunk
+
+    Yields:
+        str: Encoded chunks, ready to write or send
+    """
+    chunks = _history_chunks(file_format, start, end, patron_id, overdue_only, as_of, chunk_size)
+    return ENCODERS[file_format](chunks)
+
+def write_history_export(stream: IO[str], file_format: str = 'csv', start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, patron_id: Optional[str] = None, overdue_only: bool = False,
+                         as_of: Optional[datetime] = None, chunk_size: int = EXPORT_CHUNK_SIZE) -> Dict:
+    """Stream an export to an open text stream and return the row count and timing."""
+    started = time.perf_counter()
+    exported = 0
+
+    def counted(chunks):
+        nonlocal exported
+        for chunk in chunks:
+            exported += len(chunk)
+            yield chunk
+
+    chunks = _history_chunks(file_format, start, end, patron_id, overdue_only, as_of, chunk_size)
+    for text in ENCODERS[file_format](counted(chunks)):
+        stream.write(text)
+
+    seconds = time.perf_counter() - started
+    return {
+        'format': file_format,
+        'rows': exported,
+        'seconds': round(seconds, 3),
+        'rows_per_second': round(exported / seconds, 1) if seconds else 0.0,
+    }
+
+
+instrument_module(sys.modules[__name__])
@@ -3,48 +3,72 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
+import base64
+import binascii
+import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, get_borrow_record, get_book_by_author, get_book_by_title, get_patron_borrowed_books
+    get_book_by_id, get_book_by_isbn, get_patron_report_rows, insert_book, get_borrow_record,
+    borrow_book_atomic, return_book_atomic, get_books_page, search_books_fulltext, SEARCH_LIMIT,
+    place_hold_atomic, cancel_hold_atomic, get_active_hold, expire_holds,
+    reserve_payment, complete_payment_job, mark_payment_unknown, reserve_refund, release_refund, get_loan_charges
 )
+import sqlite3
+import sys
 from math import ceil
-from services.payment_service import PaymentGateway
+from instrumentation import instrument_module
+from services.payment_service import PaymentGateway, PaymentOutcomeUnknown
+from services.gateway_resilience import get_payment_gateway
+from services.payment_status import payment_status_cache
+from services.event_bus import event_bus
 
-def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+def validate_book_fields(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
     """
-    Add a new book to the catalog.
-    Implements R1: Book Catalog Management
+    Check new-book fields against the R1 rules.
+    Shared by add_book_to_catalog and the bulk catalog import.
     
-    Args:
-        title: Book title (max 200 chars)
-        author: Book author (max 100 chars)
-        isbn: 13-digit ISBN
-        total_copies: Number of copies (positive integer)
-        
     Returns:
-        tuple: (success: bool, message: str)
+        str: The first validation error message, or None if the fields are valid
     """
-    # Input validation
     if not title or not title.strip():
-        return False, "Title is required."
+        return "Title is required."
     
     if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
+        return "Title must be less than 200 characters."
     
     if not author or not author.strip():
-        return False, "Author is required."
+        return "Author is required."
     
     if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
+        return "Author must be less than 100 characters."
     
     if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
+        return "ISBN must be exactly 13 digits."
     
     if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+        return "Total copies must be a positive integer."
+    
+    return None
+
+def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    """
+    Add a new book to the catalog.
+    Implements R1: Book Catalog Management
+    
+    Args:
+        title: Book title (max 200 chars)
+        author: Book author (max 100 chars)
+        isbn: 13-digit ISBN
+        total_copies: Number of copies (positive integer)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Input validation
+    error = validate_book_fields(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -54,6 +78,9 @@ def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -
     # Insert new book
     success = insert_book(title.strip(), author.strip(), isbn, total_copies, total_copies)
     if success:
+        book = get_book_by_isbn(isbn)
+        if book:
+            event_bus.publish('book_added', dict(book, book_id=book['id']))
         return True, f'Book "{title.strip()}" has been successfully added to the catalog.'
     else:
         return False, "Database error occurred while adding the book."
@@ -75,32 +102,27 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
+    # Check if book exists; availability is checked inside the borrow transaction
+    # because the book lookup may be served from the cache
     book = get_book_by_id(book_id)
     if not book:
         return False, "Book not found."
     
-    if book['available_copies'] <= 0:
-        return False, "This book is currently not available."
-    
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    if current_borrowed >= 5:
-        return False, "You have reached the maximum borrowing limit of 5 books."
-    
     # Create borrow record
     borrow_date = datetime.now()
     due_date = borrow_date + timedelta(days=14)
     
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
+    # Check the borrowing limit, take a copy and insert the borrow record in one transaction
+    outcome = borrow_book_atomic(patron_id, book_id, borrow_date, due_date, 5)
+    if outcome == 'not_found':
+        return False, "Book not found."
+    if outcome == 'unavailable':
+        return False, "This book is currently not available."
+    if outcome == 'limit_reached':
+        return False, "You have reached the maximum borrowing limit of 5 books."
+    if outcome != 'borrowed':
         return False, "Database error occurred while creating borrow record."
-    
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
+    event_bus.notify()
     
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
@@ -124,17 +146,95 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not book:
         return False, "Book not found."
     
-    borrowed_books = get_patron_borrowed_books(patron_id)
-    for row in borrowed_books: 
-        if row["book_id"] == book_id:
-            update_book_availability(book_id, 1)
-            currentTime = datetime.now()
-            update_borrow_record_return_date(patron_id, book_id, currentTime)
-            calculation = calculate_late_fee_for_book(patron_id, book_id)
-            lateFee = calculation["fee_amount"]
-            return True, f"Returned book successfully with a late fee of ${lateFee:.2f}."    
+    # Close the loan and restore the copy in one transaction
+    currentTime = datetime.now()
+    if not return_book_atomic(patron_id, book_id, currentTime):
+        return False, "Book unable to be returned."
+    event_bus.notify()
+
+    calculation = calculate_late_fee_for_book(patron_id, book_id)
+    lateFee = calculation["fee_amount"]
+    return True, f"Returned book successfully with a late fee of ${lateFee:.2f}."
+
+def _hold_message(hold: Dict) -> str:
+    if hold['status'] == 'ready':
+        return f"A copy is being held for you until {hold['expires_at'][:10]}."
+    return f"You are number {hold['position']} in the hold queue."
+
+def place_hold(patron_id: str, book_id: int, priority: int = 0) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    Join the hold queue for a book with no copies available.
+    
+    Returned copies go to the queue before the shelf: highest priority
+    first, then first come, first served. The patron is then given a pickup
+    window (LIBRARY_HOLD_PICKUP_DAYS) to borrow the copy set aside for them.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        book_id: ID of the book to hold
+        priority: Holds with a higher priority are served first (default 0)
+        
+    Returns:
+        tuple: (success: bool, message: str, hold: dict with status and position, or None)
+    """
+    if not isinstance(patron_id, str) or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    if not isinstance(book_id, int) or book_id <= 0:
+        return False, "Invalid book ID. Must be a positive integer.", None
+    
+    outcome, hold = place_hold_atomic(patron_id, book_id, datetime.now(), priority)
+    if outcome == 'placed':
+        return True, f"Hold placed. {_hold_message(hold)}", hold
+    if outcome == 'exists':
+        return True, f"You already have a hold on this book. {_hold_message(hold)}", hold
+    if outcome == 'not_found':
+        return False, "Book not found.", None
+    if outcome == 'available':
+        return False, "This book is available; borrow it instead.", None
+    if outcome == 'borrowed':
+        return False, "You have already borrowed this book.", None
+    return False, "Database error occurred while placing the hold.", None
+
+def cancel_hold(patron_id: str, book_id: int) -> Tuple[bool, str]:
+    """
+    Cancel a patron's hold; a copy set aside for it goes to the next hold in the queue.
+    
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    if not isinstance(patron_id, str) or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits."
+    if not isinstance(book_id, int) or book_id <= 0:
+        return False, "Invalid book ID. Must be a positive integer."
+    if not cancel_hold_atomic(patron_id, book_id, datetime.now()):
+        return False, "No active hold on this book."
+    event_bus.notify()
+    return True, "Hold cancelled."
 
-    return False, "Book unable to be returned."
+def get_hold_status(patron_id: str, book_id: int) -> Optional[Dict]:
+    """
+    Get a patron's active hold on a book: its status, queue position while
+    waiting, and pickup deadline once a copy is set aside.
+    """
+    hold = get_active_hold(patron_id, book_id)
+    if hold is None:
+        return None
+    hold['message'] = _hold_message(hold)
+    return hold
+
+def expire_unclaimed_holds() -> int:
+    """
+    Expire holds whose copy was not borrowed within the pickup window; each
+    copy passes to the next hold or back on the shelf.
+    Borrows and new holds also expire a book's own unclaimed holds as they go.
+    
+    Returns:
+        int: Holds expired
+    """
+    book_ids = expire_holds(datetime.now())
+    if book_ids:
+        event_bus.notify(len(set(book_ids)))
+    return len(book_ids)
 
 def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     """
@@ -183,15 +283,76 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict:
     return {
         'fee_amount': late_fee,
         'days_overdue': days_late,
-        'status': status
+        'status': status,
+        'borrow_id': record.get('borrow_id')
     }
 
 
-def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
+CATALOG_PAGE_SIZE = 100
+CATALOG_MAX_PAGE_SIZE = 500
+
+def encode_catalog_cursor(cursor: Optional[Tuple[str, int]]) -> Optional[str]:
+    """Encode a (title, id) keyset cursor as an opaque URL-safe token."""
+    if cursor is None:
+        return None
+    raw = json.dumps([cursor[0], cursor[1]], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_catalog_cursor(token: str) -> Optional[Tuple[str, int]]:
+    """Decode a token from encode_catalog_cursor, returning None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        title, book_id = json.loads(raw.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        return None
+    if not isinstance(title, str) or not isinstance(book_id, int):
+        return None
+    return title, book_id
+
+def get_catalog_page(limit: Optional[int] = None, cursor: Optional[str] = None, records: bool = False) -> Dict:
+    """
+    Get one page of the catalog ordered by title.
+    Paginated form of R2: Book Catalog Display
+    
+    Args:
+        limit: Books per page (1 to CATALOG_MAX_PAGE_SIZE, default CATALOG_PAGE_SIZE)
+        cursor: Token from a previous page's next_cursor, or None for the first page
+        records: Allow shared read-only book records from the catalog index instead of dicts
+        
+    Returns:
+        dict: books, limit and next_cursor, or an error message
+    """
+    if limit is None:
+        limit = CATALOG_PAGE_SIZE
+    if not isinstance(limit, int) or limit <= 0 or limit > CATALOG_MAX_PAGE_SIZE:
+        return {"error": f"Limit must be between 1 and {CATALOG_MAX_PAGE_SIZE}."}
+    
+    after = None
+    if cursor:
+        after = decode_catalog_cursor(cursor)
+        if after is None:
+            return {"error": "Invalid cursor."}
+    
+    books, next_cursor = get_books_page(limit, after, records)
+    return {
+        "books": books,
+        "limit": limit,
+        "next_cursor": encode_catalog_cursor(next_cursor),
+    }
+
+def search_books_in_catalog(search_term: str, search_type: str, limit: int = SEARCH_LIMIT) -> List[Dict]:
     """
     Search for books in the catalog.
+    Implements R6: title and author searches use the full-text index
+    (ranked, word-prefix matching); ISBN searches are exact.
     
-    TODO: Implement R6 as per requirements
+    Args:
+        search_term: Text to search for
+        search_type: 'title', 'author' or 'isbn'
+        limit: Maximum number of title/author results
+        
+    Returns:
+        list: Matching books, best matches first
     """
     if not isinstance(search_term, str) or not search_term.strip():
             return []
@@ -199,53 +360,166 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]:
     
     """Get a specific book by ISBN."""
     if(search_type == 'title'):
-        return get_book_by_title(search_term) or []
+        return search_books_fulltext(search_term, 'title', limit)
     elif(search_type == 'author'):
-        return get_book_by_author(search_term) or []
+        return search_books_fulltext(search_term, 'author', limit)
     elif(search_type == 'isbn'):
         res = get_book_by_isbn(search_term)
         return [res] if res else []
     else:
         return []
 
-def get_patron_status_report(patron_id: str) -> Dict:
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 500
+
+def get_patron_status_report(patron_id: str, history_limit: Optional[int] = None, history_offset: int = 0) -> Dict:
     """
     Get status report for a patron.
     
-    TODO: Implement R7 as per requirements
+    Current loans, counts, late fees (less anything already paid) and one
+    page of the borrowing history come from a single query.
+    
+    Args:
+        patron_id: 6-digit library card ID
+        history_limit: Borrowing history entries per page (default HISTORY_PAGE_SIZE)
+        history_offset: History entries to skip, newest first
+        
+    Returns:
+        dict: The report, {} for an invalid patron ID, or an error message for invalid paging
     """
     # Validate patron ID
     if not isinstance(patron_id, str) or not patron_id.isdigit() or len(patron_id) != 6:
-        return {}   
-    borrowed_books = get_patron_borrowed_books(patron_id)
+        return {}
+    if history_limit is None:
+        history_limit = HISTORY_PAGE_SIZE
+    if not isinstance(history_limit, int) or history_limit <= 0 or history_limit > HISTORY_MAX_PAGE_SIZE:
+        return {"error": f"History limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}."}
+    if not isinstance(history_offset, int) or history_offset < 0:
+        return {"error": "History offset must not be negative."}
+    
+    as_of = datetime.now()
+    report_rows = get_patron_report_rows(patron_id, as_of, history_limit, history_offset)
+    
+    currently_borrowed = []
+    borrowing_history = []
     total_fees_owed = 0.0
-    for book in borrowed_books:
-        if book["is_overdue"]:
-                currentTime = datetime.now()
-                time_late = currentTime - book['due_date']
-                days_late = time_late.days
-                if (days_late > 0):
-                        if(days_late > 7 ):
-                            late_fee = 7*0.5 + (days_late - 7)*1
-                            late_fee = min(late_fee, 15.0)
-                        else:
-                            late_fee = days_late*0.5
-                total_fees_owed = total_fees_owed + late_fee
-
-    total_fees_owed = round(total_fees_owed, 2)
-    borrow_count = get_patron_borrow_count(patron_id)
-    borrowing_history = get_borrow_record(patron_id)
-
+    for row in report_rows['loans']:
+        due_date = datetime.fromisoformat(row['due_date'])
+        if row['return_date'] is None:
+            # The fee as of now, less anything already paid for this loan
+            late_fee = max(0.0, row['fee_amount'] - row['paid'])
+            total_fees_owed += late_fee
+            currently_borrowed.append({
+                'borrow_id': row['borrow_id'],
+                'book_id': row['book_id'],
+                'title': row['title'],
+                'author': row['author'],
+                'borrow_date': datetime.fromisoformat(row['borrow_date']),
+                'due_date': due_date,
+                'is_overdue': as_of > due_date,
+                'days_overdue': row['days_overdue'],
+                'late_fee': round(late_fee, 2),
+            })
+        if history_offset < row['position'] <= history_offset + history_limit:
+            borrowing_history.append({
+                'borrow_id': row['borrow_id'],
+                'patron_id': row['patron_id'],
+                'book_id': row['book_id'],
+                'title': row['title'],
+                'author': row['author'],
+                'borrow_date': datetime.fromisoformat(row['borrow_date']),
+                'due_date': due_date,
+                'return_date': datetime.fromisoformat(row['return_date']) if row['return_date'] else None,
+                'days_overdue': row['days_overdue'],
+                'fee_amount': row['fee_amount'],
+            })
+    
+    history_total = report_rows['history_total']
     report = {
         "patron_id": patron_id,
-        "currently_borrowed": borrowed_books,
-        "total_late_fees": total_fees_owed,   
-        "borrow_count": borrow_count,
-        "borrowing_history": borrowing_history,                   
+        "currently_borrowed": currently_borrowed,
+        "total_late_fees": round(total_fees_owed, 2),
+        "borrow_count": len(currently_borrowed),
+        "last_activity": report_rows['last_activity'],
+        "borrowing_history": borrowing_history,
+        "history_total": history_total,
+        "history_limit": history_limit,
+        "history_offset": history_offset,
+        "next_history_offset": history_offset + history_limit if history_offset + history_limit < history_total else None,
     }
-
+    
     return report
 
+def prepare_late_fee_charge(patron_id: str, book_id: int) -> Tuple[Optional[Dict], Optional[str]]:
+    """
+    Work out the late fee charge for a book, without contacting the gateway.
+    Shared by pay_late_fees and the payment queue.
+    
+    Returns:
+        tuple: (charge dict with amount and description, or None; error message, or None)
+    """
+    # Validate patron ID
+    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
+        return None, "Invalid patron ID. Must be exactly 6 digits."
+    
+    # Calculate late fee first
+    fee_info = calculate_late_fee_for_book(patron_id, book_id)
+    
+    # Check if there's a fee to pay
+    if not fee_info or 'fee_amount' not in fee_info:
+        return None, "Unable to calculate late fees."
+    
+    fee_amount = fee_info.get('fee_amount', 0.0)
+    
+    if fee_amount <= 0:
+        return None, "No late fees to pay for this book."
+    
+    # Only charge what is still owed: an overdue loan keeps accruing fees after a payment
+    borrow_id = fee_info.get('borrow_id')
+    paid, charges = get_loan_charges(patron_id, borrow_id)
+    amount = round(fee_amount - paid, 2)
+    if amount <= 0:
+        return None, "No late fees owed for this book; they have already been paid."
+    
+    # Get book details for payment description
+    book = get_book_by_id(book_id)
+    if not book:
+        return None, "Book not found."
+    
+    return {
+        'amount': amount,
+        'description': f"Late fees for '{book['title']}'",
+        'borrow_id': borrow_id,
+        'idempotency_key': late_fee_payment_key(patron_id, book_id, borrow_id, charges)
+    }, None
+
+def late_fee_payment_key(patron_id: str, book_id: int, borrow_id: Optional[int], sequence: int = 0) -> str:
+    """
+    Idempotency key for a late fee payment of one loan.
+    sequence is the number of charges for the loan that have already succeeded,
+    so a top-up after more fees accrue gets its own ledger row.
+    """
+    return f"late_fee:{patron_id}:{book_id}:{borrow_id}:{sequence}"
+
+def validate_refund(transaction_id: str, amount: float) -> Optional[str]:
+    """
+    Check a refund request before it is sent to the gateway.
+    Shared by refund_late_fee_payment and the payment queue.
+    
+    Returns:
+        str: The validation error message, or None if the refund may proceed
+    """
+    if not transaction_id or not transaction_id.startswith("txn_"):
+        return "Invalid transaction ID."
+    
+    if amount <= 0:
+        return "Refund amount must be greater than 0."
+    
+    if amount > 15.00:  # Maximum late fee per book
+        return "Refund amount exceeds maximum late fee."
+    
+    return None
+
 def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
     """
     Process payment for late fees using external payment gateway.
@@ -267,48 +541,82 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
         success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
     """
-    # Validate patron ID
-    if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
-    
-    # Calculate late fee first
-    fee_info = calculate_late_fee_for_book(patron_id, book_id)
-    
-    # Check if there's a fee to pay
-    if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
-    
-    fee_amount = fee_info.get('fee_amount', 0.0)
-    
-    if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
+    charge, result = begin_late_fee_payment(patron_id, book_id)
+    if result is not None:
+        return result
     
-    # Get book details for payment description
-    book = get_book_by_id(book_id)
-    if not book:
-        return False, "Book not found.", None
-    
-    # Use provided gateway or create new one
+    # Use provided gateway or the shared one with timeouts and a circuit breaker
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process payment through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
     try:
         success, transaction_id, message = payment_gateway.process_payment(
             patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
+            amount=charge['amount'],
+            description=charge['description']
         )
-        
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
-            
+        result = late_fee_charge_result(success, transaction_id, message)
+    except PaymentOutcomeUnknown as e:
+        return late_fee_charge_unknown(charge['payment_id'], e)
     except Exception as e:
         # Handle payment gateway errors
-        return False, f"Payment processing error: {str(e)}", None
+        result = False, f"Payment processing error: {str(e)}", None
+    
+    return finish_late_fee_payment(charge['payment_id'], result)
+
+UNRECONCILED_PAYMENT_MESSAGE = ("An earlier payment for these late fees may have gone through; "
+                                "it must be reconciled before another attempt.")
+
+def begin_late_fee_payment(patron_id: str, book_id: int) -> Tuple[Optional[Dict], Optional[Tuple[bool, str, Optional[str]]]]:
+    """
+    Validate a late fee payment and record the attempt in the payments ledger.
+    Shared by pay_late_fees and its async counterpart; each amount owed is charged at most once.
+    
+    Returns:
+        tuple: (charge dict with payment_id, None) when the gateway should be charged,
+               or (None, pay_late_fees result) when it should not
+    """
+    charge, error = prepare_late_fee_charge(patron_id, book_id)
+    if error:
+        return None, (False, error, None)
+    
+    try:
+        payment, new_attempt = reserve_payment(
+            charge['idempotency_key'], 'charge', charge['amount'], patron_id, book_id,
+            charge['borrow_id'], charge['description'], status='processing'
+        )
+    except sqlite3.Error:
+        return None, (False, "Database error occurred while recording the payment.", None)
+    if not new_attempt:
+        if payment['status'] == 'succeeded':
+            return None, (True, payment['message'], payment['transaction_id'])
+        if payment['status'] == 'unknown':
+            return None, (False, UNRECONCILED_PAYMENT_MESSAGE, None)
+        return None, (False, "A payment for these late fees is already in progress.", None)
+    
+    return dict(charge, payment_id=payment['id']), None
+
+def late_fee_charge_result(success: bool, transaction_id: str, message: str) -> Tuple[bool, str, Optional[str]]:
+    """pay_late_fees result for a gateway answer."""
+    if success:
+        return True, f"Payment successful! {message}", transaction_id
+    return False, f"Payment failed: {message}", None
+
+def finish_late_fee_payment(payment_id: int, result: Tuple[bool, str, Optional[str]]) -> Tuple[bool, str, Optional[str]]:
+    """Record the outcome of a late fee charge in the payments ledger and return it."""
+    complete_payment_job(payment_id, result[0], result[2], result[1])
+    return result
+
+def late_fee_charge_unknown(payment_id: int, error: Exception) -> Tuple[bool, str, Optional[str]]:
+    """
+    Record a charge the gateway may have taken without answering.
+    The ledger row is marked unknown, so the fee is not charged again until it is reconciled.
+    """
+    message = f"Payment outcome unknown: {str(error)}"
+    mark_payment_unknown(payment_id, message)
+    return False, message, None
 
 
 def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
@@ -326,18 +634,21 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         tuple: (success: bool, message: str)
     """
     # Validate inputs
-    if not transaction_id or not transaction_id.startswith("txn_"):
-        return False, "Invalid transaction ID."
-    
-    if amount <= 0:
-        return False, "Refund amount must be greater than 0."
+    error = validate_refund(transaction_id, amount)
+    if error:
+        return False, error
     
-    if amount > 15.00:  # Maximum late fee per book
-        return False, "Refund amount exceeds maximum late fee."
+    # Payments in the ledger cannot be refunded beyond what was charged
+    try:
+        reserved = reserve_refund(transaction_id, amount)
+    except sqlite3.Error:
+        return False, "Database error occurred while recording the refund."
+    if reserved is False:
+        return False, "Refund amount exceeds the original payment."
     
-    # Use provided gateway or create new one
+    # Use provided gateway or the shared one with timeouts and a circuit breaker
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
@@ -345,9 +656,20 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         success, message = payment_gateway.refund_payment(transaction_id, amount)
         
         if success:
+            payment_status_cache.invalidate(transaction_id)
             return True, message
         else:
-            return False, f"Refund failed: {message}"
+            result = False, f"Refund failed: {message}"
             
+    except PaymentOutcomeUnknown as e:
+        # The refund may have been applied, so it keeps counting against the charge
+        return False, f"Refund outcome unknown: {str(e)}"
     except Exception as e:
-        return False, f"Refund processing error: {str(e)}"
+        result = False, f"Refund processing error: {str(e)}"
+    
+    if reserved:
+        release_refund(transaction_id, amount)
+    return result
+
+
+instrument_module(sys.modules[__name__])
@@ -0,0 +1,271 @@
+"""
+Overdue Notices Module - Batch overdue notices for every patron with late loans
+Overdue loans are streamed in patron order and one notice per patron is sent by a pool of
+threads under a rate limit; progress is checkpointed so an interrupted run resumes where it stopped
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from email.message import Message
+from email.mime.text import MIMEText
+from typing import Deque, Dict, IO, List, Optional, Union
+from instrumentation import instrument_module
+from database import checkpoint_notice_run, finish_notice_run, get_notice_run, iter_overdue_loans_by_patron, start_notice_run
+
+NOTICE_WORKERS = int(os.environ.get('LIBRARY_NOTICE_WORKERS', '8'))
+# Notices sent per second across all workers (0: no limit)
+NOTICE_RATE = float(os.environ.get('LIBRARY_NOTICE_RATE', '100'))
+NOTICE_CHECKPOINT_EVERY = int(os.environ.get('LIBRARY_NOTICE_CHECKPOINT_EVERY', '1000'))
+NOTICE_CHECKPOINT_INTERVAL = 5.0
+# A run that has not checkpointed for this many seconds is assumed crashed and may be resumed
+NOTICE_RUN_LEASE = float(os.environ.get('LIBRARY_NOTICE_RUN_LEASE', '60'))
+NOTICE_MAX_ATTEMPTS = 3
+NOTICE_RETRY_BACKOFF = 0.5
+NOTICE_SINKS = ('file', 'smtp-stub')
+NOTICE_SINK = os.environ.get('LIBRARY_NOTICE_SINK', 'file')
+NOTICE_FILE = os.environ.get('LIBRARY_NOTICE_FILE', 'overdue_notices.jsonl')
+NOTICE_FROM = os.environ.get('LIBRARY_NOTICE_FROM', 'library@example.org')
+NOTICE_EMAIL_DOMAIN = os.environ.get('LIBRARY_NOTICE_EMAIL_DOMAIN', 'patrons.example.org')
+
+
+def build_notice(patron_id: str, loans: List[Dict], as_of: datetime) -> Dict:
+    """One patron's overdue notice: their overdue loans and the late fees owed as of the run."""
+    return {
+        'patron_id': patron_id,
+        'as_of': as_of.isoformat(),
+        'loans': [{key: loan[key] for key in ('book_id', 'title', 'due_date', 'days_overdue', 'fee_amount')}
+                  for loan in loans],
+        'total_fees': round(sum(loan['fee_amount'] for loan in loans), 2),
+    }
+
+def format_notice_email(notice: Dict) -> Message:
+    """Render a notice as a plain-text email to the patron."""
+    loans = notice['loans']
+    lines = [f"The following books are overdue as of {notice['as_of'][:10]}:", '']
+    lines += [f"- {loan['title'] or 'Book ' + str(loan['book_id'])}: due {loan['due_date'][:10]}, "
+              f"{loan['days_overdue']} day(s) late, ${loan['fee_amount']:.2f}" for loan in loans]
+    lines += ['', 'Please return them as soon as possible.']
+    # MIMEText (compat32 policy) renders an order of magnitude faster than EmailMessage
+    message = MIMEText('\n'.join(lines), 'plain', 'utf-8')
+    message['From'] = NOTICE_FROM
+    message['To'] = f"{notice['patron_id']}@{NOTICE_EMAIL_DOMAIN}"
+    message['Subject'] = f"Overdue library books: {len(loans)} item(s), ${notice['total_fees']:.2f} in late fees"
+    return message
+
+
+class NoticeSender:
+    """
+    Delivers overdue notices. Subclasses implement send(), which raises on failure.
+
+    Senders are shared by the dispatch threads, so send() must be thread-safe.
+    """
+
+    def send(self, notice: Dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class FileNoticeSender(NoticeSender):
+    """Appends each notice as a JSON line to a file or open text stream."""
+
+    def __init__(self, target: Union[str, IO[str]] = NOTICE_FILE):
+        self._owns_stream = isinstance(target, str)
+        self._stream = open(target, 'a', encoding='utf-8') if self._owns_stream else target
+        self._lock = threading.Lock()
+        self.sent = 0
+
+    def send(self, notice: Dict):
+        line = json.dumps(notice) + '\n'
+        with self._lock:
+            self._stream.write(line)
+            self.sent += 1
+
+    def close(self):
+        if self._owns_stream:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+class StubSmtpSender(NoticeSender):
+    """
+    Stand-in for an SMTP relay, for local runs and throughput tests.
+
+    Formats every notice as an email, waits latency seconds in place of the
+    SMTP round trip and keeps the latest outbox_size messages in outbox.
+    """
+
+    def __init__(self, latency: float = 0.0, outbox_size: int = 1000):
+        self.latency = latency
+        self.outbox: Deque[Message] = deque(maxlen=outbox_size)
+        self._lock = threading.Lock()
+        self.sent = 0
+
+    def send(self, notice: Dict):
+        message = format_notice_email(notice)
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.outbox.append(message)
+            self.sent += 1
+
+def get_notice_sender(sink: Optional[str] = None, path: Optional[str] = None) -> NoticeSender:
+    """Build the sender for a sink name (default: LIBRARY_NOTICE_SINK)."""
+    sink = sink or NOTICE_SINK
+    if sink == 'file':
+        return FileNoticeSender(path or NOTICE_FILE)
+    if sink == 'smtp-stub':
+        return StubSmtpSender()
+    raise ValueError(f"Notice sink must be one of: {', '.join(NOTICE_SINKS)}.")
+
+
+class RateLimiter:
+    """Token bucket shared by the dispatch threads: rate acquisitions per second after a burst."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait for a token (returns at once when rate is 0)."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def _deliver(sender: NoticeSender, limiter: RateLimiter, notice: Dict) -> Optional[str]:
+    """Send one notice, retrying failures; returns the last error, or None once sent."""
+    error = None
+    for attempt in range(NOTICE_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(NOTICE_RETRY_BACKOFF * 2 ** (attempt - 1))
+        limiter.acquire()
+        try:
+            sender.send(notice)
+            return None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+    return error
+
+
+def run_overdue_notices(sender: NoticeSender, as_of: Optional[datetime] = None, workers: int = NOTICE_WORKERS,
+                        rate: float = NOTICE_RATE, resume: bool = True,
+                        checkpoint_every: int = NOTICE_CHECKPOINT_EVERY, lease: float = NOTICE_RUN_LEASE,
+                        batch_size: int = 1000) -> Dict:
+    """
+    Send one overdue notice to every patron with open loans past their due date.
+
+    Patrons are streamed in id order and their notices are sent by a pool of
+    worker threads, with at most a few notices per worker waiting. Progress
+    is checkpointed every checkpoint_every patrons (and every few seconds):
+    the checkpoint is the last patron such that every patron up to it has
+    been notified or given up on. A run that stops early is resumed from its
+    checkpoint by the next call, with the same as_of. Delivery is at least
+    once: notices sent after the last checkpoint of a crashed run are sent
+    again when it resumes.
+
+    Args:
+        sender: Where notices go (see get_notice_sender)
+        as_of: Loans due before this time are overdue (default: now; ignored when resuming)
+        workers: Threads sending notices
+        rate: Most notices sent per second across all workers (0: no limit)
+        resume: Continue an interrupted run rather than abandoning it
+        checkpoint_every: Patrons settled between checkpoints
+        lease: Seconds without a checkpoint before an unfinished run counts as crashed
+        batch_size: Loans fetched from SQLite per round trip
+
+    Returns:
+        dict: Run totals (across resumes) and throughput of this call, or an error message
+    """
+    run, resumed = start_notice_run(as_of or datetime.now(), resume, lease)
+    if run is None:
+        return {'error': "Another overdue notice run is in progress."}
+    as_of = datetime.fromisoformat(run['as_of'])
+    started = time.perf_counter()
+    limiter = RateLimiter(rate)
+    pending: Deque = deque()
+    settled = {'last_patron_id': None, 'patrons': 0, 'loans': 0, 'failures': [], 'at': time.monotonic()}
+    notified = {'patrons': 0, 'loans': 0}
+
+    def settle(block: bool = False):
+        # Futures complete out of order; only the in-order prefix may advance the checkpoint
+        while pending and (block or pending[0][2].done()):
+            patron_id, loans, future = pending.popleft()
+            try:
+                error = future.result()
+            except BaseException:
+                # This patron was not dealt with, so nothing after it may be checkpointed either
+                pending.clear()
+                raise
+            settled['last_patron_id'] = patron_id
+            if error is None:
+                settled['patrons'] += 1
+                settled['loans'] += loans
+            else:
+                settled['failures'].append((patron_id, loans, error))
+            block = False
+
+    def checkpoint():
+        checkpoint_notice_run(run['id'], settled['last_patron_id'], settled['patrons'], settled['loans'],
+                              settled['failures'])
+        notified['patrons'] += settled['patrons']
+        notified['loans'] += settled['loans']
+        settled.update(patrons=0, loans=0, failures=[], at=time.monotonic())
+
+    window = max(workers, 1) * 4
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='overdue-notice') as pool:
+        try:
+            for patron_id, loans in iter_overdue_loans_by_patron(as_of, run['last_patron_id'], batch_size):
+                notice = build_notice(patron_id, loans, as_of)
+                pending.append((patron_id, len(loans), pool.submit(_deliver, sender, limiter, notice)))
+                settle(block=len(pending) >= window)
+                done = settled['patrons'] + len(settled['failures'])
+                if done >= checkpoint_every or time.monotonic() - settled['at'] >= NOTICE_CHECKPOINT_INTERVAL:
+                    checkpoint()
+            while pending:
+                settle(block=True)
+        finally:
+            # Keep what was settled before an interruption so a resumed run skips it
+            settle()
+            checkpoint()
+    finish_notice_run(run['id'])
+
+    seconds = time.perf_counter() - started
+    run = get_notice_run(run['id'])
+    return {
+        'run_id': run['id'],
+        'as_of': run['as_of'],
+        'resumed': resumed,
+        'patrons': run['patrons_notified'],
+        'loans': run['loans_notified'],
+        'failures': run['failures'],
+        'seconds': round(seconds, 3),
+        'patrons_per_second': round(notified['patrons'] / seconds, 1) if seconds else 0.0,
+    }
+
+
+# Per-notice helpers run once per patron; the run itself and the SQL are timed
+instrument_module(sys.modules[__name__], exclude=('build_notice', 'format_notice_email'))
@@ -0,0 +1,284 @@
+"""
+Payment Queue Module - Asynchronous late fee payments and refunds
+Requests are queued in the payments table and sent to the gateway by a pool of worker threads
+"""
+
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+from instrumentation import instrument_module
+from database import (
+    claim_payment_jobs, complete_payment_job, enqueue_payment, get_payment, get_payment_by_transaction,
+    mark_payment_unknown, record_reconciled_payment, release_payment_job, release_refund, reserve_payment,
+    reserve_refund
+)
+from services.library_service import UNRECONCILED_PAYMENT_MESSAGE, prepare_late_fee_charge, validate_refund
+from services.gateway_resilience import GatewayUnavailable, get_payment_gateway
+from services.payment_service import PaymentGateway, PaymentOutcomeUnknown
+from services.payment_status import payment_status_cache
+
+PAYMENT_WORKERS = int(os.environ.get('LIBRARY_PAYMENT_WORKERS', '4'))
+PAYMENT_POLL_INTERVAL = float(os.environ.get('LIBRARY_PAYMENT_POLL_INTERVAL', '1.0'))
+# A job still processing after this many seconds is assumed lost; its outcome becomes unknown
+PAYMENT_LEASE = float(os.environ.get('LIBRARY_PAYMENT_LEASE', '60'))
+PAYMENT_MAX_ATTEMPTS = 3
+
+
+def process_payment_job(job: Dict, payment_gateway: PaymentGateway) -> Tuple[bool, Optional[str], str]:
+    """
+    Send one claimed job to the gateway.
+    Messages match pay_late_fees and refund_late_fee_payment.
+
+    Returns:
+        tuple: (success, transaction id or None, message)
+    """
+    if job['attempts'] > PAYMENT_MAX_ATTEMPTS:
+        return False, None, "Payment processing error: gave up after repeated attempts"
+
+    reserved = None
+    try:
+        if job['kind'] == 'refund':
+            reserved = reserve_refund(job['original_transaction_id'], job['amount'])
+            if reserved is False:
+                return False, None, "Refund amount exceeds the original payment."
+            success, message = payment_gateway.refund_payment(job['original_transaction_id'], job['amount'])
+            if success:
+                payment_status_cache.invalidate(job['original_transaction_id'])
+                return True, job['original_transaction_id'], message
+            if reserved:
+                release_refund(job['original_transaction_id'], job['amount'])
+            return False, None, f"Refund failed: {message}"
+
+        success, transaction_id, message = payment_gateway.process_payment(
+            patron_id=job['patron_id'],
+            amount=job['amount'],
+            description=job['description']
+        )
+        if success:
+            return True, transaction_id, f"Payment successful! {message}"
+        return False, None, f"Payment failed: {message}"
+
+    except Exception as e:
+        # A refund that may have been applied keeps counting against the charge
+        if reserved and not isinstance(e, PaymentOutcomeUnknown):
+            release_refund(job['original_transaction_id'], job['amount'])
+        if isinstance(e, (GatewayUnavailable, PaymentOutcomeUnknown)):
+            raise
+        label = 'Refund' if job['kind'] == 'refund' else 'Payment'
+        return False, None, f"{label} processing error: {str(e)}"
+
+
+class PaymentWorkerPool:
+    """
+    Threads that claim queued payment jobs and run them against the gateway.
+
+    The queue lives in the database, so jobs survive restarts and several
+    processes can share it. notify() wakes idle workers as soon as a job is
+    queued; otherwise they poll every poll_interval seconds.
+    """
+
+    def __init__(self, payment_gateway: Optional[PaymentGateway] = None, workers: int = PAYMENT_WORKERS,
+                 poll_interval: float = PAYMENT_POLL_INTERVAL, lease: float = PAYMENT_LEASE):
+        self.payment_gateway = payment_gateway or get_payment_gateway()
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.processed = 0
+
+    def start(self, drain: bool = False):
+        """Start the worker threads; with drain, each exits once the queue is empty."""
+        self._stopping.clear()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(drain,), name=f'payment-worker-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """Wake idle workers because a job was queued."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask the workers to exit after their current job and wait for them."""
+        self._stopping.set()
+        self._wakeup.set()
+        self.join(timeout)
+
+    def join(self, timeout: Optional[float] = None):
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+    def run_once(self) -> bool:
+        """Claim and process one job. Returns False if the queue was empty."""
+        jobs = claim_payment_jobs(1, self.lease)
+        if not jobs:
+            return False
+        job = jobs[0]
+        try:
+            success, transaction_id, message = process_payment_job(job, self.payment_gateway)
+        except GatewayUnavailable:
+            # Circuit open: put the job back untouched and back off
+            release_payment_job(job['id'])
+            self._wakeup.wait(self.poll_interval)
+            return False
+        except PaymentOutcomeUnknown as e:
+            # The gateway may have applied it; hold the job for reconciliation rather than send it again
+            label = 'Refund' if job['kind'] == 'refund' else 'Payment'
+            mark_payment_unknown(job['id'], f"{label} outcome unknown: {str(e)}")
+            with self._lock:
+                self.processed += 1
+            return True
+        complete_payment_job(job['id'], success, transaction_id, message)
+        with self._lock:
+            self.processed += 1
+        return True
+
+    def _run(self, drain: bool):
+        while not self._stopping.is_set():
+            if self.run_once():
+                continue
+            if drain:
+                return
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+
+_workers: Optional[PaymentWorkerPool] = None
+_workers_lock = threading.Lock()
+
+def get_payment_workers() -> PaymentWorkerPool:
+    """Return the process-wide worker pool, starting it on first use."""
+    global _workers
+    with _workers_lock:
+        if _workers is None:
+            _workers = PaymentWorkerPool()
+            _workers.start()
+        return _workers
+
+def stop_payment_workers(timeout: Optional[float] = None):
+    """Stop the process-wide worker pool if it was started."""
+    global _workers
+    with _workers_lock:
+        workers, _workers = _workers, None
+    if workers is not None:
+        workers.stop(timeout)
+
+def submit_late_fee_payment(patron_id: str, book_id: int) -> Tuple[bool, str, Optional[int]]:
+    """
+    Queue payment of a book's late fee instead of waiting on the gateway.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[int])
+    """
+    charge, error = prepare_late_fee_charge(patron_id, book_id)
+    if error:
+        return False, error, None
+
+    payment, new_attempt = reserve_payment(
+        charge['idempotency_key'], 'charge', charge['amount'], patron_id, book_id,
+        charge['borrow_id'], charge['description'], lease=PAYMENT_LEASE
+    )
+    if not new_attempt:
+        # Same loan already paid or on its way; hand back that job
+        if payment['status'] == 'succeeded':
+            return True, payment['message'], payment['id']
+        if payment['status'] == 'unknown':
+            return False, UNRECONCILED_PAYMENT_MESSAGE, payment['id']
+        return True, "Payment already queued.", payment['id']
+
+    get_payment_workers().notify()
+    return True, f"Payment of ${charge['amount']:.2f} queued.", payment['id']
+
+def submit_refund(transaction_id: str, amount: float) -> Tuple[bool, str, Optional[int]]:
+    """
+    Queue a late fee refund instead of waiting on the gateway.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[int])
+    """
+    error = validate_refund(transaction_id, amount)
+    if error:
+        return False, error, None
+    payment = get_payment_by_transaction(transaction_id)
+    if payment and round(payment['refunded_amount'] + amount, 2) > round(payment['amount'], 2):
+        return False, "Refund amount exceeds the original payment.", None
+
+    job_id = enqueue_payment('refund', amount, original_transaction_id=transaction_id)
+    get_payment_workers().notify()
+    return True, f"Refund of ${amount:.2f} queued.", job_id
+
+def resolve_unknown_payment(job_id: int, applied: bool, transaction_id: Optional[str] = None,
+                            payment_gateway: Optional[PaymentGateway] = None) -> Tuple[bool, str]:
+    """
+    Record what really happened to a payment whose outcome is unknown.
+
+    A charge that went through needs the gateway transaction id, which is
+    checked with verify_payment_status before the charge is recorded. One
+    that did not go through is marked failed, so the fee can be paid again.
+    A refund that did not go through no longer counts against its charge.
+
+    Args:
+        job_id: The payment job (ledger row) id
+        applied: Whether the gateway applied the charge or refund
+        transaction_id: Gateway transaction id of an applied charge
+
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    payment = get_payment(job_id)
+    if payment is None or payment['status'] != 'unknown':
+        return False, "No payment with an unknown outcome has this id."
+
+    if payment['kind'] == 'refund':
+        if applied:
+            payment_status_cache.invalidate(payment['original_transaction_id'])
+            resolved = record_reconciled_payment(job_id, True, payment['original_transaction_id'],
+                                                 "Refund applied (reconciled).")
+        else:
+            resolved = record_reconciled_payment(job_id, False, None, "Refund not applied (reconciled).")
+            if resolved:
+                release_refund(payment['original_transaction_id'], payment['amount'])
+        return resolved, "Refund reconciled." if resolved else "Payment was resolved concurrently."
+
+    if not applied:
+        resolved = record_reconciled_payment(job_id, False, None, "Payment failed: not charged (reconciled).")
+        return resolved, "Payment reconciled as not charged." if resolved else "Payment was resolved concurrently."
+
+    if not transaction_id:
+        return False, "The gateway transaction id is required to record a charge."
+    try:
+        status = (payment_gateway or get_payment_gateway()).verify_payment_status(transaction_id)
+    except Exception as e:
+        return False, f"Could not verify the transaction: {str(e)}"
+    if status.get('status') not in ('completed', 'succeeded'):
+        return False, f"Gateway reports transaction {transaction_id} as {status.get('status')}."
+    resolved = record_reconciled_payment(job_id, True, transaction_id,
+                                         f"Payment successful! Reconciled with transaction {transaction_id}")
+    return resolved, "Payment reconciled as charged." if resolved else "Payment was resolved concurrently."
+
+def get_payment_job(job_id: int) -> Optional[Dict]:
+    """Get a payment job's status and, once it has succeeded, its transaction id."""
+    job = get_payment(job_id)
+    if job is None:
+        return None
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'amount': job['amount'],
+        'patron_id': job['patron_id'],
+        'book_id': job['book_id'],
+        'transaction_id': job['transaction_id'],
+        'message': job['message'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'completed_at': job['completed_at'],
+    }
+
+
+instrument_module(sys.modules[__name__])
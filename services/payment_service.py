@@ -6,11 +6,18 @@ For Assignment 3: You will learn to mock this service in their tests
 since we cannot make actual payment API calls during testing.
 """
 
-import requests
-from typing import Dict, Tuple
+import functools
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
 import time
 
 
+class PaymentOutcomeUnknown(Exception):
+    """A charge or refund was sent but no answer came back, so the gateway may or may not have applied it."""
+
+
 class PaymentGateway:
     """
     Simulates an external payment gateway API.
@@ -22,15 +29,17 @@ class PaymentGateway:
     - Incurring costs or rate limits
     """
     
-    def __init__(self, api_key: str = "test_key_12345"):
+    def __init__(self, api_key: str = "test_key_12345", max_concurrency: int = 8):
         """
         Initialize payment gateway with API credentials.
         
         Args:
             api_key: API key for authentication (default is test key)
+            max_concurrency: Most gateway calls a batch keeps in flight at once
         """
         self.api_key = api_key
         self.base_url = "https://api.payment-gateway.example.com"
+        self.max_concurrency = max_concurrency
     
     def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
         """
@@ -131,4 +140,213 @@ class PaymentGateway:
             "status": "completed",
             "amount": 10.50,
             "timestamp": time.time()
-        }
\ No newline at end of file
+        }
+    
+    def process_payments(self, charges: List[Dict]) -> List[Tuple[bool, str, str]]:
+        """
+        Process several payments, keeping up to max_concurrency calls in flight.
+        
+        Args:
+            charges: dicts with patron_id, amount and optionally description
+            
+        Returns:
+            list: One (success, transaction_id, message) tuple per charge, in order
+        """
+        def charge(item):
+            try:
+                return self.process_payment(**item)
+            except Exception as e:
+                return False, "", f"Gateway error: {str(e)}"
+        return self._fan_out(charge, charges)
+    
+    def refund_payments(self, refunds: List[Dict]) -> List[Tuple[bool, str]]:
+        """
+        Refund several payments, keeping up to max_concurrency calls in flight.
+        
+        Args:
+            refunds: dicts with transaction_id and amount
+            
+        Returns:
+            list: One (success, message) tuple per refund, in order
+        """
+        def refund(item):
+            try:
+                return self.refund_payment(**item)
+            except Exception as e:
+                return False, f"Gateway error: {str(e)}"
+        return self._fan_out(refund, refunds)
+    
+    def _fan_out(self, call: Callable, items: List[Dict]) -> List:
+        if len(items) <= 1 or self.max_concurrency <= 1:
+            return [call(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+            return list(executor.map(call, items))
+
+
+class HttpPaymentGateway(PaymentGateway):
+    """
+    Payment gateway client that talks to the gateway's HTTP API.
+    
+    All calls share one requests session whose connection pool holds
+    max_concurrency keep-alive connections, so repeated and batched calls
+    reuse connections instead of opening a new one per request.
+    """
+    
+    def __init__(self, base_url: str, api_key: str = "test_key_12345", max_concurrency: int = 8, timeout: float = 5.0):
+        # Imported here so processes that never talk to an HTTP gateway do not load requests
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        super().__init__(api_key, max_concurrency)
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    def _post(self, path: str, payload: Dict):
+        """POST to the gateway. Charges and refunds are not idempotent, so a read timeout is not a failure."""
+        from requests.exceptions import ReadTimeout
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+        except ReadTimeout as e:
+            raise PaymentOutcomeUnknown(f"Payment gateway did not answer within {self.timeout:g}s") from e
+        # Server errors are outages, not answers; let the caller see them as such
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+    
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        response = self._post(
+            "/charges",
+            {"customer_id": patron_id, "amount": amount, "currency": "usd", "description": description}
+        )
+        body = response.json()
+        if response.ok:
+            return True, body["transaction_id"], body.get("message", "")
+        return False, "", body.get("message", f"HTTP {response.status_code}")
+    
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        response = self._post("/refunds", {"transaction_id": transaction_id, "amount": amount})
+        body = response.json()
+        return response.ok, body.get("message", f"HTTP {response.status_code}")
+    
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        response = self.session.get(f"{self.base_url}/charges/{transaction_id}", timeout=self.timeout)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response.json()
+    
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncPaymentGateway:
+    """
+    asyncio interface to a PaymentGateway.
+    
+    Gateway calls run on a private thread pool of max_concurrency threads,
+    so awaiting them never blocks the event loop and at most that many are
+    in flight at once.
+    """
+    
+    def __init__(self, gateway: PaymentGateway = None, max_concurrency: int = None):
+        self.gateway = gateway or PaymentGateway()
+        self.max_concurrency = max_concurrency or self.gateway.max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="payment-gateway")
+    
+    async def _run(self, method: Callable, *args, **kwargs):
+        import asyncio  # deferred: only async callers pay for importing asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+    
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return await self._run(self.gateway.process_payment, patron_id=patron_id, amount=amount, description=description)
+    
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return await self._run(self.gateway.refund_payment, transaction_id, amount)
+    
+    async def verify_payment_status(self, transaction_id: str) -> Dict:
+        return await self._run(self.gateway.verify_payment_status, transaction_id)
+    
+    async def process_payments(self, charges: List[Dict]) -> List[Tuple[bool, str, str]]:
+        """Process several payments concurrently; results are in the same order as charges."""
+        import asyncio
+        results = await asyncio.gather(*(self.process_payment(**charge) for charge in charges), return_exceptions=True)
+        return [(False, "", f"Gateway error: {str(result)}") if isinstance(result, Exception) else result
+                for result in results]
+    
+    async def refund_payments(self, refunds: List[Dict]) -> List[Tuple[bool, str]]:
+        """Refund several payments concurrently; results are in the same order as refunds."""
+        import asyncio
+        results = await asyncio.gather(*(self.refund_payment(**refund) for refund in refunds), return_exceptions=True)
+        return [(False, f"Gateway error: {str(result)}") if isinstance(result, Exception) else result
+                for result in results]
+    
+    def close(self, close_gateway: bool = True):
+        """Shut down the worker threads (and the wrapped gateway's connections, if it has any)."""
+        self._executor.shutdown(wait=True)
+        if close_gateway and hasattr(self.gateway, "close"):
+            self.gateway.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    In-process stand-in for the payment gateway, for local runs and throughput tests.
+    
+    Applies the same rules as PaymentGateway with a configurable delay in
+    place of the remote call, and issues unique transaction IDs.
+    """
+    
+    def __init__(self, latency: float = 0.0, api_key: str = "test_key_12345", max_concurrency: int = 8):
+        super().__init__(api_key, max_concurrency)
+        self.latency = latency
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self.calls = 0
+    
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+    
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        self._call()
+        if amount <= 0:
+            return False, "", "Invalid amount: must be greater than 0"
+        if amount > 1000:
+            return False, "", "Payment declined: amount exceeds limit"
+        if len(patron_id) != 6:
+            return False, "", "Invalid patron ID format"
+        transaction_id = f"txn_{patron_id}_{int(time.time())}_{next(self._sequence)}"
+        return True, transaction_id, f"Payment of ${amount:.2f} processed successfully"
+    
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        self._call()
+        if not transaction_id or not transaction_id.startswith("txn_"):
+            return False, "Invalid transaction ID"
+        if amount <= 0:
+            return False, "Invalid refund amount"
+        refund_id = f"refund_{transaction_id}_{next(self._sequence)}"
+        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
+    
+    def verify_payment_status(self, transaction_id: str) -> Dict:
+        self._call()
+        if not transaction_id or not transaction_id.startswith("txn_"):
+            return {"status": "not_found", "message": "Transaction not found"}
+        return {"transaction_id": transaction_id, "status": "completed", "timestamp": time.time()}
@@ -0,0 +1,154 @@
+"""
+Payment Status Module - Cached, coalesced payment status lookups
+Answers repeated verify_payment_status calls from memory and shares in-flight gateway calls
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from cache import LRUCache
+from instrumentation import instrument_module
+from services.gateway_resilience import get_payment_gateway
+from services.payment_service import PaymentGateway
+
+PAYMENT_STATUS_CACHE_SIZE = int(os.environ.get('LIBRARY_PAYMENT_STATUS_CACHE_SIZE', '10000'))
+PAYMENT_STATUS_PENDING_TTL = float(os.environ.get('LIBRARY_PAYMENT_STATUS_PENDING_TTL', '5'))
+PAYMENT_STATUS_SETTLED_TTL = float(os.environ.get('LIBRARY_PAYMENT_STATUS_SETTLED_TTL', '60'))
+VERIFY_MANY_LIMIT = 100
+
+# Statuses that can never change; cached until evicted
+FINAL_STATUSES = frozenset(('failed', 'declined', 'refunded', 'canceled', 'cancelled'))
+# Settled, but a refund in any process can still change them; cached for settled_ttl seconds
+SETTLED_STATUSES = frozenset(('completed', 'succeeded'))
+
+
+class PaymentStatusCache:
+    """
+    Read-through cache in front of verify_payment_status.
+
+    Final statuses are kept until evicted. Completed payments are kept for
+    settled_ttl seconds: a refund invalidates them only in the process that
+    ran it, so other processes pick it up when the entry expires. Anything
+    else, including not_found, expires after pending_ttl seconds.
+    Concurrent lookups of the same transaction share one gateway call.
+    """
+
+    def __init__(self, payment_gateway: Optional[PaymentGateway] = None,
+                 maxsize: int = PAYMENT_STATUS_CACHE_SIZE, pending_ttl: float = PAYMENT_STATUS_PENDING_TTL,
+                 settled_ttl: float = PAYMENT_STATUS_SETTLED_TTL):
+        self._gateway = payment_gateway
+        self.settled_ttl = settled_ttl
+        self.cache = LRUCache(maxsize, pending_ttl)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {'gateway_calls': 0, 'coalesced': 0}
+
+    @property
+    def payment_gateway(self) -> PaymentGateway:
+        # Resolved per call so a reset of the shared gateway is picked up
+        return self._gateway or get_payment_gateway()
+
+    def verify(self, transaction_id: str) -> Dict:
+        """Get a transaction's status from the cache, or from the gateway on a miss."""
+        status = self.cache.get(transaction_id)
+        if status is not None:
+            return status
+
+        with self._lock:
+            future = self._inflight.get(transaction_id)
+            leader = future is None
+            if leader:
+                future = self._inflight[transaction_id] = Future()
+                self._stats['gateway_calls'] += 1
+                # Taken under the lock clear() holds, so the put below goes to this cache or is rejected
+                cache = self.cache
+                token = cache.token()
+            else:
+                self._stats['coalesced'] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            status = self.payment_gateway.verify_payment_status(transaction_id)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            cache.put(transaction_id, status, token, ttl=self._ttl(status.get('status')))
+            future.set_result(status)
+            return status
+        finally:
+            with self._lock:
+                del self._inflight[transaction_id]
+
+    def _ttl(self, status: Optional[str]) -> Optional[float]:
+        if status in FINAL_STATUSES:
+            return float('inf')
+        if status in SETTLED_STATUSES:
+            return self.settled_ttl
+        return None
+
+    def verify_many(self, transaction_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Get the status of several transactions. Cache misses are looked up
+        concurrently, up to the gateway's max_concurrency at a time.
+
+        Returns:
+            dict: Status per transaction id; a failed lookup maps to status 'error'
+        """
+        results = {}
+        missing = []
+        for transaction_id in dict.fromkeys(transaction_ids):
+            status = self.cache.get(transaction_id)
+            if status is None:
+                missing.append(transaction_id)
+            else:
+                results[transaction_id] = status
+
+        def lookup(transaction_id):
+            try:
+                return self.verify(transaction_id)
+            except Exception as e:
+                return {'transaction_id': transaction_id, 'status': 'error', 'message': str(e)}
+
+        if len(missing) == 1:
+            results[missing[0]] = lookup(missing[0])
+        elif missing:
+            workers = min(len(missing), self.payment_gateway.max_concurrency)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results.update(zip(missing, executor.map(lookup, missing)))
+        return {transaction_id: results[transaction_id] for transaction_id in dict.fromkeys(transaction_ids)}
+
+    def invalidate(self, *transaction_ids: str):
+        """Forget cached statuses, e.g. after a refund changed them."""
+        self.cache.invalidate(*transaction_ids)
+
+    def clear(self):
+        """Drop every cached status and reset the counters."""
+        with self._lock:
+            # Clearing the old cache fails any put from a lookup already in flight
+            self.cache.clear()
+            self.cache = LRUCache(self.cache.maxsize, self.cache.ttl)
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['cache'] = self.cache.stats()
+        return stats
+
+
+payment_status_cache = PaymentStatusCache()
+
+def verify_payment_status(transaction_id: str) -> Dict:
+    """Cached status of one gateway transaction."""
+    return payment_status_cache.verify(transaction_id)
+
+def verify_many(transaction_ids: List[str]) -> Dict[str, Dict]:
+    """Cached statuses of several gateway transactions."""
+    return payment_status_cache.verify_many(transaction_ids)
+
+
+instrument_module(sys.modules[__name__])
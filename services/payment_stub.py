@@ -0,0 +1,152 @@
+"""
+Payment Stub Module - Local HTTP server that imitates the payment gateway API
+Used to exercise HttpPaymentGateway in tests and benchmarks without a real gateway
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from services.payment_service import FakePaymentGateway
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so clients can reuse connections; send each response in
+    # one write so a reused connection does not wait on delayed ACKs
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.stub.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            return {}
+
+    def _inject_fault(self) -> bool:
+        """Apply the stub's configured fault to this request; True if an error response was sent."""
+        fault = self.server.stub.next_fault()
+        if fault == 'error':
+            self._send(503, {'message': 'Service unavailable'})
+            return True
+        if fault == 'slow':
+            time.sleep(self.server.stub.slow_latency)
+        return False
+
+    def do_POST(self):
+        stub = self.server.stub
+        stub.count('requests')
+        body = self._read_json()
+        if self._inject_fault():
+            return
+        if self.path == '/charges':
+            success, transaction_id, message = stub.gateway.process_payment(
+                str(body.get('customer_id', '')), float(body.get('amount', 0)), body.get('description', '')
+            )
+            self._send(200 if success else 402, {'transaction_id': transaction_id, 'message': message})
+        elif self.path == '/refunds':
+            success, message = stub.gateway.refund_payment(str(body.get('transaction_id', '')), float(body.get('amount', 0)))
+            self._send(200 if success else 400, {'message': message})
+        else:
+            self._send(404, {'message': 'Not found'})
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub.count('requests')
+        if self._inject_fault():
+            return
+        match = re.fullmatch(r'/charges/([^/]+)', self.path)
+        if not match:
+            self._send(404, {'message': 'Not found'})
+            return
+        status = stub.gateway.verify_payment_status(match.group(1))
+        self._send(404 if status['status'] == 'not_found' else 200, status)
+
+
+class StubGatewayServer:
+    """
+    Threaded HTTP server on localhost that answers charges, refunds and status
+    checks with FakePaymentGateway's rules after a fixed delay.
+
+    Counts requests and TCP connections, so callers can check connection reuse.
+    Faults can be injected: a share of requests answered with 503 (error_rate)
+    or delayed by slow_latency (slow_rate), or the next N requests failed.
+    """
+
+    def __init__(self, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 error_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 5.0, seed: Optional[int] = None):
+        self.gateway = FakePaymentGateway(latency)
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self._random = random.Random(seed)
+        self._fail_next = 0
+        self._server = ThreadingHTTPServer((host, port), _GatewayHandler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'connections': 0, 'errors': 0, 'slow': 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def fail_next(self, count: int):
+        """Answer the next count requests with 503."""
+        with self._lock:
+            self._fail_next = count
+
+    def next_fault(self) -> Optional[str]:
+        """Pick the fault, if any, for the next request: 'error', 'slow' or None."""
+        with self._lock:
+            if self._fail_next:
+                self._fail_next -= 1
+                fault = 'error'
+            else:
+                roll = self._random.random()
+                fault = 'error' if roll < self.error_rate else 'slow' if roll < self.error_rate + self.slow_rate else None
+            if fault:
+                self.stats['errors' if fault == 'error' else 'slow'] += 1
+        return fault
+
+    def start(self) -> 'StubGatewayServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='payment-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'StubGatewayServer':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -3,6 +3,10 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 import pytest
 import database
+from services.async_service import shutdown_async_service
+from services.gateway_resilience import reset_payment_gateway
+from services.payment_queue import stop_payment_workers
+from services.payment_status import payment_status_cache
 @pytest.fixture(autouse=True)
 def fresh_db(tmp_path, monkeypatch):
     test_db = tmp_path / "test_library.db"
@@ -11,4 +15,10 @@ def fresh_db(tmp_path, monkeypatch):
     database.add_sample_data()
     
     yield
+    stop_payment_workers()
+    shutdown_async_service()
+    reset_payment_gateway()
+    payment_status_cache.clear()
+    database.drop_catalog_index()
+    database.close_pools()
 
@@ -0,0 +1,127 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from services import async_service
+from services.payment_service import AsyncPaymentGateway, FakePaymentGateway
+from app import create_app, create_asgi_app
+
+
+class SlowGateway:
+    """Async gateway stand-in that answers once released."""
+
+    def __init__(self):
+        self.released = asyncio.Event()
+
+    async def process_payment(self, patron_id, amount, description=""):
+        await self.released.wait()
+        return True, "txn_slow_1", "Paid"
+
+async def call_asgi(app, method, path, query=b"", body=None):
+    """Send one HTTP request to an ASGI app and return (status, JSON body)."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "query_string": query, "headers": []}, receive, send)
+    return messages[0]["status"], json.loads(messages[1]["body"])
+
+def test_concurrent_async_borrows_respect_copies():
+    """Test that concurrent async borrows of a 3-copy book succeed exactly three times."""
+    async def borrow_all():
+        return await asyncio.gather(*(async_service.borrow_book_by_patron(f"{300000 + n}", 2) for n in range(6)))
+
+    results = asyncio.run(borrow_all())
+    borrowers = [f"{300000 + n}" for n, (success, _) in enumerate(results) if success]
+    assert len(borrowers) == 3
+    assert asyncio.run(async_service.return_book_by_patron(borrowers[0], 2))[0]
+
+def test_async_search_and_catalog_page():
+    """Test the async search and catalog page wrappers."""
+    async def read():
+        return await asyncio.gather(async_service.search_books_in_catalog("Gatsby", "title"),
+                                    async_service.get_catalog_page(limit=2))
+    results, page = asyncio.run(read())
+    assert results[0]["title"] == "The Great Gatsby"
+    assert len(page["books"]) == 2 and page["next_cursor"]
+
+def test_async_pay_late_fees_records_the_payment_once():
+    """Test that the async payment charges the gateway and does not charge a paid fee again."""
+    async def pay_twice():
+        async with AsyncPaymentGateway(FakePaymentGateway()) as gateway:
+            first = await async_service.pay_late_fees("123456", 4, gateway)
+            second = await async_service.pay_late_fees("123456", 4, gateway)
+        return first, second
+
+    first, second = asyncio.run(pay_twice())
+    assert first[0] and first[2].startswith("txn_")
+    assert second == (False, "No late fees owed for this book; they have already been paid.", None)
+
+def test_gateway_wait_does_not_hold_the_db_executor(monkeypatch):
+    """Test that reads complete on a one-thread DB executor while a payment awaits the gateway."""
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(async_service, "_db_executor", executor)
+
+    async def scenario():
+        gateway = SlowGateway()
+        payment = asyncio.ensure_future(async_service.pay_late_fees("123456", 4, gateway))
+        results = await asyncio.wait_for(async_service.search_books_in_catalog("1984", "title"), 5)
+        assert not payment.done()
+        gateway.released.set()
+        return results, await payment
+
+    results, payment = asyncio.run(scenario())
+    executor.shutdown()
+    assert results[0]["title"] == "1984"
+    assert payment == (True, "Payment successful! Paid", "txn_slow_1")
+
+def test_asgi_app_matches_flask_responses():
+    """Test that the ASGI endpoints return the same JSON as the Flask routes."""
+    flask_app = create_app()
+    client = flask_app.test_client()
+    app = create_asgi_app(flask_app)
+
+    status, body = asyncio.run(call_asgi(app, "GET", "/api/search", b"q=Gatsby&type=title"))
+    assert (status, body) == (200, client.get("/api/search?q=Gatsby&type=title").get_json())
+    status, body = asyncio.run(call_asgi(app, "GET", "/api/books", b"limit=2"))
+    assert (status, body) == (200, client.get("/api/books?limit=2").get_json())
+    assert asyncio.run(call_asgi(app, "GET", "/api/books", b"limit=x"))[0] == 400
+    assert asyncio.run(call_asgi(app, "GET", "/api/search"))[0] == 400
+
+def test_asgi_borrow_and_return():
+    """Test borrowing and returning through the ASGI app, including bad input."""
+    app = create_asgi_app(create_app())
+    status, body = asyncio.run(call_asgi(app, "POST", "/api/loans", body={"patron_id": "123456", "book_id": 2}))
+    assert status == 200 and body["success"]
+    status, body = asyncio.run(call_asgi(app, "POST", "/api/returns", body={"patron_id": "123456", "book_id": 2}))
+    assert status == 200 and "Returned book successfully" in body["message"]
+    assert asyncio.run(call_asgi(app, "POST", "/api/loans", body={"patron_id": "123456", "book_id": "2"}))[0] == 400
+    assert asyncio.run(call_asgi(app, "POST", "/api/loans", body=["not", "an", "object"]))[0] == 400
+
+def test_asgi_lifespan_shuts_down_executor():
+    """Test that the ASGI lifespan shutdown stops the DB executor."""
+    app = create_asgi_app(create_app())
+    asyncio.run(async_service.get_catalog_page())
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert async_service._db_executor is None
+
+def test_flask_json_loan_routes():
+    """Test the synchronous JSON borrow, return and late fee routes."""
+    client = create_app().test_client()
+    assert client.post("/api/loans", json={"patron_id": "123456", "book_id": 2}).get_json()["success"]
+    assert client.post("/api/returns", json={"patron_id": "123456", "book_id": 2}).status_code == 200
+    assert client.post("/api/returns", json={"patron_id": "123456", "book_id": 2}).status_code == 400
+    assert client.post("/api/late-fees", json={"patron_id": "123456", "book_id": "4"}).status_code == 400
@@ -0,0 +1,91 @@
+import threading
+from datetime import datetime, timedelta
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from database import (
+    borrow_book_atomic, get_book_by_id, get_book_by_isbn, insert_book,
+    pooled_connection, transaction
+)
+
+
+def _open_loans(book_id):
+    with pooled_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM borrow_records WHERE book_id = ? AND return_date IS NULL", (book_id,)
+        ).fetchone()[0]
+
+def test_concurrent_borrows_never_oversell():
+    """Test that many threads racing for the last copies cannot oversell a book."""
+    insert_book("Contended Book", "Some Author", "5550000000001", 3, 3)
+    book_id = get_book_by_isbn("5550000000001")["id"]
+
+    threads_count = 40
+    barrier = threading.Barrier(threads_count)
+    results = []
+    results_lock = threading.Lock()
+
+    def borrow(n):
+        barrier.wait()
+        outcome = borrow_book_by_patron(f"{700000 + n}", book_id)
+        with results_lock:
+            results.append(outcome)
+
+    threads = [threading.Thread(target=borrow, args=(n,)) for n in range(threads_count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    successes = [msg for ok, msg in results if ok]
+    assert len(successes) == 3
+    assert get_book_by_id(book_id)["available_copies"] == 0
+    assert _open_loans(book_id) == 3
+
+def test_concurrent_borrow_and_return_keep_counts_consistent():
+    """Test that interleaved borrows and returns leave copies and loans in step."""
+    insert_book("Busy Book", "Some Author", "5550000000002", 2, 2)
+    book_id = get_book_by_isbn("5550000000002")["id"]
+    barrier = threading.Barrier(20)
+
+    def cycle(n):
+        patron_id = f"{710000 + n}"
+        barrier.wait()
+        for _ in range(5):
+            ok, _ = borrow_book_by_patron(patron_id, book_id)
+            if ok:
+                return_book_by_patron(patron_id, book_id)
+
+    threads = [threading.Thread(target=cycle, args=(n,)) for n in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    book = get_book_by_id(book_id)
+    assert 0 <= book["available_copies"] <= book["total_copies"]
+    assert book["available_copies"] + _open_loans(book_id) == book["total_copies"]
+
+def test_borrow_atomic_respects_limit():
+    """Test that the borrowing limit is checked inside the transaction."""
+    now = datetime.now()
+    assert borrow_book_atomic("123456", 1, now, now + timedelta(days=14), 2) == "limit_reached"
+    assert borrow_book_atomic("654321", 3, now, now + timedelta(days=14), 5) == "unavailable"
+    assert borrow_book_atomic("654321", 999, now, now + timedelta(days=14), 5) == "not_found"
+
+def test_transaction_rolls_back_on_error():
+    """Test that a failing unit of work leaves no partial writes."""
+    try:
+        with transaction() as conn:
+            conn.execute("UPDATE books SET available_copies = 0 WHERE id = 1")
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert get_book_by_id(1)["available_copies"] == 4
+
+def test_return_without_loan_fails():
+    """Test that returning a book the patron never borrowed changes nothing."""
+    success, message = return_book_by_patron("654321", 2)
+
+    assert success is False
+    assert message == "Book unable to be returned."
+    assert get_book_by_id(2)["available_copies"] == 3
@@ -0,0 +1,82 @@
+from cache import LRUCache
+from database import book_cache, get_book_by_id, get_book_by_isbn, get_book_cache_stats, update_book_availability
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_lru_evicts_least_recently_used():
+    """Test that the oldest untouched entry is evicted when the cache is full."""
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire_after_ttl():
+    """Test that an entry is a miss once its TTL has passed."""
+    clock = FakeClock()
+    cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+    cache.put("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_put_after_invalidation_is_dropped():
+    """Test that a load which raced with an invalidation is not cached."""
+    cache = LRUCache(maxsize=10, ttl=60)
+    token = cache.token()
+    cache.invalidate("a")
+    cache.put("a", "stale", token)
+
+    assert cache.get("a") is None
+
+def test_repeat_lookups_hit_cache():
+    """Test that id and ISBN lookups are served from the cache after the first load."""
+    get_book_by_id(2)
+    before = get_book_cache_stats()["hits"]
+
+    assert get_book_by_id(2)["title"] == "The Great Gatsby"
+    assert get_book_by_isbn("9780743273565")["id"] == 2
+    assert get_book_cache_stats()["hits"] >= before + 2
+
+def test_cached_copy_cannot_be_mutated():
+    """Test that callers get copies, not the cached dict."""
+    get_book_by_id(2)["title"] = "Changed"
+
+    assert get_book_by_id(2)["title"] == "The Great Gatsby"
+
+def test_borrow_and_return_refresh_availability():
+    """Test that borrow and return paths never read a stale availability count."""
+    assert get_book_by_id(2)["available_copies"] == 3
+
+    borrow_book_by_patron("222222", 2)
+    assert get_book_by_id(2)["available_copies"] == 2
+
+    return_book_by_patron("222222", 2)
+    assert get_book_by_id(2)["available_copies"] == 3
+
+    update_book_availability(2, -1)
+    assert get_book_by_id(2)["available_copies"] == 2
+
+def test_last_copy_rejected_even_with_cached_availability():
+    """Test that availability is enforced by the database, not the cached row."""
+    get_book_by_id(1)
+    for n in range(4):
+        assert borrow_book_by_patron(f"33333{n}", 1)[0] is True
+
+    success, message = borrow_book_by_patron("333339", 1)
+
+    assert success is False
+    assert message == "This book is currently not available."
@@ -0,0 +1,92 @@
+import pytest
+import database
+from catalog_index import BookRecord, CatalogIndex
+from database import (
+    build_catalog_index, drop_catalog_index, get_all_books, get_book_by_id, get_book_by_isbn,
+    get_books_page, get_db_connection, get_catalog_index, insert_book, insert_books_bulk, update_book_availability
+)
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+from app import create_app
+
+
+@pytest.fixture
+def index():
+    index = build_catalog_index()
+    yield index
+    drop_catalog_index()
+
+def test_records_have_no_instance_dict():
+    """Test that book records are slot-based."""
+    record = BookRecord(1, "Title", "Author", "1234567890123", 2, 1)
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(AttributeError):
+        record.publisher = "Nope"
+
+def test_index_matches_database_reads(index):
+    """Test that indexed lookups and pages return the same books as SQLite."""
+    indexed = (get_all_books(), get_book_by_id(1), get_book_by_isbn("9780451524935"), get_books_page(2))
+    drop_catalog_index()
+    assert indexed == (get_all_books(), get_book_by_id(1), get_book_by_isbn("9780451524935"), get_books_page(2))
+
+def test_pages_walk_the_title_index(index):
+    """Test keyset paging over the sorted title index."""
+    books, cursor = get_books_page(3, records=True)
+    assert all(isinstance(book, BookRecord) for book in books)
+    rest, end = get_books_page(3, cursor, records=True)
+    titles = [book.title for book in books + rest]
+    assert titles == sorted(titles)
+    assert end is None
+    assert len(titles) == len(index)
+
+def test_writes_keep_the_index_coherent(index):
+    """Test that inserts, bulk inserts, availability changes, borrows and returns update the index."""
+    assert insert_book("Aardvark Tales", "Author", "7770000000001", 2, 2)
+    assert [book.title for book in get_books_page(2, records=True)[0]] == ["1984", "Aardvark Tales"]
+    assert insert_books_bulk([("Bulk Book", "Author", "7770000000002", 1, 1)]) == []
+    assert index.get_by_isbn("7770000000002").title == "Bulk Book"
+
+    book_id = index.get_by_isbn("7770000000001").id
+    assert update_book_availability(book_id, -1)
+    assert index.get(book_id).available_copies == 1
+    assert borrow_book_by_patron("123456", book_id)[0]
+    assert index.get(book_id).available_copies == 0
+    assert return_book_by_patron("123456", book_id)[0]
+    assert index.get(book_id).available_copies == 1
+
+def test_unindexed_book_falls_back_to_database(index):
+    """Test that a book written behind the index's back is found and indexed on lookup."""
+    conn = get_db_connection()
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('Side', 'Door', '7770000000009', 1, 1)")
+    conn.commit()
+    conn.close()
+    assert get_book_by_isbn("7770000000009")["title"] == "Side"
+    assert index.get_by_isbn("7770000000009") is not None
+
+def test_index_is_per_database(index, tmp_path, monkeypatch):
+    """Test that the index is ignored once another database is configured."""
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "other.db"))
+    assert get_catalog_index() is None
+
+def test_memory_footprint_is_reported():
+    """Test that memory and allocation counters are reported and records beat dict rows."""
+    rows = [(n, f"Title {n}", f"Author {n % 50}", f"{9780000000000 + n}", 3, 3) for n in range(1, 2001)]
+    index = CatalogIndex(":memory:").load(rows)
+    index.get_dict(1)
+    stats = index.stats()
+    assert stats["records_allocated"] == 2000
+    assert stats["dicts_built"] == 1
+    assert stats["memory"]["books"] == 2000
+    assert stats["memory"]["record_bytes"] + stats["memory"]["value_bytes"] < stats["memory"]["dict_rows_bytes"]
+
+def test_create_app_builds_index_and_serves_catalog():
+    """Test that create_app builds the index on request and the catalog and metrics pages use it."""
+    client = create_app(catalog_index=True).test_client()
+    try:
+        assert get_catalog_index() is not None
+        assert b"The Great Gatsby" in client.get("/catalog").data
+        metrics = client.get("/api/db/catalog-index").get_json()
+        assert metrics["enabled"]
+        assert metrics["memory"]["books"] == 4
+    finally:
+        drop_catalog_index()
+    assert client.get("/api/db/catalog-index").get_json() == {"enabled": False}
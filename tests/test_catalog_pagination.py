@@ -0,0 +1,71 @@
+from database import get_books_page, get_db_connection, insert_book
+from services.library_service import get_catalog_page, encode_catalog_cursor
+from app import create_app
+
+
+def _add_books(count, title="Paged Book"):
+    for n in range(count):
+        insert_book(f"{title} {n % 7}", "Page Author", f"{8880000000000 + n}", 1, 1)
+
+def test_pages_cover_catalog_once_in_title_order():
+    """Test that walking every page returns each book exactly once, sorted by (title, id)."""
+    _add_books(95)
+    seen = []
+    cursor = None
+    while True:
+        page = get_catalog_page(limit=10, cursor=cursor)
+        seen.extend(page["books"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    keys = [(book["title"], book["id"]) for book in seen]
+    assert len(keys) == 99  # 95 added plus 4 sample books
+    assert len(set(keys)) == len(keys)
+    assert keys == sorted(keys)
+
+def test_last_page_has_no_cursor():
+    """Test that a page that reaches the end of the catalog has no next cursor."""
+    books, next_cursor = get_books_page(4)
+
+    assert len(books) == 4
+    assert next_cursor is None
+
+def test_invalid_page_arguments():
+    """Test that bad limits and cursors are rejected."""
+    assert "error" in get_catalog_page(limit=0)
+    assert "error" in get_catalog_page(limit=10000)
+    assert get_catalog_page(cursor="not-a-cursor") == {"error": "Invalid cursor."}
+
+def test_books_api_paginates():
+    """Test the /api/books endpoint with limit and cursor parameters."""
+    client = create_app().test_client()
+
+    first = client.get("/api/books?limit=3").get_json()
+    second = client.get(f"/api/books?limit=3&cursor={first['next_cursor']}").get_json()
+
+    assert first["count"] == 3
+    assert second["count"] == 1
+    assert second["next_cursor"] is None
+    assert client.get("/api/books?limit=abc").status_code == 400
+
+def test_catalog_page_links_to_next_page():
+    """Test that the catalog view renders a next-page link when more books exist."""
+    _add_books(150)
+    client = create_app().test_client()
+
+    response = client.get("/catalog")
+
+    assert response.status_code == 200
+    assert b"Next Page" in response.data
+
+def test_title_page_query_uses_index():
+    """Test that a keyset page is an index search on title."""
+    conn = get_db_connection()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM books WHERE (title, id) > (?, ?) ORDER BY title, id LIMIT 10",
+        ("M", 1)
+    ).fetchall()
+    conn.close()
+
+    assert "idx_books_title" in " ".join(row["detail"] for row in plan)
@@ -0,0 +1,84 @@
+import threading
+import pytest
+import database
+from database import ConnectionPool, get_pool, get_book_by_id, get_pool_metrics, pooled_connection, read_connection
+from app import create_app
+
+
+def test_pool_reuses_connection_across_helpers():
+    """Test that repeated helper calls reuse one pooled connection."""
+    get_book_by_id(1)
+    get_book_by_id(2)
+    get_book_by_id(3)
+
+    metrics = get_pool_metrics()["read"]
+    assert metrics["created"] == 1
+    assert metrics["reused"] == 2
+    assert metrics["in_use"] == 0
+
+def test_pool_nested_checkout_same_thread():
+    """Test that a nested checkout on the same thread gets the same connection."""
+    with pooled_connection() as outer:
+        with pooled_connection() as inner:
+            assert inner is outer
+        assert get_pool_metrics()["write"]["in_use"] == 1
+
+    assert get_pool_metrics()["write"]["in_use"] == 0
+
+def test_pool_exhausted_raises(tmp_path):
+    """Test that checking out more connections than the pool size times out."""
+    pool = ConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.05)
+    held = threading.Event()
+    done = threading.Event()
+
+    def hold():
+        with pool.connection():
+            held.set()
+            done.wait()
+
+    worker = threading.Thread(target=hold)
+    worker.start()
+    held.wait()
+    with pytest.raises(database.sqlite3.OperationalError):
+        pool.acquire()
+    done.set()
+    worker.join()
+
+    assert pool.metrics()["timeouts"] == 1
+    pool.close()
+
+def test_pool_replaces_unhealthy_connection():
+    """Test that a closed idle connection is discarded by the health check."""
+    with pooled_connection() as conn:
+        pass
+    conn.close()
+
+    with pooled_connection() as fresh:
+        assert fresh is not conn
+        assert fresh.execute("SELECT 1").fetchone()[0] == 1
+
+    assert get_pool_metrics()["write"]["health_check_failures"] == 1
+
+def test_request_binds_one_connection():
+    """Test that a request holds one connection for all the helpers it calls."""
+    client = create_app().test_client()
+    before = get_pool(readonly=True).metrics()["checkouts"]
+
+    response = client.get("/api/late_fee/123456/4")
+
+    assert response.status_code == 200
+    assert get_pool_metrics()["read"]["checkouts"] == before + 1
+    assert get_pool(readonly=True).metrics()["in_use"] == 0
+
+def test_read_pool_is_read_only():
+    """Test that read connections reject writes."""
+    with read_connection() as conn:
+        with pytest.raises(database.sqlite3.OperationalError):
+            conn.execute("UPDATE books SET available_copies = 0")
+
+def test_storage_profile_applied():
+    """Test that pooled connections use WAL journaling and the tuned PRAGMAs."""
+    with pooled_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == database.STORAGE_PROFILE["busy_timeout"]
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import threading
+from datetime import datetime, timedelta
+from database import CATALOG_EVENT_TRIM_BATCH, borrow_book_atomic, get_catalog_events
+from services.event_bus import EventBus, SharedEventBus, event_bus
+from services.library_service import add_book_to_catalog, borrow_book_by_patron, return_book_by_patron
+from routes.async_routes import AsyncApiApp
+from app import create_app
+
+
+def _parse(chunk):
+    """Split an SSE chunk into (event, data) pairs."""
+    events = []
+    for block in chunk.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":") and ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_subscribers_receive_events_in_order():
+    """Test that every subscriber gets each published event once, in id order."""
+    bus = EventBus()
+    first, second = bus.subscribe(), bus.subscribe()
+    ids = [bus.publish("availability", {"book_id": n}) for n in range(3)]
+    assert [event[0] for event in first.get(0)] == ids
+    assert [event[2]["book_id"] for event in second.get(0)] == [0, 1, 2]
+    assert first.get(0.01) == []
+
+def test_slow_subscriber_overflows_without_blocking_publishers():
+    """Test that a full buffer drops the backlog and flags the subscriber instead of growing."""
+    bus = EventBus(buffer_size=2)
+    slow, fast = bus.subscribe(), bus.subscribe()
+    for n in range(3):
+        bus.publish("availability", {"book_id": n})
+        fast.get(0)
+    assert slow.reset_overflow()
+    assert bus.stats()["overflows"] == 1
+    assert not fast.reset_overflow()
+
+def test_reconnect_replays_missed_events():
+    """Test Last-Event-ID replay, and a reset when the missed events are gone."""
+    bus = EventBus(history_size=3)
+    first = bus.publish("availability", {"book_id": 1})
+    bus.publish("availability", {"book_id": 2})
+    resumed = bus.subscribe(last_event_id=first)
+    assert [event[2]["book_id"] for event in resumed.get(0)] == [2]
+
+    for n in range(5):
+        bus.publish("availability", {"book_id": n})
+    assert bus.subscribe(last_event_id=first).overflowed
+    assert bus.subscribe(last_event_id=10 ** 6).overflowed
+
+def test_subscriber_limit_and_close():
+    """Test that subscriptions beyond the limit are refused and closing frees a slot."""
+    bus = EventBus(max_subscribers=1)
+    subscription = bus.subscribe()
+    assert bus.subscribe() is None
+    subscription.close()
+    assert bus.subscribe() is not None
+
+def test_waiting_reader_wakes_on_publish():
+    """Test that an idle subscriber blocks until an event arrives."""
+    bus = EventBus()
+    subscription = bus.subscribe()
+    received = []
+    reader = threading.Thread(target=lambda: received.extend(subscription.get(5)))
+    reader.start()
+    bus.publish("availability", {"book_id": 1})
+    reader.join(1)
+    assert len(received) == 1
+
+def test_shared_feed_reaches_other_processes():
+    """Test that a bus sees events published through another bus on the same database, under the same ids."""
+    publisher = SharedEventBus(history_size=3, poll_interval=0.05)
+    worker = SharedEventBus(poll_interval=0.05)
+    with worker.subscribe() as subscription:
+        first = publisher.publish("availability", {"book_id": 1})
+        assert subscription.get(5) == [(first, "availability", {"book_id": 1})]
+
+    second = publisher.publish("availability", {"book_id": 2})
+    with worker.subscribe(last_event_id=first) as resumed:
+        assert resumed.get(0) == [(second, "availability", {"book_id": 2})]
+
+    # Old events are trimmed a batch at a time
+    for n in range(3 + CATALOG_EVENT_TRIM_BATCH):
+        publisher.publish("availability", {"book_id": n})
+    with worker.subscribe(last_event_id=first) as stale:
+        assert stale.overflowed
+    assert worker.stats()["last_event_id"] == publisher.stats()["last_event_id"]
+
+def test_library_operations_publish_availability():
+    """Test that borrowing, returning and adding books publish events."""
+    with event_bus.subscribe() as subscription:
+        assert borrow_book_by_patron("123456", 2)[0]
+        assert return_book_by_patron("123456", 2)[0]
+        assert add_book_to_catalog("Event Book", "Author", "5550000000001", 2)[0]
+        events = [(event_type, data) for _, event_type, data in subscription.get(0)]
+    assert events[0] == ("availability", {"book_id": 2, "available_copies": 2, "total_copies": 3})
+    assert events[1] == ("availability", {"book_id": 2, "available_copies": 3, "total_copies": 3})
+    assert events[2][0] == "book_added"
+    assert events[2][1]["isbn"] == "5550000000001"
+
+def test_borrow_appends_its_event_in_the_same_transaction():
+    """Test that a borrow records its availability event itself, and a failed borrow records none."""
+    now = datetime.now()
+    assert borrow_book_atomic("654321", 2, now, now + timedelta(days=14), 5) == "borrowed"
+    assert borrow_book_atomic("654321", 999, now, now + timedelta(days=14), 5) == "not_found"
+    assert [(event_type, data) for _, event_type, data in get_catalog_events(0)] == [
+        ("availability", {"book_id": 2, "available_copies": 2, "total_copies": 3})
+    ]
+
+def test_sse_endpoint_streams_deltas():
+    """Test that /api/events streams availability changes and unsubscribes on close."""
+    client = create_app().test_client()
+    subscribers = event_bus.stats()["subscribers"]
+    response = client.get("/api/events")
+    assert response.mimetype == "text/event-stream"
+    assert event_bus.stats()["subscribers"] == subscribers + 1
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b"retry:")
+
+    borrow_book_by_patron("123456", 2)
+    assert _parse(next(chunks).decode()) == [("availability", {"book_id": 2, "available_copies": 2, "total_copies": 3})]
+    response.close()
+    assert event_bus.stats()["subscribers"] == subscribers
+
+def test_sse_endpoint_sends_reset_after_lost_events():
+    """Test that a client resuming from an unknown event id is told to reload."""
+    client = create_app().test_client()
+    response = client.get("/api/events", headers={"Last-Event-ID": str(10 ** 9)})
+    chunks = iter(response.response)
+    next(chunks)
+    assert _parse(next(chunks).decode())[0][0] == "reset"
+    response.close()
+    assert client.get("/api/events", headers={"Last-Event-ID": "abc"}).status_code == 400
+
+def test_asgi_event_stream():
+    """Test that the ASGI app streams availability changes and unsubscribes when the client disconnects."""
+    app = AsyncApiApp()
+    subscribers = event_bus.stats()["subscribers"]
+    scope = {"type": "http", "method": "GET", "path": "/api/events", "query_string": b"", "headers": []}
+
+    async def scenario():
+        sent = []
+        disconnect = asyncio.Event()
+
+        async def receive():
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if b"availability" in message.get("body", b""):
+                disconnect.set()
+
+        stream = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.sleep(0.05)
+        assert event_bus.stats()["subscribers"] == subscribers + 1
+        await asyncio.get_running_loop().run_in_executor(None, borrow_book_by_patron, "123456", 2)
+        await asyncio.wait_for(stream, 5)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert sent[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in sent[0]["headers"]
+    assert sent[1]["body"].startswith(b"retry:")
+    assert _parse(sent[-1]["body"].decode()) == [("availability", {"book_id": 2, "available_copies": 2, "total_copies": 3})]
+    assert event_bus.stats()["subscribers"] == subscribers
+
+    bad = {**scope, "headers": [(b"last-event-id", b"abc")]}
+    replies = []
+
+    async def collect(message):
+        replies.append(message)
+
+    asyncio.run(app(bad, None, collect))
+    assert replies[0]["status"] == 400
@@ -0,0 +1,89 @@
+import csv
+import io
+from datetime import datetime, timedelta
+from database import insert_book, insert_borrow_record, get_book_by_isbn, iter_loan_fees
+from services.library_service import calculate_late_fee_for_book
+from services.fee_engine import get_loan_fees_page, run_fee_batch, write_fee_report
+from app import create_app
+import manage
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def _loan(patron_id, days_overdue, now=NOW, book_isbn="6660000000001"):
+    book = get_book_by_isbn(book_isbn)
+    if book is None:
+        insert_book("Fee Book", "Fee Author", book_isbn, 50, 50)
+        book = get_book_by_isbn(book_isbn)
+    due = now - timedelta(days=days_overdue)
+    insert_borrow_record(patron_id, book["id"], due - timedelta(days=14), due)
+    return book["id"]
+
+def test_tiered_fees_match_single_loan_calculation():
+    """Test that the SQL fee tiers agree with calculate_late_fee_for_book."""
+    now = datetime.now()
+    cases = {"400001": 1.5, "400002": 7, "400003": 8, "400004": 10.25, "400005": 30, "400006": -3}
+    book_ids = {patron: _loan(patron, days, now) for patron, days in cases.items()}
+
+    batch = {row["patron_id"]: row for row in iter_loan_fees(datetime.now(), overdue_only=False)
+             if row["patron_id"] in cases}
+    for patron_id, book_id in book_ids.items():
+        single = calculate_late_fee_for_book(patron_id, book_id)
+        assert batch[patron_id]["fee_amount"] == single["fee_amount"]
+        assert batch[patron_id]["days_overdue"] == single["days_overdue"]
+
+def test_fee_tiers_and_cap():
+    """Test the $0.50 / $1.00 tiers and the $15.00 cap."""
+    for patron_id, days in (("410001", 3), ("410002", 7), ("410003", 9), ("410004", 40)):
+        _loan(patron_id, days)
+
+    fees = {row["patron_id"]: row["fee_amount"] for row in iter_loan_fees(NOW)}
+
+    assert fees["410001"] == 1.5
+    assert fees["410002"] == 3.5
+    assert fees["410003"] == 5.5
+    assert fees["410004"] == 15.0
+
+def test_batch_summary_matches_streamed_rows():
+    """Test that the SQL aggregate and the streamed rows agree."""
+    for n in range(20):
+        _loan(f"42{n:04d}", n)
+
+    streamed = []
+    sink_summary = run_fee_batch(NOW, sink=streamed.append)
+    sql_summary = run_fee_batch(NOW)
+
+    assert sink_summary["loans"] == sql_summary["loans"] == len(streamed)
+    assert sink_summary["total_fees"] == sql_summary["total_fees"]
+    assert sink_summary["patrons"] == sql_summary["patrons"]
+
+def test_fee_report_csv_and_paging():
+    """Test the CSV report and keyset paging over loan fees."""
+    for n in range(5):
+        _loan(f"43{n:04d}", 10)
+
+    out = io.StringIO()
+    summary = write_fee_report(out, NOW)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len(rows) == summary["loans"]
+
+    first = get_loan_fees_page(limit=2)
+    second = get_loan_fees_page(limit=2, after_id=first["next_after"])
+    assert [r["borrow_id"] for r in first["results"]] < [r["borrow_id"] for r in second["results"]]
+    assert "error" in get_loan_fees_page(limit=0)
+
+def test_fee_api_and_cli(capsys):
+    """Test the fee summary API and the compute-fees command."""
+    _loan("440001", 10)
+    client = create_app().test_client()
+
+    summary = client.get("/api/fees/summary").get_json()
+    page = client.get("/api/fees/loans?limit=1").get_json()
+    assert summary["loans"] >= 2  # includes the overdue sample loan
+    assert page["count"] == 1
+
+    assert manage.main(["compute-fees"]) == 0
+    assert '"total_fees"' in capsys.readouterr().out
+
+    assert manage.main(["compute-fees", "--as-of", "nope"]) == 2
+    assert "Compute fees failed" in capsys.readouterr().err
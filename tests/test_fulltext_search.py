@@ -0,0 +1,56 @@
+from database import build_fulltext_query, get_book_by_isbn, get_db_connection, insert_book
+from services.library_service import search_books_in_catalog
+from app import create_app
+
+
+def test_search_is_case_insensitive_prefix_match():
+    """Test that words match as case-insensitive prefixes."""
+    results = search_books_in_catalog("gREAT gat", "title")
+
+    assert [book["title"] for book in results] == ["The Great Gatsby"]
+
+def test_search_ranks_better_matches_first():
+    """Test that results are ordered by bm25 relevance."""
+    insert_book("Gardening", "Green Author", "4440000000001", 1, 1)
+    insert_book("Gardening Gardening Gardening", "Green Author", "4440000000002", 1, 1)
+
+    results = search_books_in_catalog("gardening", "title")
+
+    assert results[0]["isbn"] == "4440000000002"
+
+def test_new_books_are_searchable_immediately():
+    """Test that the insert trigger indexes a new book."""
+    insert_book("Zymurgy Handbook", "Brewer Person", "4440000000003", 1, 1)
+
+    assert [book["isbn"] for book in search_books_in_catalog("zymur", "title")] == ["4440000000003"]
+    assert [book["isbn"] for book in search_books_in_catalog("brewer", "author")] == ["4440000000003"]
+
+def test_title_search_does_not_match_author():
+    """Test that a title search is restricted to the title column."""
+    assert search_books_in_catalog("Orwell", "title") == []
+
+def test_updated_and_deleted_books_leave_index():
+    """Test that the update and delete triggers keep the index in step."""
+    conn = get_db_connection()
+    conn.execute("UPDATE books SET title = 'Nineteen Eighty-Four' WHERE isbn = '9780451524935'")
+    conn.execute("DELETE FROM books WHERE isbn = '9780061120084'")
+    conn.commit()
+    conn.close()
+
+    assert search_books_in_catalog("1984", "title") == []
+    assert search_books_in_catalog("nineteen", "title")[0]["isbn"] == "9780451524935"
+    assert search_books_in_catalog("mockingbird", "title") == []
+
+def test_query_builder_escapes_punctuation():
+    """Test that FTS operators in user input are treated as plain words."""
+    assert build_fulltext_query('"NEAR( OR *', "title") == 'title : ("NEAR"* AND "OR"*)'
+    assert build_fulltext_query("  -- ", "title") is None
+
+def test_search_api_limit():
+    """Test the limit parameter of /api/search."""
+    for n in range(5):
+        insert_book(f"Limited Edition {n}", "Some Author", f"444000000001{n}", 1, 1)
+    client = create_app().test_client()
+
+    assert client.get("/api/search?q=limited&limit=2").get_json()["count"] == 2
+    assert client.get("/api/search?q=limited&limit=0").status_code == 400
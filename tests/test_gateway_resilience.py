@@ -0,0 +1,168 @@
+import time
+import pytest
+import requests
+from database import enqueue_payment, get_payment, get_payment_by_transaction, get_unknown_payments
+from services.gateway_resilience import (
+    CircuitBreaker, GatewayTimeout, GatewayUnavailable, LatencyHistogram, ResilientPaymentGateway
+)
+from services.library_service import UNRECONCILED_PAYMENT_MESSAGE, pay_late_fees
+from services.payment_queue import PaymentWorkerPool, submit_late_fee_payment
+from services.payment_service import FakePaymentGateway, HttpPaymentGateway, PaymentOutcomeUnknown
+from services.payment_stub import StubGatewayServer
+from app import create_app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def stub():
+    with StubGatewayServer() as server:
+        yield server
+
+def _resilient(stub, **kwargs):
+    kwargs.setdefault("backoff", 0.001)
+    return ResilientPaymentGateway(HttpPaymentGateway(stub.url), **kwargs)
+
+def test_breaker_opens_half_opens_and_closes():
+    """Test the closed, open, half-open cycle of the circuit breaker."""
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial call at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    clock.now = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["opened"] == 2
+
+def test_latency_histogram_is_cumulative():
+    """Test that histogram buckets count every observation at or below their bound."""
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(seconds)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"0.1": 1, "1.0": 3, "+Inf": 4}
+    assert snapshot["count"] == 4
+
+def test_slow_gateway_times_out(stub):
+    """Test that calls return within their time budget when the gateway hangs."""
+    stub.slow_rate, stub.slow_latency = 1.0, 1.0
+    gateway = ResilientPaymentGateway(HttpPaymentGateway(stub.url, timeout=0.1), timeout=0.1, retries=0)
+    started = time.monotonic()
+    with pytest.raises(GatewayTimeout):
+        gateway.verify_payment_status("txn_123456_1")
+    # Charges are bounded by the client's request timeout, and the outcome is unknown rather than failed
+    with pytest.raises(PaymentOutcomeUnknown):
+        gateway.process_payment("123456", 2.5)
+    assert time.monotonic() - started < 0.5
+    assert gateway.metrics()["timeouts"] == 2
+
+def test_charge_answered_after_timeout_is_not_charged_again(stub):
+    """Test that a charge the gateway completes after the client gave up is charged only once."""
+    stub.slow_rate, stub.slow_latency = 1.0, 0.3
+    gateway = ResilientPaymentGateway(HttpPaymentGateway(stub.url, timeout=0.1))
+    success, message, _ = pay_late_fees("123456", 4, gateway)
+    assert not success and message.startswith("Payment outcome unknown")
+    time.sleep(0.4)
+    assert stub.gateway.calls == 1  # the gateway took the charge after the timeout
+
+    stub.slow_rate = 0.0
+    assert pay_late_fees("123456", 4, gateway) == (False, UNRECONCILED_PAYMENT_MESSAGE, None)
+    assert not submit_late_fee_payment("123456", 4)[0]
+    assert not PaymentWorkerPool(gateway, workers=1, lease=0).run_once()
+    assert stub.gateway.calls == 1
+    payment = get_unknown_payments()[0]
+    assert (payment["book_id"], payment["status"]) == (4, "unknown")
+
+def test_slow_charge_is_held_for_reconciliation():
+    """Test that a charge slower than the time budget returns in time and is not sent again."""
+    slow = FakePaymentGateway(latency=0.3)
+    gateway = ResilientPaymentGateway(slow, timeout=0.05)
+    started = time.monotonic()
+    success, message, _ = pay_late_fees("123456", 4, gateway)
+    assert time.monotonic() - started < 0.25
+    assert not success and message.startswith("Payment outcome unknown")
+    assert pay_late_fees("123456", 4, gateway) == (False, UNRECONCILED_PAYMENT_MESSAGE, None)
+    assert get_unknown_payments()[0]["book_id"] == 4
+    time.sleep(0.35)
+    assert slow.calls == 1
+
+def test_hung_calls_do_not_block_later_ones():
+    """Test that once every slot is held by a hung call, later calls give up within their budget unsent."""
+    slow = FakePaymentGateway(latency=0.5, max_concurrency=1)
+    gateway = ResilientPaymentGateway(slow, timeout=0.05, breaker=CircuitBreaker(failure_threshold=10))
+    with pytest.raises(PaymentOutcomeUnknown):
+        gateway.process_payment("123456", 2.5)
+    started = time.monotonic()
+    with pytest.raises(GatewayUnavailable):
+        gateway.refund_payment("txn_123456_1", 1.0)
+    with pytest.raises(GatewayUnavailable):
+        gateway.verify_payment_status("txn_123456_1")
+    assert time.monotonic() - started < 0.4
+    time.sleep(0.55)
+    assert slow.calls == 1
+
+def test_status_checks_are_retried(stub):
+    """Test that read-only status checks retry through transient errors."""
+    stub.fail_next(2)
+    gateway = _resilient(stub, retries=2)
+    assert gateway.verify_payment_status("txn_123456_1")["status"] == "completed"
+    assert stub.stats["requests"] == 3
+    assert gateway.metrics()["retries"] == 2
+
+def test_charges_are_not_retried(stub):
+    """Test that a failed charge is reported instead of being sent again."""
+    stub.fail_next(1)
+    gateway = _resilient(stub, retries=2)
+    with pytest.raises(requests.HTTPError):
+        gateway.process_payment("123456", 2.5)
+    assert stub.stats["requests"] == 1
+
+def test_open_breaker_fails_fast(stub):
+    """Test that pay_late_fees fails fast without calling a degraded gateway."""
+    stub.error_rate = 1.0
+    gateway = _resilient(stub, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            gateway.process_payment("123456", 2.5)
+    requests_before = stub.stats["requests"]
+
+    success, message, transaction_id = pay_late_fees("123456", 4, gateway)
+    assert not success
+    assert message.startswith("Payment processing error: Payment gateway unavailable")
+    assert stub.stats["requests"] == requests_before
+    assert gateway.metrics()["breaker"]["state"] == "open"
+    assert gateway.metrics()["breaker"]["rejected"] == 1
+
+def test_worker_requeues_job_while_breaker_is_open():
+    """Test that queued jobs wait for the breaker instead of failing."""
+    gateway = ResilientPaymentGateway(FakePaymentGateway(), breaker=CircuitBreaker(failure_threshold=1))
+    gateway.breaker.record_failure()
+    job_id = enqueue_payment("charge", 2.5, "123456", 4, "Late fees")
+
+    assert not PaymentWorkerPool(gateway, workers=1, poll_interval=0.01).run_once()
+    job = get_payment(job_id)
+    assert job["status"] == "queued"
+    assert job["attempts"] == 0
+
+def test_gateway_metrics_api():
+    """Test that breaker state and latency histograms are served by the API."""
+    metrics = create_app().test_client().get("/api/payments/gateway").get_json()
+    assert metrics["breaker"]["state"] == "closed"
+    assert set(metrics["latency"]) == {"process_payment", "refund_payment", "verify_payment_status"}
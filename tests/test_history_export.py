@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+import tracemalloc
+from datetime import datetime, timedelta
+import pytest
+from database import get_db_connection
+from services.history_export import iter_history_export, write_history_export
+from app import create_app
+import manage
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+def _add_loans(count, patron_id="500001", start=NOW - timedelta(days=400)):
+    """Insert count returned loans one hour apart; every third one returned late."""
+    rows = []
+    for n in range(count):
+        borrowed = start + timedelta(hours=n)
+        due = borrowed + timedelta(days=14)
+        returned = due + timedelta(days=2) if n % 3 == 0 else due - timedelta(days=1)
+        rows.append((patron_id, 1, borrowed.isoformat(), due.isoformat(), returned.isoformat()))
+    conn = get_db_connection()
+    conn.executemany(
+        "INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+def test_csv_export_streams_every_record_in_chunks():
+    """Test that the CSV export yields a header and one chunk per chunk_size records."""
+    _add_loans(25)
+    chunks = list(iter_history_export("csv", patron_id="500001", as_of=NOW, chunk_size=10))
+    assert len(chunks) == 3
+    rows = list(csv.DictReader(io.StringIO("".join(chunks))))
+    assert len(rows) == 25
+    assert [row["borrow_date"] for row in rows] == sorted(row["borrow_date"] for row in rows)
+    assert rows[0]["days_overdue"] == "2"
+    assert rows[0]["fee_amount"] == "1.0"
+
+def test_filters_narrow_the_export():
+    """Test the patron, date range and overdue-only filters."""
+    _add_loans(30)
+    start = NOW - timedelta(days=400)
+
+    def count(**filters):
+        out = io.StringIO()
+        filters.setdefault("as_of", NOW)
+        return write_history_export(out, "jsonl", **filters)["rows"]
+
+    assert count(patron_id="500001") == 30
+    assert count(patron_id="500001", overdue_only=True) == 10
+    assert count(start=start + timedelta(hours=10), end=start + timedelta(hours=20)) == 10
+    # Sample data: one open loan past its due date
+    assert count(patron_id="123456", overdue_only=True, as_of=datetime.now()) == 1
+
+def test_jsonl_and_columnar_formats_agree():
+    """Test that columnar row groups hold the same values as JSON Lines records."""
+    _add_loans(7)
+    records = [json.loads(line) for line in "".join(iter_history_export("jsonl", patron_id="500001")).splitlines()]
+    groups = [json.loads(line) for line in iter_history_export("columnar", patron_id="500001", chunk_size=5)]
+
+    assert [group["rows"] for group in groups] == [5, 2]
+    assert groups[0]["columns"]["borrow_id"] + groups[1]["columns"]["borrow_id"] == [r["borrow_id"] for r in records]
+
+def test_invalid_filters_raise_before_streaming():
+    """Test that bad options are rejected when the export is created."""
+    with pytest.raises(ValueError):
+        iter_history_export("parquet")
+    with pytest.raises(ValueError):
+        iter_history_export("csv", patron_id="12")
+    with pytest.raises(ValueError):
+        iter_history_export("csv", start=NOW, end=NOW - timedelta(days=1))
+
+def test_memory_does_not_grow_with_table_size():
+    """Test that peak memory while exporting is bounded by the chunk size, not the row count."""
+    def peak(loans):
+        _add_loans(loans, patron_id=f"6{loans:05d}")
+        tracemalloc.start()
+        for _ in iter_history_export("jsonl", patron_id=f"6{loans:05d}", chunk_size=200):
+            pass
+        size = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size
+
+    small, large = peak(1000), peak(10000)
+    assert large < small * 2
+
+def test_export_api_and_cli(tmp_path, capsys):
+    """Test the streaming export endpoint and the export-history command."""
+    _add_loans(5)
+    client = create_app().test_client()
+    response = client.get("/api/history/export?format=jsonl&patron_id=500001")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert "attachment" in response.headers["Content-Disposition"]
+    assert len(response.get_data(as_text=True).splitlines()) == 5
+    assert client.get("/api/history/export?format=xml").status_code == 400
+    assert client.get("/api/history/export?start=yesterday").status_code == 400
+
+    output = tmp_path / "history.csv"
+    assert manage.main(["export-history", "--patron", "500001", "--output", str(output)]) == 0
+    assert '"rows": 5' in capsys.readouterr().out
+    assert len(output.read_text().splitlines()) == 6
@@ -0,0 +1,123 @@
+from datetime import datetime, timedelta
+import database
+from database import borrow_book_atomic, expire_holds, get_active_hold, get_book_by_id, get_hold_queue_length
+from services.library_service import (
+    borrow_book_by_patron, return_book_by_patron, place_hold, cancel_hold, get_hold_status, expire_unclaimed_holds
+)
+from app import create_app
+
+
+def _popular_book():
+    """A one-copy book, out with patron 300000."""
+    database.insert_book("Popular Book", "Popular Author", "8880000000001", 1, 1)
+    book_id = database.get_book_by_isbn("8880000000001")["id"]
+    assert borrow_book_by_patron("300000", book_id)[0]
+    return book_id
+
+def _copies_accounted_for(book_id):
+    conn = database.get_db_connection()
+    try:
+        book = conn.execute('SELECT total_copies, available_copies FROM books WHERE id = ?', (book_id,)).fetchone()
+        loans = conn.execute('SELECT COUNT(*) FROM borrow_records WHERE book_id = ? AND return_date IS NULL',
+                             (book_id,)).fetchone()[0]
+        ready = conn.execute("SELECT COUNT(*) FROM holds WHERE book_id = ? AND status = 'ready'", (book_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    return book['available_copies'] + loans + ready == book['total_copies']
+
+def test_holds_queue_in_order():
+    """Test that holds on an unavailable book queue first come, first served."""
+    book = _popular_book()
+    for n, patron_id in enumerate(("200001", "200002", "200003"), start=1):
+        success, message, hold = place_hold(patron_id, book)
+        assert success and hold["position"] == n
+        assert message == f"Hold placed. You are number {n} in the hold queue."
+    assert get_hold_queue_length(book) == 3
+
+    success, message, hold = place_hold("200002", book)
+    assert success and message.startswith("You already have a hold") and hold["position"] == 2
+    assert place_hold("200004", 2) == (False, "This book is available; borrow it instead.", None)
+    assert place_hold("300000", book) == (False, "You have already borrowed this book.", None)
+    assert place_hold("200004", 999)[1] == "Book not found."
+    assert not place_hold("12345", book)[0]
+
+def test_priority_holds_are_served_first():
+    """Test that a higher priority hold goes ahead of earlier ones."""
+    book = _popular_book()
+    place_hold("200001", book)
+    place_hold("200002", book)
+    assert place_hold("200003", book, priority=1)[2]["position"] == 1
+    assert get_hold_status("200001", book)["position"] == 2
+
+    return_book_by_patron("300000", book)
+    assert get_hold_status("200003", book)["status"] == "ready"
+
+def test_return_sets_copy_aside_for_first_hold():
+    """Test that a returned copy goes to the first hold instead of the shelf."""
+    book = _popular_book()
+    place_hold("200001", book)
+    place_hold("200002", book)
+    assert return_book_by_patron("300000", book)[0]
+
+    assert get_book_by_id(book)["available_copies"] == 0
+    hold = get_hold_status("200001", book)
+    assert hold["status"] == "ready" and hold["position"] is None
+    assert hold["message"].startswith("A copy is being held for you until")
+    assert get_hold_status("200002", book)["position"] == 1
+
+    assert borrow_book_by_patron("200002", book) == (False, "This book is currently not available.")
+    assert borrow_book_by_patron("200001", book)[0]
+    assert get_hold_status("200001", book) is None
+    assert _copies_accounted_for(book)
+
+def test_unclaimed_hold_expires_to_next_patron_then_shelf():
+    """Test that expired holds pass the copy down the queue and finally back on the shelf."""
+    book = _popular_book()
+    place_hold("200001", book)
+    place_hold("200002", book)
+    return_book_by_patron("300000", book)
+    later = datetime.now() + timedelta(days=database.HOLD_PICKUP_DAYS, minutes=1)
+
+    assert expire_holds(later) == [book]
+    assert get_active_hold("200001", book) is None
+    assert get_active_hold("200002", book)["status"] == "ready"
+
+    much_later = later + timedelta(days=database.HOLD_PICKUP_DAYS, minutes=1)
+    assert borrow_book_atomic("200003", book, much_later, much_later + timedelta(days=14), 5) == "borrowed"
+    assert get_active_hold("200002", book) is None
+    assert _copies_accounted_for(book)
+    assert expire_unclaimed_holds() == 0
+
+def test_cancelling_a_ready_hold_passes_the_copy_on():
+    """Test that cancelling a ready hold gives the copy to the next hold."""
+    book = _popular_book()
+    place_hold("200001", book)
+    place_hold("200002", book)
+    return_book_by_patron("300000", book)
+
+    assert cancel_hold("200001", book) == (True, "Hold cancelled.")
+    assert get_hold_status("200002", book)["status"] == "ready"
+    assert cancel_hold("200001", book) == (False, "No active hold on this book.")
+    assert cancel_hold("200002", book)[0]
+    assert get_book_by_id(book)["available_copies"] == 1
+    assert _copies_accounted_for(book)
+
+def test_cancel_hold_validates_book_id():
+    """Test that cancel_hold rejects a book id that is not a positive integer, like place_hold."""
+    message = "Invalid book ID. Must be a positive integer."
+    for book_id in (0, -1, "3", None):
+        assert cancel_hold("200001", book_id) == (False, message)
+    assert place_hold("200001", 0) == (False, message, None)
+
+def test_hold_routes():
+    """Test placing, reading and cancelling a hold through the JSON API."""
+    book = _popular_book()
+    client = create_app().test_client()
+    response = client.post("/api/holds", json={"patron_id": "200001", "book_id": book})
+    assert response.status_code == 200 and response.get_json()["hold"]["position"] == 1
+    assert client.post("/api/holds", json={"patron_id": "200001", "book_id": 2}).status_code == 400
+    assert client.post("/api/holds", json={"patron_id": "200001", "book_id": str(book)}).status_code == 400
+
+    assert client.get(f"/api/holds/200001/{book}").get_json()["status"] == "waiting"
+    assert client.delete(f"/api/holds/200001/{book}").status_code == 200
+    assert client.get(f"/api/holds/200001/{book}").status_code == 404
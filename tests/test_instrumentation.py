@@ -0,0 +1,135 @@
+import logging
+import re
+import time
+import instrumentation
+from instrumentation import (
+    MetricsRegistry, SamplingProfiler, finish_trace, recent_traces, registry, start_trace, timed
+)
+import database
+from database import get_book_by_id, get_db_connection, get_pool_metrics, read_connection
+from services.library_service import borrow_book_by_patron
+from app import create_app
+
+
+def test_timed_records_nested_spans():
+    """Test that timed works as context manager and decorator and nests spans in the trace."""
+    @timed("outer")
+    def outer():
+        with timed("inner"):
+            time.sleep(0.001)
+
+    trace = start_trace("job")
+    outer()
+    finish_trace()
+    assert [(name, depth) for name, depth, _, _ in trace.spans] == [("inner", 1), ("outer", 0)]
+    assert registry.histogram("library_function_seconds", (("function", "outer"),))["count"] >= 1
+
+def test_timed_generator_nests_only_its_own_work():
+    """Test that a timed generator's span is not the parent of spans its consumer records between yields."""
+    @timed("rows")
+    def rows():
+        with timed("fetch"):
+            pass
+        yield 1
+        yield 2
+
+    trace = start_trace("export")
+    for _ in rows():
+        with timed("write"):
+            pass
+    finish_trace()
+    assert [(name, depth) for name, depth, _, _ in trace.spans] == [("fetch", 1), ("write", 0), ("write", 0), ("rows", 0)]
+    assert trace.depth == 0
+
+    generator = rows()
+    next(generator)
+    generator.close()
+    assert registry.histogram("library_function_seconds", (("function", "rows"),))["count"] == 2
+
+def test_scrape_does_not_open_pools():
+    """Test that rendering /metrics reports only pools that are already open and creates none."""
+    database.close_pools()
+    text = registry.render()
+    assert get_pool_metrics() == {}
+    assert 'pool="read"' not in text
+
+    with read_connection():
+        pass
+    assert 'library_db_pool_connections{pool="read",state="size"}' in registry.render()
+    assert 'pool="write"' not in registry.render()
+
+def test_database_and_service_functions_are_instrumented():
+    """Test that database helpers and service functions record spans and SQL counts."""
+    trace = start_trace("borrow")
+    assert borrow_book_by_patron("123456", 2)[0]
+    finish_trace()
+    names = {name for name, _, _, _ in trace.spans}
+    assert "library_service.borrow_book_by_patron" in names
+    assert "database.borrow_book_atomic" in names
+    assert trace.sql_queries > 0
+    assert get_book_by_id.__wrapped__.__name__ == "get_book_by_id"
+
+def test_slow_queries_are_logged(monkeypatch, caplog):
+    """Test that statements over the slow-query threshold are logged and counted."""
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_SECONDS", 0.0)
+    before = registry.counter_value("library_sql_slow_queries_total", (("operation", "SELECT"),))
+    conn = get_db_connection()
+    with caplog.at_level(logging.WARNING, logger="library.slow_query"):
+        conn.execute("SELECT   COUNT(*)\n FROM books").fetchone()
+    conn.close()
+    assert "SELECT COUNT(*) FROM books" in caplog.text
+    assert registry.counter_value("library_sql_slow_queries_total", (("operation", "SELECT"),)) == before + 1
+
+def test_registry_renders_prometheus_text():
+    """Test counter, histogram and collector output in the exposition format."""
+    metrics = MetricsRegistry()
+    metrics.describe("jobs_total", "Jobs run.")
+    metrics.inc("jobs_total", (("kind", 'say "hi"'),), 2)
+    metrics.observe("job_seconds", 0.02)
+    metrics.register_collector(lambda: [("queue_depth", "gauge", None, [({"queue": "a"}, 3)])])
+    text = metrics.render()
+    assert "# HELP jobs_total Jobs run.\n# TYPE jobs_total counter\n" in text
+    assert 'jobs_total{kind="say \\"hi\\""} 2' in text
+    assert 'job_seconds_bucket{le="0.025"} 1' in text
+    assert "job_seconds_count 1" in text
+    assert 'queue_depth{queue="a"} 3' in text
+
+def test_requests_are_traced_and_exported():
+    """Test Server-Timing headers, recent traces and the /metrics endpoint."""
+    client = create_app().test_client()
+    response = client.get("/api/books?limit=2")
+    assert re.match(r"app;dur=[\d.]+, db;desc=\"\d+ queries\";dur=", response.headers["Server-Timing"])
+    assert "library_service.get_catalog_page" in response.headers["Server-Timing"]
+    assert recent_traces[-1]["name"] == "GET api.list_books_api"
+
+    metrics = client.get("/metrics")
+    assert metrics.content_type.startswith("text/plain; version=0.0.4")
+    text = metrics.get_data(as_text=True)
+    assert 'library_http_requests_total{endpoint="' in text
+    assert "library_sql_queries_total{operation=\"SELECT\"}" in text
+    assert 'library_db_pool_connections{pool="read",state="size"}' in text
+
+    traces = client.get("/metrics/traces?sort=slowest&limit=1").get_json()["traces"]
+    assert len(traces) == 1 and traces[0]["seconds"] > 0
+
+def test_profiling_is_switched_per_request(monkeypatch):
+    """Test that ?profile= only replaces the response when profiling is enabled."""
+    client = create_app().test_client()
+    assert client.get("/api/books?profile=cprofile").is_json
+
+    monkeypatch.setattr(instrumentation, "PROFILING", True)
+    profiled = client.get("/api/books?profile=cprofile")
+    assert profiled.headers["X-Profile"] == "cprofile"
+    assert "Ordered by: cumulative time" in profiled.get_data(as_text=True)
+    sampled = client.get("/api/books?profile=sampling")
+    assert sampled.headers["X-Profile"] == "sampling"
+    assert sampled.mimetype == "text/plain"
+
+def test_sampling_profiler_collapses_stacks():
+    """Test that the sampling profiler reports collapsed stacks of the sampled thread."""
+    profiler = SamplingProfiler(interval=0.001).start()
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+    profiler.stop()
+    assert "test_sampling_profiler_collapses_stacks" in profiler.report()
@@ -0,0 +1,76 @@
+import database
+from database import MIGRATIONS, apply_migrations, get_db_connection, get_schema_version, init_database
+
+
+def test_init_database_applies_all_migrations():
+    """Test that a fresh database is brought to the latest schema version."""
+    assert get_schema_version() == MIGRATIONS[-1][0]
+
+def test_migrations_are_idempotent():
+    """Test that re-running init_database applies nothing new."""
+    init_database()
+    conn = get_db_connection()
+    assert apply_migrations(conn) == []
+    rows = conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0]
+    conn.close()
+
+    assert rows == len(MIGRATIONS)
+
+def test_patron_open_loan_query_uses_index():
+    """Test that the open-loan count for a patron is an index search, not a table scan."""
+    conn = get_db_connection()
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT COUNT(*) FROM borrow_records WHERE patron_id = ? AND return_date IS NULL",
+        ("123456",)
+    ).fetchall()
+    conn.close()
+
+    details = " ".join(row["detail"] for row in plan)
+    assert "idx_borrow_records_patron_open" in details
+    assert "SCAN borrow_records" not in details
+
+def test_failed_migration_is_rolled_back(monkeypatch):
+    """Test that a broken migration leaves the recorded version unchanged."""
+    version = get_schema_version()
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS + [
+        (version + 1, "broken", ["CREATE INDEX idx_ok ON books (author)", "CREATE INDEX broken ON missing_table (x)"]),
+    ])
+    conn = get_db_connection()
+    try:
+        apply_migrations(conn)
+    except Exception:
+        pass
+    index = conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_ok'").fetchone()
+    conn.close()
+
+    assert index is None
+    assert get_schema_version() == version
+
+class _RacingConnection:
+    """Connection that lets another process run the migrations just before it takes the write lock."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.raced = False
+
+    def execute(self, sql, *args):
+        if sql == "BEGIN IMMEDIATE" and not self.raced:
+            self.raced = True
+            other = get_db_connection()
+            apply_migrations(other)
+            other.close()
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+def test_concurrent_startup_applies_each_migration_once(monkeypatch):
+    """Test that a migration applied by another process after the version was read is skipped, not re-run."""
+    version = get_schema_version()
+    monkeypatch.setattr(database, "MIGRATIONS", MIGRATIONS + [
+        (version + 1, "add a column", ["ALTER TABLE books ADD COLUMN shelf TEXT"]),
+    ])
+    conn = _RacingConnection(get_db_connection())
+    assert apply_migrations(conn) == []
+    conn.close()
+    assert get_schema_version() == version + 1
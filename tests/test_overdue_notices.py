@@ -0,0 +1,131 @@
+import io
+import json
+import threading
+from datetime import datetime, timedelta
+import pytest
+import database
+from database import get_notice_failures, get_notice_run, insert_book, insert_borrow_record, iter_overdue_loans_by_patron
+from services import overdue_notices
+from services.overdue_notices import (
+    FileNoticeSender, NoticeSender, RateLimiter, StubSmtpSender, run_overdue_notices
+)
+import manage
+
+NOW = datetime(2025, 6, 1, 12, 0, 0)
+
+
+class Crash(BaseException):
+    """Stands in for the process dying mid-run."""
+
+class RecordingSender(NoticeSender):
+    """Records notices; raises for patrons in fail, and crashes on the crash_on patron."""
+
+    def __init__(self, fail=(), crash_on=None):
+        self.fail = set(fail)
+        self.crash_on = crash_on
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send(self, notice):
+        if notice["patron_id"] == self.crash_on:
+            self.crash_on = None
+            raise Crash()
+        if notice["patron_id"] in self.fail:
+            raise ConnectionError("mailbox unavailable")
+        with self.lock:
+            self.sent.append(notice["patron_id"])
+
+def _overdue_loans(patrons, loans_each=2):
+    insert_book("Notice Book", "Notice Author", "7770000000001", 1000, 1000)
+    book_id = database.get_book_by_isbn("7770000000001")["id"]
+    for n in range(patrons):
+        for days in range(loans_each):
+            due = NOW - timedelta(days=days + 1)
+            insert_borrow_record(f"5{n:05d}", book_id, due - timedelta(days=14), due)
+    # Not yet due as of NOW
+    insert_borrow_record("599999", book_id, NOW, NOW + timedelta(days=14))
+
+def test_overdue_loans_are_grouped_by_patron():
+    """Test that overdue loans stream in patron order, grouped, and resume after a patron."""
+    _overdue_loans(3)
+    groups = list(iter_overdue_loans_by_patron(NOW, batch_size=1))
+    assert [patron for patron, _ in groups] == ["500000", "500001", "500002"]
+    loans = groups[0][1]
+    assert [loan["days_overdue"] for loan in loans] == [2, 1]
+    assert loans[0]["title"] == "Notice Book" and loans[0]["fee_amount"] == 1.0
+    assert [patron for patron, _ in iter_overdue_loans_by_patron(NOW, after_patron_id="500000")] == ["500001", "500002"]
+
+def test_run_sends_one_notice_per_patron_to_file():
+    """Test a complete run with the file sink: one JSON line per patron and the run totals."""
+    _overdue_loans(25)
+    stream = io.StringIO()
+    summary = run_overdue_notices(FileNoticeSender(stream), NOW, workers=4, rate=0, checkpoint_every=7)
+
+    notices = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert sorted(notice["patron_id"] for notice in notices) == [f"5{n:05d}" for n in range(25)]
+    assert notices[0]["total_fees"] == 1.5 and len(notices[0]["loans"]) == 2
+    assert (summary["patrons"], summary["loans"], summary["failures"], summary["resumed"]) == (25, 50, 0, False)
+    run = get_notice_run(summary["run_id"])
+    assert run["status"] == "completed" and run["last_patron_id"] == "500024"
+
+def test_failed_notices_are_retried_then_recorded(monkeypatch):
+    """Test that a failing notice is retried, then recorded without stopping the run."""
+    monkeypatch.setattr(overdue_notices, "NOTICE_RETRY_BACKOFF", 0)
+    _overdue_loans(5)
+    sender = RecordingSender(fail={"500002"})
+    summary = run_overdue_notices(sender, NOW, workers=2, rate=0)
+
+    assert summary["patrons"] == 4 and summary["failures"] == 1
+    assert get_notice_failures(summary["run_id"]) == [
+        {"patron_id": "500002", "loans": 2, "error": "mailbox unavailable"}
+    ]
+
+def test_interrupted_run_resumes_from_checkpoint():
+    """Test that a crashed run resumes after its checkpoint with the same as_of."""
+    _overdue_loans(10)
+    sender = RecordingSender(crash_on="500004")
+    with pytest.raises(Crash):
+        run_overdue_notices(sender, NOW, workers=1, rate=0, checkpoint_every=1)
+    assert get_notice_run(1)["last_patron_id"] == "500003"
+    assert database.start_notice_run(NOW) == (None, False)  # the crashed run is within its lease
+
+    first_pass = list(sender.sent)
+    assert first_pass[:4] == ["500000", "500001", "500002", "500003"]
+    summary = run_overdue_notices(sender, datetime.now(), workers=1, rate=0, lease=0)
+    assert summary["resumed"] and summary["as_of"] == NOW.isoformat()
+    assert summary["patrons"] == 10
+    # Nothing before the checkpoint is sent twice
+    assert sorted(sender.sent[len(first_pass):]) == [f"5{n:05d}" for n in range(4, 10)]
+
+def test_restart_abandons_interrupted_run():
+    """Test that resume=False starts over and marks the old run abandoned."""
+    _overdue_loans(3)
+    with pytest.raises(Crash):
+        run_overdue_notices(RecordingSender(crash_on="500001"), NOW, workers=1, rate=0)
+    crashed = get_notice_run(1)
+    summary = run_overdue_notices(RecordingSender(), NOW, workers=1, rate=0, resume=False, lease=0)
+    assert summary["run_id"] != crashed["id"] and summary["patrons"] == 3
+    assert get_notice_run(crashed["id"])["status"] == "abandoned"
+
+def test_rate_limiter_spaces_out_notices():
+    """Test that the token bucket holds sends to the configured rate after the burst."""
+    limiter = RateLimiter(rate=50, burst=1)
+    began = datetime.now()
+    for _ in range(6):
+        limiter.acquire()
+    assert (datetime.now() - began).total_seconds() >= 0.09
+
+def test_smtp_stub_formats_emails_and_manage_command(tmp_path):
+    """Test the SMTP stub messages and the send-overdue-notices command."""
+    _overdue_loans(2)
+    sender = StubSmtpSender()
+    run_overdue_notices(sender, NOW, workers=1, rate=0)
+    message = sender.outbox[0]
+    assert message["To"] == "500000@" + overdue_notices.NOTICE_EMAIL_DOMAIN
+    assert "2 item(s), $1.50" in message["Subject"]
+    assert "Notice Book: due 2025-05-31" in message.get_payload(decode=True).decode()
+
+    output = tmp_path / "notices.jsonl"
+    assert manage.main(["--database", database.DATABASE, "send-overdue-notices", "--output", str(output),
+                        "--as-of", NOW.isoformat(), "--rate", "0"]) == 0
+    assert len(output.read_text().splitlines()) == 2
@@ -0,0 +1,124 @@
+import sqlite3
+from datetime import datetime, timedelta
+import database
+from database import get_borrow_record, insert_borrow_record
+from services.library_service import borrow_book_by_patron, get_patron_status_report, pay_late_fees
+from services.payment_service import FakePaymentGateway
+from app import create_app
+
+
+def _add_history(patron_id, loans):
+    """Insert returned loans, oldest first, one day apart."""
+    start = datetime.now() - timedelta(days=loans + 30)
+    for n in range(loans):
+        borrowed = start + timedelta(days=n)
+        insert_borrow_record(patron_id, 1 + n % 2, borrowed, borrowed + timedelta(days=14))
+        database.update_borrow_record_return_date(patron_id, 1 + n % 2, borrowed + timedelta(days=1))
+
+def _set_due_date(patron_id, book_id, due_date):
+    conn = database.get_db_connection()
+    conn.execute("UPDATE borrow_records SET due_date = ? WHERE patron_id = ? AND book_id = ? AND return_date IS NULL",
+                 (due_date.isoformat(), patron_id, book_id))
+    conn.commit()
+    conn.close()
+
+def test_report_runs_one_query(monkeypatch):
+    """Test that the report issues a single SELECT however many loans the patron has."""
+    _add_history("123456", 10)
+    statements = []
+    connect = sqlite3.connect
+
+    def traced_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database.close_pools()
+    monkeypatch.setattr(database.sqlite3, "connect", traced_connect)
+    report = get_patron_status_report("123456")
+    selects = [s for s in statements if s.lstrip().upper().startswith(("SELECT", "WITH"))]
+    assert len(selects) == 1
+    assert report["history_total"] == 12
+    assert report["borrow_count"] == 2
+
+def test_history_is_paginated_newest_first():
+    """Test that history pages are ordered newest first and link to the next page."""
+    _add_history("111111", 5)
+    first = get_patron_status_report("111111", history_limit=2)
+    assert first["history_total"] == 5
+    assert first["next_history_offset"] == 2
+    dates = [record["borrow_date"] for record in first["borrowing_history"]]
+    assert dates == sorted(dates, reverse=True)
+
+    last = get_patron_status_report("111111", history_limit=2, history_offset=4)
+    assert len(last["borrowing_history"]) == 1
+    assert last["next_history_offset"] is None
+    assert last["borrowing_history"][0]["borrow_date"] < dates[-1]
+
+def test_open_loans_are_reported_beyond_the_history_page():
+    """Test that current loans and fees do not depend on the history page."""
+    _add_history("123456", 5)
+    _set_due_date("123456", 4, datetime.now() - timedelta(days=2, hours=12))
+    report = get_patron_status_report("123456", history_limit=1, history_offset=7)
+    assert report["borrowing_history"] == []
+    assert len(report["currently_borrowed"]) == 2
+    assert report["total_late_fees"] == 1.5
+    assert report["history_total"] == 7
+    assert report["last_activity"] is not None
+
+def test_partial_overdue_day_counts_as_a_whole_day():
+    """Test that open loan fees round a partial late day up, like every other fee."""
+    _set_due_date("123456", 4, datetime.now() - timedelta(days=1, hours=1))
+    report = get_patron_status_report("123456")
+    loan = next(loan for loan in report["currently_borrowed"] if loan["book_id"] == 4)
+    assert loan["days_overdue"] == 2
+    assert loan["late_fee"] == 1.0
+    assert report["total_late_fees"] == 1.0
+
+def test_history_total_survives_an_empty_page():
+    """Test that paging past the end with no open loans still reports the full history."""
+    _add_history("111111", 3)
+    report = get_patron_status_report("111111", history_limit=2, history_offset=10)
+    assert report["borrowing_history"] == []
+    assert report["currently_borrowed"] == []
+    assert report["history_total"] == 3
+    assert report["last_activity"] is not None
+    assert report["next_history_offset"] is None
+
+def test_report_subtracts_paid_fees():
+    """Test that fees already paid for a loan are not owed again."""
+    assert pay_late_fees("123456", 4, FakePaymentGateway())[0]
+    report = get_patron_status_report("123456")
+    assert report["total_late_fees"] == 0
+    assert all(loan["late_fee"] == 0 for loan in report["currently_borrowed"])
+
+def test_invalid_paging_is_rejected():
+    """Test that out-of-range history limits and offsets return an error."""
+    assert "error" in get_patron_status_report("123456", history_limit=0)
+    assert "error" in get_patron_status_report("123456", history_limit=10000)
+    assert "error" in get_patron_status_report("123456", history_offset=-1)
+
+def test_borrow_record_without_book_lists_all_loans():
+    """Test that get_borrow_record with no book id returns every loan of the patron."""
+    assert {record["book_id"] for record in get_borrow_record("123456")} == {3, 4}
+
+def test_status_api_etag():
+    """Test that an unchanged report revalidates with 304 and a borrow changes the ETag."""
+    client = create_app().test_client()
+    response = client.get("/api/patrons/123456/status")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.get_json()["currently_borrowed"][0]["due_date"]
+
+    assert client.get("/api/patrons/123456/status", headers={"If-None-Match": etag}).status_code == 304
+    borrow_book_by_patron("123456", 1)
+    changed = client.get("/api/patrons/123456/status", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+def test_status_api_rejects_bad_input():
+    """Test that the status endpoint validates the patron id and paging parameters."""
+    client = create_app().test_client()
+    assert client.get("/api/patrons/123/status").status_code == 400
+    assert client.get("/api/patrons/123456/status?history_limit=abc").status_code == 400
+    assert client.get("/api/patrons/123456/status?history_offset=-1").status_code == 400
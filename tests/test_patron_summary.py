@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+import database
+from database import (
+    check_patron_summary, complete_payment_job, get_db_connection, get_patron_borrow_count, get_patron_summary,
+    insert_borrow_record, reconcile_patron_summary, reserve_payment, update_borrow_record_return_date
+)
+from services.library_service import borrow_book_by_patron, get_patron_status_report, return_book_by_patron
+import manage
+
+
+def _overdue_sample_loan():
+    conn = get_db_connection()
+    row = conn.execute("SELECT id, due_date FROM borrow_records WHERE patron_id = '123456' AND book_id = 4").fetchone()
+    conn.close()
+    return row["id"], datetime.fromisoformat(row["due_date"])
+
+def test_sample_data_is_summarized():
+    """Test that the sample loans are counted in patron_summary."""
+    summary = get_patron_summary("123456")
+    assert summary["open_loans"] == 2
+    assert summary["overdue_loans"] == 1
+    assert get_patron_borrow_count("123456") == 2
+
+    _, due_date = _overdue_sample_loan()
+    reconcile_patron_summary(due_date + timedelta(days=3))
+    assert get_patron_summary("123456")["outstanding_fees"] == 1.5
+    # A partial day counts as a whole one
+    reconcile_patron_summary(due_date + timedelta(days=3, hours=1))
+    assert get_patron_summary("123456")["outstanding_fees"] == 2.0
+
+def test_outstanding_fees_net_of_payments():
+    """Test that outstanding_fees leaves out what has already been paid for a loan."""
+    borrow_id, due_date = _overdue_sample_loan()
+    payment, _ = reserve_payment("summary-fee", "charge", 1.5, patron_id="123456", book_id=4, borrow_id=borrow_id,
+                                 status="processing")
+    complete_payment_job(payment["id"], True, "txn_summary", "Paid")
+
+    reconcile_patron_summary(due_date + timedelta(days=3, hours=1))
+    assert get_patron_summary("123456")["outstanding_fees"] == 0.5
+
+def test_unknown_patron_has_no_summary():
+    """Test that a patron who never borrowed has no row and a count of zero."""
+    assert get_patron_summary("999999") is None
+    assert get_patron_borrow_count("999999") == 0
+
+def test_borrow_and_return_update_summary():
+    """Test that borrowing and returning keep open_loans and last_activity current."""
+    borrow_book_by_patron("222222", 1)
+    borrow_book_by_patron("222222", 2)
+    summary = get_patron_summary("222222")
+    assert summary["open_loans"] == 2
+    assert summary["last_activity"] is not None
+
+    return_book_by_patron("222222", 1)
+    assert get_patron_summary("222222")["open_loans"] == 1
+    assert get_patron_status_report("222222")["borrow_count"] == 1
+
+def test_legacy_helpers_update_summary():
+    """Test that insert_borrow_record and update_borrow_record_return_date maintain the summary."""
+    now = datetime.now()
+    assert insert_borrow_record("333333", 1, now - timedelta(days=20), now - timedelta(days=6))
+    summary = get_patron_summary("333333")
+    assert summary["open_loans"] == 1
+
+    assert update_borrow_record_return_date("333333", 1, now)
+    summary = get_patron_summary("333333")
+    assert summary["open_loans"] == 0
+    assert summary["last_activity"] == now.isoformat()
+
+def test_limit_check_reads_summary():
+    """Test that the borrowing limit is enforced from patron_summary."""
+    for book_id in (1, 2):
+        borrow_book_by_patron("444444", book_id)
+    conn = get_db_connection()
+    conn.execute("UPDATE patron_summary SET open_loans = 5 WHERE patron_id = '444444'")
+    conn.commit()
+    conn.close()
+
+    success, message = borrow_book_by_patron("444444", 1)
+    assert not success
+    assert "maximum borrowing limit" in message
+
+def test_reconcile_repairs_drift():
+    """Test that drift is reported by the check and fixed by the rebuild."""
+    conn = get_db_connection()
+    conn.execute("UPDATE patron_summary SET open_loans = 0 WHERE patron_id = '123456'")
+    conn.execute("INSERT INTO patron_summary (patron_id, open_loans) VALUES ('555555', 3)")
+    conn.commit()
+    conn.close()
+    assert check_patron_summary()["drifted"] == 2
+
+    report = reconcile_patron_summary()
+    assert report["drifted"] == 2
+    assert check_patron_summary()["drifted"] == 0
+    assert get_patron_summary("123456")["open_loans"] == 2
+    assert get_patron_summary("555555") is None
+
+def test_reconcile_command(capsys):
+    """Test that the management command exits non-zero on drift in check mode and rebuilds otherwise."""
+    assert manage.main(["--database", database.DATABASE, "reconcile-patron-summary", "--check"]) == 0
+    conn = get_db_connection()
+    conn.execute("UPDATE patron_summary SET open_loans = 4 WHERE patron_id = '123456'")
+    conn.commit()
+    conn.close()
+
+    assert manage.main(["--database", database.DATABASE, "reconcile-patron-summary", "--check"]) == 2
+    assert manage.main(["--database", database.DATABASE, "reconcile-patron-summary"]) == 0
+    assert '"rebuilt": 1' in capsys.readouterr().out
+    assert get_patron_borrow_count("123456") == 2
+
+    assert manage.main(["--database", database.DATABASE, "reconcile-patron-summary", "--as-of", "nope"]) == 1
+    assert "Reconcile failed" in capsys.readouterr().err
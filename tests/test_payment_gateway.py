@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from services.library_service import pay_late_fees, refund_late_fee_payment
+from services.payment_service import AsyncPaymentGateway, FakePaymentGateway, HttpPaymentGateway
+from services.payment_stub import StubGatewayServer
+
+
+@pytest.fixture
+def stub():
+    with StubGatewayServer(latency=0.01) as server:
+        yield server
+
+def test_http_gateway_charge_refund_and_status(stub):
+    """Test that the HTTP client maps gateway responses to the PaymentGateway results."""
+    with HttpPaymentGateway(stub.url) as gateway:
+        success, transaction_id, message = gateway.process_payment("123456", 2.5, "Late fees")
+        assert success
+        assert transaction_id.startswith("txn_123456_")
+        assert message == "Payment of $2.50 processed successfully"
+
+        assert gateway.process_payment("123456", 5000) == (False, "", "Payment declined: amount exceeds limit")
+        assert gateway.refund_payment(transaction_id, 2.5)[0] is True
+        assert gateway.refund_payment("bad", 2.5) == (False, "Invalid transaction ID")
+        assert gateway.verify_payment_status(transaction_id)["status"] == "completed"
+        assert gateway.verify_payment_status("bad")["status"] == "not_found"
+
+def test_http_gateway_reuses_connections(stub):
+    """Test that sequential calls share one keep-alive connection."""
+    with HttpPaymentGateway(stub.url) as gateway:
+        for _ in range(10):
+            gateway.process_payment("123456", 1.0)
+    assert stub.stats["requests"] == 10
+    assert stub.stats["connections"] == 1
+
+def test_batch_charges_keep_order_and_limit_connections(stub):
+    """Test that a batch returns results in order over at most max_concurrency connections."""
+    charges = [{"patron_id": "123456", "amount": amount} for amount in (1.0, 2000.0, 3.0, 4.0, 5.0, 6.0)] * 5
+    with HttpPaymentGateway(stub.url, max_concurrency=4) as gateway:
+        results = gateway.process_payments(charges)
+        refunds = gateway.refund_payments([{"transaction_id": results[0][1], "amount": 1.0},
+                                           {"transaction_id": "bad", "amount": 1.0}])
+
+    assert len(results) == 30
+    assert [success for success, _, _ in results[:6]] == [True, False, True, True, True, True]
+    assert results[2][2] == "Payment of $3.00 processed successfully"
+    assert [success for success, _ in refunds] == [True, False]
+    assert stub.stats["connections"] <= 4
+
+def test_batch_reports_connection_errors_per_item():
+    """Test that an unreachable gateway fails each item instead of the whole batch."""
+    with HttpPaymentGateway("http://127.0.0.1:9", timeout=0.5) as gateway:
+        results = gateway.process_payments([{"patron_id": "123456", "amount": 1.0}] * 2)
+    assert all(not success and message.startswith("Gateway error:") for success, _, message in results)
+
+def test_async_gateway(stub):
+    """Test that the asyncio gateway runs calls concurrently and keeps result order."""
+    async def run():
+        async with AsyncPaymentGateway(HttpPaymentGateway(stub.url, max_concurrency=8)) as gateway:
+            single = await gateway.process_payment("123456", 2.5)
+            batch = await gateway.process_payments([{"patron_id": "123456", "amount": float(n)} for n in range(1, 17)])
+            refund = await gateway.refund_payment(single[1], 2.5)
+            return single, batch, refund
+
+    single, batch, refund = asyncio.run(run())
+    assert single[0] is True
+    assert [message for _, _, message in batch][3] == "Payment of $4.00 processed successfully"
+    assert refund[0] is True
+    assert stub.stats["connections"] <= 8
+
+def test_fake_gateway_batches_concurrently():
+    """Test that batch calls overlap the simulated gateway delay."""
+    gateway = FakePaymentGateway(latency=0.05, max_concurrency=10)
+    results = gateway.process_payments([{"patron_id": "123456", "amount": 1.0}] * 10)
+    assert len({transaction_id for _, transaction_id, _ in results}) == 10
+    assert gateway.calls == 10
+
+def test_service_functions_accept_http_gateway(stub):
+    """Test that pay_late_fees and refund_late_fee_payment work through the HTTP client."""
+    with HttpPaymentGateway(stub.url) as gateway:
+        success, message, transaction_id = pay_late_fees("123456", 4, gateway)
+        assert success, message
+        assert refund_late_fee_payment(transaction_id, 1.0, gateway)[0] is True
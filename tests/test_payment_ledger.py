@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import services.payment_queue
+from database import get_db_connection, get_paid_late_fees, get_payment_by_transaction, reserve_payment
+from services.library_service import (
+    get_patron_status_report, pay_late_fees, prepare_late_fee_charge, refund_late_fee_payment
+)
+from services.payment_queue import submit_late_fee_payment
+from services.payment_service import PaymentGateway
+
+
+def _gateway(transaction_id="txn_123456_1"):
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.return_value = (True, transaction_id, "Payment of $2.00 processed successfully")
+    gateway.refund_payment.return_value = (True, "Refund processed successfully")
+    return gateway
+
+def _set_due_date(book_id, due_date):
+    conn = get_db_connection()
+    conn.execute("UPDATE borrow_records SET due_date = ? WHERE patron_id = '123456' AND book_id = ?",
+                 (due_date.isoformat(), book_id))
+    conn.commit()
+    conn.close()
+
+def test_paid_fee_is_not_charged_again():
+    """Test that paying the same loan twice charges the gateway once and then reports nothing owed."""
+    gateway = _gateway()
+    first = pay_late_fees("123456", 4, gateway)
+    second = pay_late_fees("123456", 4, gateway)
+
+    assert first[0] is True
+    assert second == (False, "No late fees owed for this book; they have already been paid.", None)
+    gateway.process_payment.assert_called_once()
+    assert get_payment_by_transaction("txn_123456_1")["status"] == "succeeded"
+
+def test_fees_accrued_after_a_payment_can_be_paid():
+    """Test that a loan that stays overdue after a payment is charged only the fees accrued since."""
+    _set_due_date(4, datetime.now() - timedelta(days=2, hours=12))
+    gateway = _gateway()
+    assert pay_late_fees("123456", 4, gateway)[0] is True
+    assert gateway.process_payment.call_args.kwargs["amount"] == 1.5
+
+    _set_due_date(4, datetime.now() - timedelta(days=12, hours=12))
+    assert get_patron_status_report("123456")["total_late_fees"] == 8.0
+    gateway.process_payment.return_value = (True, "txn_123456_2", "Payment of $8.00 processed successfully")
+    assert pay_late_fees("123456", 4, gateway) == (
+        True, "Payment successful! Payment of $8.00 processed successfully", "txn_123456_2")
+    assert gateway.process_payment.call_args.kwargs["amount"] == 8.0
+
+    assert pay_late_fees("123456", 4, gateway)[0] is False
+    assert gateway.process_payment.call_count == 2
+    assert get_patron_status_report("123456")["total_late_fees"] == 0
+
+def test_failed_payment_can_be_retried():
+    """Test that a declined or errored charge does not block a later attempt."""
+    gateway = _gateway()
+    gateway.process_payment.side_effect = [RuntimeError("gateway down"), (False, "", "Declined"),
+                                           (True, "txn_123456_2", "Payment processed")]
+    assert pay_late_fees("123456", 4, gateway)[0] is False
+    assert pay_late_fees("123456", 4, gateway)[0] is False
+    assert pay_late_fees("123456", 4, gateway) == (True, "Payment successful! Payment processed", "txn_123456_2")
+    assert gateway.process_payment.call_count == 3
+
+def test_payment_in_progress_is_not_charged_again():
+    """Test that a concurrent attempt for the same loan does not reach the gateway."""
+    charge, _ = prepare_late_fee_charge("123456", 4)
+    reserve_payment(charge["idempotency_key"], "charge", charge["amount"], "123456", 4,
+                    charge["borrow_id"], charge["description"], status="processing")
+    gateway = _gateway()
+
+    success, message, transaction_id = pay_late_fees("123456", 4, gateway)
+    assert not success
+    assert "already in progress" in message
+    gateway.process_payment.assert_not_called()
+
+def test_refund_is_limited_to_the_original_charge():
+    """Test that refunds of a recorded payment cannot exceed what was charged."""
+    gateway = _gateway()
+    _, _, transaction_id = pay_late_fees("123456", 4, gateway)
+    amount = get_payment_by_transaction(transaction_id)["amount"]
+
+    assert refund_late_fee_payment(transaction_id, amount + 0.5, gateway) == (
+        False, "Refund amount exceeds the original payment.")
+    gateway.refund_payment.assert_not_called()
+
+    assert refund_late_fee_payment(transaction_id, 0.5, gateway)[0] is True
+    assert get_payment_by_transaction(transaction_id)["refunded_amount"] == 0.5
+    assert refund_late_fee_payment(transaction_id, amount, gateway)[0] is False
+
+def test_failed_refund_releases_reservation():
+    """Test that a refund the gateway rejects is not counted against the charge."""
+    gateway = _gateway()
+    _, _, transaction_id = pay_late_fees("123456", 4, gateway)
+    gateway.refund_payment.return_value = (False, "Gateway unavailable")
+
+    assert refund_late_fee_payment(transaction_id, 0.5, gateway) == (False, "Refund failed: Gateway unavailable")
+    assert get_payment_by_transaction(transaction_id)["refunded_amount"] == 0.0
+
+def test_status_report_subtracts_paid_fees():
+    """Test that paid late fees are no longer reported as owed."""
+    assert get_patron_status_report("123456")["total_late_fees"] > 0
+    _, _, transaction_id = pay_late_fees("123456", 4, _gateway())
+    assert get_patron_status_report("123456")["total_late_fees"] == 0
+
+    refund_late_fee_payment(transaction_id, get_payment_by_transaction(transaction_id)["amount"], _gateway())
+    assert get_patron_status_report("123456")["total_late_fees"] > 0
+
+def test_queued_payment_is_deduplicated(monkeypatch):
+    """Test that queueing the same loan's fee twice returns the first job."""
+    # No workers, so the first job is still queued when the second request arrives
+    monkeypatch.setattr(services.payment_queue, "get_payment_workers", Mock)
+    first = submit_late_fee_payment("123456", 4)
+    second = submit_late_fee_payment("123456", 4)
+    assert first[0] and second[0]
+    assert first[2] == second[2]
+
+def test_paid_fee_lookup_uses_index():
+    """Test that the paid-fee lookup is served by the partial ledger index."""
+    pay_late_fees("123456", 4, _gateway())
+    assert list(get_paid_late_fees("123456").values()) == [get_payment_by_transaction("txn_123456_1")["amount"]]
+
+    conn = get_db_connection()
+    plan = " ".join(row[3] for row in conn.execute("""
+        EXPLAIN QUERY PLAN
+        SELECT borrow_id, SUM(amount - refunded_amount) FROM payments
+        WHERE patron_id = ? AND kind = 'charge' AND status = 'succeeded' AND borrow_id IS NOT NULL
+        GROUP BY borrow_id
+    """, ("123456",)))
+    conn.close()
+    assert "idx_payments_patron_paid" in plan
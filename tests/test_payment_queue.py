@@ -0,0 +1,142 @@
+import json
+import time
+import pytest
+from unittest.mock import Mock
+import database
+from database import claim_payment_jobs, enqueue_payment, get_payment_queue_counts, reserve_payment
+from services.library_service import UNRECONCILED_PAYMENT_MESSAGE, pay_late_fees, prepare_late_fee_charge
+from services.payment_queue import (
+    PaymentWorkerPool, get_payment_job, resolve_unknown_payment, submit_late_fee_payment, submit_refund
+)
+from services.payment_service import FakePaymentGateway, PaymentGateway
+from app import create_app
+import manage
+
+
+@pytest.fixture(autouse=True)
+def fake_gateway(monkeypatch):
+    monkeypatch.setenv("LIBRARY_PAYMENT_GATEWAY", "fake")
+
+def _wait_for(job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = get_payment_job(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"payment job {job_id} did not finish")
+
+def test_submit_returns_job_and_worker_completes_it():
+    """Test that a queued late fee payment is charged in the background."""
+    success, message, job_id = submit_late_fee_payment("123456", 4)
+    assert success
+    assert "queued" in message
+
+    job = _wait_for(job_id)
+    assert job["status"] == "succeeded"
+    assert job["transaction_id"].startswith("txn_123456_")
+    assert "Payment successful!" in job["message"]
+
+def test_submit_rejects_invalid_payment_without_queueing():
+    """Test that validation errors are returned directly and nothing is queued."""
+    assert submit_late_fee_payment("12345", 4) == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    assert submit_late_fee_payment("123456", 1)[0] is False
+    assert submit_refund("bad", 5.0) == (False, "Invalid transaction ID.", None)
+    assert sum(get_payment_queue_counts().values()) == 0
+
+def test_refund_job():
+    """Test that a queued refund reports the gateway's refund message."""
+    success, _, job_id = submit_refund("txn_123456_1", 3.5)
+    assert success
+
+    job = _wait_for(job_id)
+    assert job["status"] == "succeeded"
+    assert "Refund of $3.50 processed successfully" in job["message"]
+
+def test_workers_process_each_job_once():
+    """Test that concurrent workers never claim the same job twice."""
+    job_ids = [enqueue_payment("charge", 2.5, "123456", 4, "Late fees") for _ in range(60)]
+    gateway = FakePaymentGateway(latency=0.001)
+    workers = PaymentWorkerPool(gateway, workers=8)
+    workers.start(drain=True)
+    workers.join(10)
+
+    assert gateway.calls == 60
+    assert workers.processed == 60
+    assert all(get_payment_job(job_id)["status"] == "succeeded" for job_id in job_ids)
+    assert len({get_payment_job(job_id)["transaction_id"] for job_id in job_ids}) == 60
+
+def test_gateway_error_fails_job():
+    """Test that a gateway exception is recorded as a failed job."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.process_payment.side_effect = Exception("Network error")
+    job_id = enqueue_payment("charge", 2.5, "123456", 4, "Late fees")
+
+    assert PaymentWorkerPool(gateway, workers=1).run_once()
+    job = get_payment_job(job_id)
+    assert job["status"] == "failed"
+    assert job["message"] == "Payment processing error: Network error"
+    assert job["transaction_id"] is None
+
+def test_abandoned_job_is_held_for_reconciliation():
+    """Test that a job left processing past its lease is marked unknown instead of being charged again."""
+    job_id = enqueue_payment("charge", 2.5, "123456", 4, "Late fees")
+    assert [job["id"] for job in claim_payment_jobs(1, lease=60)] == [job_id]
+    assert claim_payment_jobs(1, lease=60) == []
+
+    time.sleep(0.01)
+    assert claim_payment_jobs(1, lease=0.001) == []
+    job = get_payment_job(job_id)
+    assert job["status"] == "unknown" and job["attempts"] == 1
+
+def test_synchronous_payment_is_not_claimed_by_workers():
+    """Test that a charge reserved by pay_late_fees never reaches the queue, even past its lease."""
+    charge, _ = prepare_late_fee_charge("123456", 4)
+    payment, _ = reserve_payment(charge["idempotency_key"], "charge", charge["amount"], "123456", 4,
+                                 charge["borrow_id"], charge["description"], status="processing")
+    gateway = Mock(spec=PaymentGateway)
+
+    time.sleep(0.01)
+    assert not PaymentWorkerPool(gateway, workers=1, lease=0.001).run_once()
+    assert get_payment_job(payment["id"])["status"] == "unknown"
+    assert pay_late_fees("123456", 4, gateway) == (False, UNRECONCILED_PAYMENT_MESSAGE, None)
+    assert submit_late_fee_payment("123456", 4) == (False, UNRECONCILED_PAYMENT_MESSAGE, payment["id"])
+    gateway.process_payment.assert_not_called()
+
+def test_unknown_payment_is_reconciled_with_the_gateway(capsys):
+    """Test that an unknown charge is only recorded as paid once the gateway confirms its transaction."""
+    job_id = enqueue_payment("charge", 2.5, "123456", 4, "Late fees")
+    claim_payment_jobs(1)
+    time.sleep(0.01)
+    claim_payment_jobs(1, lease=0.001)
+    gateway = Mock(spec=PaymentGateway)
+    gateway.verify_payment_status.return_value = {"status": "not_found"}
+
+    assert manage.main(["--database", database.DATABASE, "reconcile-payments"]) == 2
+    assert json.loads(capsys.readouterr().out)["unknown"][0]["id"] == job_id
+    assert resolve_unknown_payment(job_id, True) == (False, "The gateway transaction id is required to record a charge.")
+    assert not resolve_unknown_payment(job_id, True, "txn_123456_9", gateway)[0]
+    gateway.verify_payment_status.return_value = {"status": "completed"}
+    assert resolve_unknown_payment(job_id, True, "txn_123456_9", gateway) == (True, "Payment reconciled as charged.")
+    gateway.verify_payment_status.assert_called_with("txn_123456_9")
+
+    job = get_payment_job(job_id)
+    assert (job["status"], job["transaction_id"]) == ("succeeded", "txn_123456_9")
+    assert resolve_unknown_payment(job_id, False)[0] is False
+    assert manage.main(["--database", database.DATABASE, "reconcile-payments"]) == 0
+
+def test_payment_api():
+    """Test that the API queues a payment with 202 and reports its status."""
+    client = create_app().test_client()
+    response = client.post("/api/payments", json={"patron_id": "123456", "book_id": 4})
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+
+    _wait_for(job_id)
+    status = client.get(f"/api/payments/{job_id}").get_json()
+    assert status["status"] == "succeeded"
+    assert status["transaction_id"]
+
+    assert client.post("/api/payments", json={"patron_id": "123456", "book_id": "4"}).status_code == 400
+    assert client.post("/api/payments", json={"patron_id": "123456", "book_id": 1}).status_code == 400
+    assert client.get("/api/payments/9999").status_code == 404
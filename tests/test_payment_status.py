@@ -0,0 +1,139 @@
+import threading
+import time
+import pytest
+from unittest.mock import Mock
+from services.library_service import refund_late_fee_payment
+from services.payment_service import FakePaymentGateway, PaymentGateway
+from services.payment_status import PaymentStatusCache, payment_status_cache
+from app import create_app
+
+
+class GatedGateway(FakePaymentGateway):
+    """Fake gateway whose status checks block until released."""
+
+    def __init__(self, statuses=None):
+        super().__init__()
+        self.release = threading.Event()
+        self.statuses = statuses or {}
+
+    def verify_payment_status(self, transaction_id):
+        self.release.wait(5)
+        result = super().verify_payment_status(transaction_id)
+        result["status"] = self.statuses.get(transaction_id, result["status"])
+        return result
+
+def test_settled_status_is_cached():
+    """Test that a completed transaction is looked up once within the settled TTL."""
+    gateway = FakePaymentGateway()
+    cache = PaymentStatusCache(gateway, pending_ttl=0.01)
+    first = cache.verify("txn_123456_1")
+    time.sleep(0.02)
+    assert cache.verify("txn_123456_1") == first
+    assert gateway.calls == 1
+
+def test_refund_elsewhere_is_seen_after_settled_ttl():
+    """Test that a completed status expires, so a refund made by another process shows up; final statuses do not."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.verify_payment_status.side_effect = [{"status": "completed"}, {"status": "refunded"}]
+    cache = PaymentStatusCache(gateway, pending_ttl=0.01, settled_ttl=0.05)
+
+    assert cache.verify("txn_1")["status"] == "completed"
+    assert cache.verify("txn_1")["status"] == "completed"
+    time.sleep(0.06)
+    assert cache.verify("txn_1")["status"] == "refunded"
+    time.sleep(0.06)
+    assert cache.verify("txn_1")["status"] == "refunded"
+    assert gateway.verify_payment_status.call_count == 2
+
+def test_pending_status_expires():
+    """Test that non-terminal statuses are refreshed after the pending TTL."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.verify_payment_status.side_effect = [{"status": "pending"}, {"status": "completed"}]
+    cache = PaymentStatusCache(gateway, pending_ttl=0.05)
+
+    assert cache.verify("txn_1")["status"] == "pending"
+    assert cache.verify("txn_1")["status"] == "pending"
+    time.sleep(0.06)
+    assert cache.verify("txn_1")["status"] == "completed"
+    assert gateway.verify_payment_status.call_count == 2
+
+def test_concurrent_lookups_share_one_call():
+    """Test that simultaneous lookups of one transaction make a single gateway call."""
+    gateway = GatedGateway()
+    cache = PaymentStatusCache(gateway)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.verify("txn_123456_1"))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    gateway.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert gateway.calls == 1
+    assert len(results) == 10
+    assert cache.stats()["coalesced"] == 9
+
+def test_errors_are_shared_and_not_cached():
+    """Test that a failed lookup is raised to every waiter and retried next time."""
+    gateway = Mock(spec=PaymentGateway)
+    gateway.verify_payment_status.side_effect = [RuntimeError("gateway down"), {"status": "completed"}]
+    cache = PaymentStatusCache(gateway)
+    with pytest.raises(RuntimeError):
+        cache.verify("txn_1")
+    assert cache.verify("txn_1")["status"] == "completed"
+
+def test_clear_drops_lookups_in_flight():
+    """Test that a lookup started before clear() does not put its status back in the cache."""
+    gateway = GatedGateway()
+    cache = PaymentStatusCache(gateway)
+    thread = threading.Thread(target=cache.verify, args=("txn_123456_1",))
+    thread.start()
+    time.sleep(0.05)
+    cache.clear()
+    gateway.release.set()
+    thread.join()
+
+    assert cache.stats()["cache"]["size"] == 0
+    cache.verify("txn_123456_1")
+    assert gateway.calls == 2
+
+def test_verify_many_dedupes_and_keeps_order():
+    """Test that verify_many looks up each missing id once and returns them in request order."""
+    gateway = FakePaymentGateway(latency=0.02)
+    cache = PaymentStatusCache(gateway)
+    cache.verify("txn_3")
+    ids = ["txn_1", "txn_2", "txn_1", "bad", "txn_3"]
+    results = cache.verify_many(ids)
+
+    assert list(results) == ["txn_1", "txn_2", "bad", "txn_3"]
+    assert results["bad"]["status"] == "not_found"
+    assert gateway.calls == 4
+
+def test_verify_many_reports_failed_lookups():
+    """Test that one failing lookup does not fail the batch."""
+    gateway = Mock(spec=PaymentGateway, max_concurrency=4)
+    gateway.verify_payment_status.side_effect = lambda t: {"status": "completed"} if t != "txn_2" else 1 / 0
+    results = PaymentStatusCache(gateway).verify_many(["txn_1", "txn_2"])
+    assert results["txn_1"]["status"] == "completed"
+    assert results["txn_2"]["status"] == "error"
+
+def test_refund_invalidates_cached_status():
+    """Test that refunding a transaction drops its cached status."""
+    payment_status_cache.cache.put("txn_123456_1", {"status": "completed"}, ttl=float("inf"))
+    gateway = Mock(spec=PaymentGateway)
+    gateway.refund_payment.return_value = (True, "Refund processed")
+    assert refund_late_fee_payment("txn_123456_1", 1.0, gateway)[0]
+    assert payment_status_cache.cache.get("txn_123456_1") is None
+
+def test_status_api(monkeypatch):
+    """Test the single and batch status endpoints."""
+    monkeypatch.setenv("LIBRARY_PAYMENT_GATEWAY", "fake")
+    client = create_app().test_client()
+    assert client.get("/api/payments/status/txn_123456_1").get_json()["status"] == "completed"
+    assert client.get("/api/payments/status/bad").status_code == 404
+
+    response = client.post("/api/payments/status", json={"transaction_ids": ["txn_123456_1", "txn_123456_2"]})
+    assert set(response.get_json()["results"]) == {"txn_123456_1", "txn_123456_2"}
+    assert client.post("/api/payments/status", json={"transaction_ids": []}).status_code == 400
+    assert client.get("/api/payments/status-cache").get_json()["gateway_calls"] == 3
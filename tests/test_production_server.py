@@ -0,0 +1,68 @@
+import os
+import runpy
+import sqlite3
+import database
+import manage
+from database import get_pool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_gunicorn_config_preloads_and_scales_with_cores(monkeypatch):
+    """Test that the gunicorn config preloads the app and sizes workers from the core count."""
+    monkeypatch.delenv("LIBRARY_WORKERS", raising=False)
+    monkeypatch.setattr("multiprocessing.cpu_count", lambda: 3)
+    config = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+    assert config["preload_app"] is True
+    assert config["workers"] == 7
+    assert config["max_requests_jitter"] == config["max_requests"] // 10
+
+    monkeypatch.setenv("LIBRARY_WORKERS", "2")
+    monkeypatch.setenv("LIBRARY_ACCESS_LOG", "")
+    config = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+    assert config["workers"] == 2
+    assert config["accesslog"] is None
+
+def test_gunicorn_hooks_drop_inherited_connections():
+    """Test that the post_fork hook closes pooled connections inherited from the master."""
+    config = runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))
+    pool = get_pool(readonly=True)
+    with pool.connection():
+        pass
+    assert pool.metrics()["idle"] == 1
+    config["post_fork"](None, None)
+    assert get_pool(readonly=True) is not pool
+
+def test_wsgi_bootstraps_once_without_sample_data(tmp_path, monkeypatch):
+    """Test that wsgi.py creates the schema, skips sample data and leaves no open connections."""
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "production.db"))
+    monkeypatch.delenv("LIBRARY_SAMPLE_DATA", raising=False)
+    module = runpy.run_path(os.path.join(ROOT, "wsgi.py"))
+    assert database._pools == {}
+
+    response = module["app"].test_client().get("/api/books")
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 0
+
+def test_create_app_can_skip_bootstrap(tmp_path, monkeypatch):
+    """Test that create_app(bootstrap=False) does not touch the database."""
+    from app import create_app
+    path = tmp_path / "untouched.db"
+    monkeypatch.setattr(database, "DATABASE", str(path))
+    create_app(bootstrap=False)
+    assert not path.exists()
+
+def test_manage_init_db(tmp_path):
+    """Test the one-time init-db command, with and without sample data."""
+    path = tmp_path / "managed.db"
+    def count_books():
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM books").fetchone()[0]
+        finally:
+            conn.close()
+
+    assert manage.main(["--database", str(path), "init-db"]) == 0
+    assert count_books() == 0
+    assert manage.main(["--database", str(path), "init-db", "--sample-data"]) == 0
+    assert count_books() == 4
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import app
+import database
+from app import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_startup_defers_payment_client_imports(tmp_path):
+    """Test that create_app and a catalog request load neither requests nor asyncio."""
+    script = (
+        "import sys, database\n"
+        f"database.DATABASE = {str(tmp_path / 'cold.db')!r}\n"
+        "from app import create_app\n"
+        "create_app().test_client().get('/api/books')\n"
+        "print(','.join(m for m in ('requests', 'asyncio') if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+def test_startup_phases_and_time_to_first_request():
+    """Test that /metrics/startup reports each phase and the time to the first response."""
+    client = create_app(catalog_index=True).test_client()
+    assert client.get("/metrics/startup").get_json()["time_to_first_request"] is None
+    client.get("/api/books")
+    report = client.get("/metrics/startup").get_json()
+    assert set(report["phases"]) == {"init_database", "sample_data", "catalog_index", "routes"}
+    assert 0 < report["time_to_first_request"]
+    assert report["total"] <= report["time_to_first_request"]
+
+    metrics = client.get("/metrics").get_data(as_text=True)
+    assert 'library_startup_phase_seconds{phase="routes"}' in metrics
+    assert "library_time_to_first_request_seconds" in metrics
+
+def test_skip_bootstrap_setting(tmp_path, monkeypatch):
+    """Test that LIBRARY_SKIP_BOOTSTRAP leaves the database alone unless bootstrap=True."""
+    path = tmp_path / "prepared.db"
+    monkeypatch.setattr(database, "DATABASE", str(path))
+    monkeypatch.setattr(app, "SKIP_BOOTSTRAP", True)
+    create_app()
+    assert not path.exists()
+
+    create_app(bootstrap=True)
+    database.close_pools()
+    assert path.exists()
@@ -0,0 +1,24 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app (set in gunicorn.conf.py) this module is imported once, in
+the master process: the schema is created or migrated a single time and
+workers are forked with the app already loaded, instead of each worker
+running the bootstrap on startup.
+"""
+
+import os
+import database
+from app import create_app
+
+# One-time database setup, kept out of the per-worker startup path
+database.init_database()
+if os.environ.get('LIBRARY_SAMPLE_DATA', '0').lower() in ('1', 'true', 'yes'):
+    database.add_sample_data()
+
+app = create_app(bootstrap=False)
+
+# SQLite connections must not cross a fork; workers open their own
+database.close_pools()